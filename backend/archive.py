@@ -0,0 +1,52 @@
+"""
+Archive-tier maintenance (see core.archive):
+
+    python archive.py                     # archive leftover uploads, apply retention, trim the cache
+    python archive.py --workers 4
+    python archive.py --retention-days 365
+
+Uploads normally move to the archive right after their attempt is scored;
+this picks up attempts stored before that existed or whose archiving failed.
+Safe to re-run and to run while the API is up.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from core import models, database, archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive stored attempts and apply the retention policy")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="encoding processes to run")
+    parser.add_argument("--retention-days", type=int, default=archive.ARCHIVE_RETENTION_DAYS,
+                        help="delete recordings older than this (0 = keep forever)")
+    parser.add_argument("--skip-archive", action="store_true", help="only apply retention and trim the cache")
+    args = parser.parse_args()
+
+    if config.DB_MIGRATE_ON_STARTUP:
+        models.sync_schema(database.engine)
+
+    db = database.SessionLocal()
+    try:
+        removed = archive.enforce_retention(db, args.retention_days)
+        if removed:
+            print(f"🗑️ Recordings of {removed} attempts older than {args.retention_days} days deleted")
+        pending = [] if args.skip_archive else list(archive.pending_archive_ids(db))
+    finally:
+        db.close()
+
+    if pending:
+        print(f"🗄️ Archiving {len(pending)} attempts with {args.workers} workers")
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            archived = sum(1 for key in pool.map(archive.archive_attempt, pending, chunksize=8) if key)
+        print(f"✅ {archived} attempts archived")
+
+    freed = archive.evict_cache()
+    if freed:
+        print(f"🧹 {freed / 1024 / 1024:.1f} MB evicted from {archive.ARCHIVE_CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
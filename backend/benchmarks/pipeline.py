@@ -0,0 +1,362 @@
+"""
+End-to-end benchmark on a synthetic corpus (see benchmarks.corpus): time and
+peak memory of every analysis stage, the full /api/teach + /api/analyze round
+trip through an in-process client, and transcription accuracy against the
+notes each melody was synthesized from.
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --preset full --repeat 3 --json after.json
+    python -m benchmarks.pipeline --json after.json --compare before.json
+
+Run from the backend directory. The request pass uses a throwaway database and
+storage directory, never the real ones. Results are plain JSON so two runs
+(before/after a change, or two commits) can be diffed with --compare, which
+exits non-zero when mean note F1 drops by more than --max-f1-drop.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import librosa
+import soundfile as sf
+
+from benchmarks.corpus import PRESETS, synthesize, note_accuracy
+from core.analysis import AudioAnalysis, normalize_volume, TARGET_SR, HOP_LENGTH
+from core.transcription import extract_notes_from_analysis
+from core.feedback import calculate_feedback, render_heatmap_png
+from core.music_gen import generate_musicxml
+from core.report_pdf import generate_performance_pdf
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("decode", "analysis", "transcription", "feedback", "musicxml", "heatmap", "pdf")
+ONSET_TOLERANCE = 0.1   # seconds; the usual note-onset window for transcription scoring
+BENCH_USER = ("bench", "bench-password")
+
+
+def _rss_mb(who):
+    rss = resource.getrusage(who).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- 1. CORPUS ---
+
+def write_corpus(cases, corpus_dir):
+    """Synthesizes every case to <name>_student.wav and <name>_teacher.wav."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    entries = []
+    for case in cases:
+        y, truth = synthesize(case)
+        teacher_y, _ = synthesize(case, expressive=False)
+        entry = {
+            "case": case, "truth": truth, "audio_s": round(len(y) / TARGET_SR, 2),
+            "student_wav": os.path.join(corpus_dir, f"{case.name}_student.wav"),
+            "teacher_wav": os.path.join(corpus_dir, f"{case.name}_teacher.wav"),
+        }
+        sf.write(entry["student_wav"], y, TARGET_SR, subtype="PCM_16")
+        sf.write(entry["teacher_wav"], teacher_y, TARGET_SR, subtype="PCM_16")
+        entries.append(entry)
+    return entries
+
+
+# --- 2. STAGES ---
+
+def _heatmap(y):
+    chroma = librosa.feature.chroma_cqt(y=y, sr=TARGET_SR, hop_length=HOP_LENGTH)
+    return render_heatmap_png(chroma, TARGET_SR, HOP_LENGTH)
+
+
+def run_pipeline(entry, measure, estimator=None):
+    """
+    One pass over the stages the workers run for an attempt; measure(stage, fn, *args)
+    calls fn and records whatever it measures. Returns the student notes.
+    The reference side is prepared unmeasured: /api/teach caches it per lesson.
+    """
+    teacher_y, _ = librosa.load(entry["teacher_wav"], sr=TARGET_SR, mono=True)
+    teacher_analysis = AudioAnalysis(normalize_volume(teacher_y), estimator=estimator)
+    lesson = SimpleNamespace(notes=json.dumps(extract_notes_from_analysis(teacher_analysis)))
+
+    y, _ = measure("decode", librosa.load, entry["student_wav"], sr=TARGET_SR, mono=True)
+    analysis = measure("analysis", AudioAnalysis, normalize_volume(y), estimator=estimator)
+    notes = measure("transcription", extract_notes_from_analysis, analysis)
+    result = measure("feedback", calculate_feedback, notes, analysis, lesson, teacher_analysis)
+    measure("musicxml", generate_musicxml, notes)
+    png = measure("heatmap", _heatmap, analysis.y)
+    measure("pdf", generate_performance_pdf, result["score"], result["detailed_breakdown"], result["graph_data"], png)
+    return notes
+
+
+def time_stages(entry, estimator=None):
+    timings = {}
+
+    def measure(stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[stage] = time.perf_counter() - t0
+        return result
+
+    notes = run_pipeline(entry, measure, estimator)
+    return timings, notes
+
+
+def stage_memory(entry, estimator=None):
+    """Peak traced allocation per stage (MB), above what was live when it started. Own pass: tracing is slow."""
+    peaks = {}
+
+    def measure(stage, fn, *args, **kwargs):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn(*args, **kwargs)
+        peaks[stage] = round((tracemalloc.get_traced_memory()[1] - before) / (1024 * 1024), 2)
+        return result
+
+    tracemalloc.start()
+    try:
+        run_pipeline(entry, measure, estimator)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+# --- 3. REQUESTS ---
+
+class _ResponseTimer:
+    """
+    ASGI wrapper noting when the last response byte leaves the app. /api/analyze
+    archives the upload in a background task after that, which the client call
+    also waits for; the difference is what that stage costs the worker pool.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.responded_at = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def timed_send(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self.responded_at = time.perf_counter()
+
+        await self.app(scope, receive, timed_send)
+
+
+async def _request_pass(entries, repeat, estimator):
+    import httpx
+    import main
+
+    timer = _ResponseTimer(main.app)
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=timer)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            form = {"username": BENCH_USER[0], "password": BENCH_USER[1]}
+            await client.post("/api/register", data=form)
+            token = (await client.post("/api/token", data=form)).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            for entry in entries:
+                name = entry["case"].name
+                with open(entry["teacher_wav"], "rb") as f:
+                    t0 = time.perf_counter()
+                    teach = await client.post("/api/teach", headers=headers, data={"title": name},
+                                              files={"file": (f"{name}_teacher.wav", f, "audio/wav")})
+                    teach_s = time.perf_counter() - t0
+                teach.raise_for_status()
+                lesson_id = teach.json()["lesson_id"]
+
+                data = {"lesson_id": str(lesson_id)}
+                if estimator: data["estimator"] = estimator
+                response_s, total_s, score = [], [], None
+                # First attempt is a warm-up (worker imports, caches), like the stage pass
+                for i in range(repeat + 1):
+                    with open(entry["student_wav"], "rb") as f:
+                        t0 = time.perf_counter()
+                        analyze = await client.post("/api/analyze", headers=headers, data=data,
+                                                    files={"file": (f"{name}_student.wav", f, "audio/wav")})
+                        t1 = time.perf_counter()
+                    analyze.raise_for_status()
+                    score = analyze.json()["feedback"]["score"]
+                    if i:
+                        response_s.append(timer.responded_at - t0)
+                        total_s.append(t1 - t0)
+                results[name] = {
+                    "teach_s": round(teach_s, 3),
+                    "analyze_s": round(statistics.median(response_s), 3),
+                    "analyze_total_s": round(statistics.median(total_s), 3),
+                    "score": score,
+                }
+                print(f"🌐 {name}: teach {teach_s:.2f}s, analyze {results[name]['analyze_s']:.2f}s "
+                      f"({results[name]['analyze_total_s']:.2f}s incl. archiving), score {score}")
+    return results
+
+
+def run_requests(entries, repeat, estimator=None):
+    """Full HTTP round trips against main.app in a scratch working directory (DB, storage, caches)."""
+    workdir = tempfile.mkdtemp(prefix="bench-api-")
+    cwd = os.getcwd()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    # main.py is importable from the scratch directory, and its storage paths are relative
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(workdir)
+    try:
+        return asyncio.run(_request_pass(entries, repeat, estimator))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- 4. REPORT ---
+
+def summarize(cases):
+    stage_totals = {stage: round(sum(c["stages_s"][stage] for c in cases), 4) for stage in STAGES}
+    compute_s = sum(stage_totals.values())
+    audio_s = sum(c["audio_s"] for c in cases)
+    summary = {
+        "audio_s": round(audio_s, 2),
+        "stages_s": stage_totals,
+        "compute_s": round(compute_s, 3),
+        "x_realtime": round(audio_s / compute_s, 2) if compute_s else None,
+        "peak_stage_mb": {stage: max(c["peak_mb"][stage] for c in cases) for stage in STAGES},
+        "mean_f1": round(statistics.mean(c["accuracy"]["f1"] for c in cases), 4),
+        "mean_onset_f1": round(statistics.mean(c["accuracy"]["onset_f1"] for c in cases), 4),
+    }
+    requests = [c["request"] for c in cases if c.get("request")]
+    if requests:
+        summary["analyze_s"] = round(sum(r["analyze_s"] for r in requests), 3)
+        summary["analyze_total_s"] = round(sum(r["analyze_total_s"] for r in requests), 3)
+    return summary
+
+
+def compare(current, baseline, max_f1_drop):
+    """
+    Prints per-stage deltas against an earlier run, over the cases both runs
+    have (names encode the synthesis parameters). Returns False if accuracy regressed.
+    """
+    before_cases = {c["name"]: c for c in baseline["cases"]}
+    common = [c["name"] for c in current["cases"] if c["name"] in before_cases]
+    if not common:
+        print("⚠️ No cases in common with the baseline, nothing to compare")
+        return True
+    now = summarize([c for c in current["cases"] if c["name"] in before_cases])
+    before = summarize([before_cases[name] for name in common])
+
+    print(f"📊 {len(common)} cases against {baseline['meta'].get('git_commit') or 'baseline'} "
+          f"({baseline['meta']['timestamp']}):")
+    rows = [(stage, before["stages_s"][stage], now["stages_s"][stage]) for stage in STAGES]
+    rows += [(key, before.get(key), now.get(key)) for key in ("compute_s", "analyze_s", "analyze_total_s")]
+    for key, old, new in rows:
+        if old is None or new is None: continue
+        change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+        print(f"   {key:<16} {old:8.3f}s -> {new:8.3f}s  {change}")
+    print(f"   {'mean_f1':<16} {before['mean_f1']:8.4f}  -> {now['mean_f1']:8.4f}")
+
+    f1_drop = before["mean_f1"] - now["mean_f1"]
+    if f1_drop > max_f1_drop:
+        print(f"❌ Mean note F1 dropped by {f1_drop:.4f} (allowed {max_f1_drop})")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline on a synthetic corpus")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="corpus to synthesize")
+    parser.add_argument("--cases", nargs="+", help="only run these case names")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per case after a warm-up (median is reported)")
+    parser.add_argument("--estimator", help="pitch estimator to benchmark (default: PITCH_ESTIMATOR)")
+    parser.add_argument("--onset-tolerance", type=float, default=ONSET_TOLERANCE, help="note onset window (seconds)")
+    parser.add_argument("--skip-requests", action="store_true", help="only time the stages in-process")
+    parser.add_argument("--corpus-dir", help="keep the synthesized WAVs here (default: a temp dir)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="earlier --json output to diff against")
+    parser.add_argument("--max-f1-drop", type=float, default=0.02, help="with --compare, fail if mean F1 drops more")
+    args = parser.parse_args()
+
+    cases = [c for c in PRESETS[args.preset] if not args.cases or c.name in args.cases]
+    if not cases:
+        parser.error(f"no cases of preset '{args.preset}' match {args.cases}")
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="bench-corpus-")
+    entries = write_corpus(cases, corpus_dir)
+    print(f"🎼 {len(entries)} melodies, {sum(e['audio_s'] for e in entries):.0f}s of audio")
+
+    results = []
+    for entry in entries:
+        time_stages(entry, args.estimator)   # warm-up: numba JIT, lazy imports, font loading
+        runs = [time_stages(entry, args.estimator) for _ in range(max(1, args.repeat))]
+        notes = runs[-1][1]
+        stages = {stage: round(statistics.median(t[stage] for t, _ in runs), 4) for stage in STAGES}
+        case_result = {
+            **entry["case"].to_dict(),
+            "audio_s": entry["audio_s"],
+            "stages_s": stages,
+            "stages_min_s": {stage: round(min(t[stage] for t, _ in runs), 4) for stage in STAGES},
+            "peak_mb": stage_memory(entry, args.estimator),
+            "accuracy": note_accuracy(entry["truth"], notes, args.onset_tolerance),
+        }
+        results.append(case_result)
+        print(f"⏱️ {entry['case'].name}: {sum(stages.values()):.2f}s for {entry['audio_s']:.1f}s of audio "
+              f"(analysis {stages['analysis']:.2f}s), F1 {case_result['accuracy']['f1']:.2f}")
+
+    if not args.skip_requests:
+        requests = run_requests(entries, max(1, args.repeat), args.estimator)
+        for case_result in results:
+            case_result["request"] = requests.get(case_result["name"])
+    if not args.corpus_dir:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "git_commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "preset": args.preset,
+            "repeat": args.repeat,
+            "estimator": args.estimator,
+            "onset_tolerance": args.onset_tolerance,
+            "peak_rss_mb": _rss_mb(resource.RUSAGE_SELF),
+            "workers_peak_rss_mb": _rss_mb(resource.RUSAGE_CHILDREN),
+        },
+        "cases": results,
+        "summary": summarize(results),
+    }
+    s = report["summary"]
+    print(f"✅ {s['compute_s']:.2f}s compute for {s['audio_s']:.0f}s of audio ({s['x_realtime']}x realtime), "
+          f"mean F1 {s['mean_f1']:.3f} (onsets {s['mean_onset_f1']:.3f}), peak RSS {report['meta']['peak_rss_mb']:.0f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.max_f1_drop):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Cold-start benchmark: import time, lifespan startup time and peak RSS of the
+API process per tier (see config.APP_TIER). Each run is a fresh interpreter.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --tiers api --runs 5 --max-app-import 0.3 --json startup.json
+
+Run from the backend directory. Exits non-zero when the api tier exceeds a
+budget, so it can gate CI. Import time is reported twice: in total, and the
+app's own share on top of importing FastAPI and SQLAlchemy themselves (about
+0.5 s on a small cloud VM), which is the part this codebase controls and the
+steadier number across machines.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules the API tier must not load at startup
+HEAVY_MODULES = ("scipy", "matplotlib", "reportlab", "soundfile", "numba", "librosa.core", "music21")
+# What any FastAPI + SQLAlchemy service pays before importing its own code
+FRAMEWORK_MODULES = ("fastapi", "fastapi.security", "fastapi.responses", "sqlalchemy.orm")
+
+# Default api tier budgets: a hard one-second ceiling on the whole import, and
+# the app's own share (routes, models, numpy, auth libraries; ~0.3 s today).
+# Pulling in librosa.core, scipy or numba alone would blow the latter.
+MAX_IMPORT_S = 1.0
+MAX_APP_IMPORT_S = 0.35
+
+_CHILD = r"""
+import asyncio, importlib, json, resource, sys, time
+t0 = time.perf_counter()
+for module in FRAMEWORK:
+    importlib.import_module(module)
+tf = time.perf_counter()
+import main
+t1 = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+t2 = asyncio.run(startup())
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "import_s": t1 - t0,
+    "app_import_s": t1 - tf,
+    "startup_s": t2 - t1,
+    "peak_rss_mb": rss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "heavy_modules": sorted(m for m in HEAVY if m in sys.modules),
+}))
+"""
+
+
+def measure(tier: str) -> dict:
+    env = dict(os.environ, APP_TIER=tier, PYTHONWARNINGS="ignore")
+    child = f"HEAVY = {HEAVY_MODULES!r}\nFRAMEWORK = {FRAMEWORK_MODULES!r}\n" + _CHILD
+    out = subprocess.run([sys.executable, "-c", child], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API cold start per process tier")
+    parser.add_argument("--tiers", nargs="+", default=["api", "all"], help="APP_TIER values to measure")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per tier (fastest import, median otherwise)")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-import", type=float, default=MAX_IMPORT_S,
+                        help="fail if the api tier imports slower than this in total (seconds, default %(default)s)")
+    parser.add_argument("--max-app-import", type=float, default=MAX_APP_IMPORT_S,
+                        help="fail if the api tier's own import share exceeds this (seconds, default %(default)s)")
+    parser.add_argument("--max-rss", type=float, help="fail if the api tier peaks above this (MB)")
+    args = parser.parse_args()
+
+    results = {}
+    for tier in args.tiers:
+        runs = [measure(tier) for _ in range(max(1, args.runs))]
+        # Best-of-N for import time, as timeit does: slower runs measure the machine, not the code
+        results[tier] = {
+            "import_s": round(min(r["import_s"] for r in runs), 3),
+            "app_import_s": round(min(r["app_import_s"] for r in runs), 3),
+            "startup_s": round(statistics.median(r["startup_s"] for r in runs), 3),
+            "peak_rss_mb": round(statistics.median(r["peak_rss_mb"] for r in runs), 1),
+            "heavy_modules": runs[-1]["heavy_modules"],
+            "runs": len(runs),
+        }
+        r = results[tier]
+        print(f"⏱️ {tier:>4}: import {r['import_s']:.2f}s (app {r['app_import_s']:.2f}s), startup {r['startup_s']:.2f}s, "
+              f"peak RSS {r['peak_rss_mb']:.0f} MB, heavy modules: {', '.join(r['heavy_modules']) or 'none'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    api = results.get("api")
+    failures = []
+    if api and args.max_import is not None and api["import_s"] > args.max_import:
+        failures.append(f"api import {api['import_s']}s > {args.max_import}s")
+    if api and args.max_app_import is not None and api["app_import_s"] > args.max_app_import:
+        failures.append(f"api app import {api['app_import_s']}s > {args.max_app_import}s")
+    if api and args.max_rss is not None and api["peak_rss_mb"] > args.max_rss:
+        failures.append(f"api peak RSS {api['peak_rss_mb']} MB > {args.max_rss} MB")
+    if api and api["heavy_modules"]:
+        failures.append(f"api tier loaded {', '.join(api['heavy_modules'])}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,7 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 
-# Connect to your database
-engine = create_engine("sqlite:///./music_tutor.db")
-Session = sessionmaker(bind=engine)
-session = Session()
+# Connect to your database (DATABASE_URL, see config.py)
+from core.database import engine
 
 try:
     # 1. Fetch Users
@@ -0,0 +1,41 @@
+"""
+One-off migration of History rows written before analysis results were
+stored compressed (see core.history, ANALYSIS STORAGE):
+
+    python compact_history.py
+
+Safe to re-run and to run while the API is up; converted rows are skipped.
+SQLite only returns the freed pages to the OS after VACUUM, which runs at
+the end unless --no-vacuum is given (it needs as much free disk as the DB).
+"""
+import argparse
+
+from sqlalchemy import text
+
+import config
+from core import models, database, history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress legacy History.analysis_data rows")
+    parser.add_argument("--batch-size", type=int, default=200, help="rows per transaction")
+    parser.add_argument("--no-vacuum", action="store_true", help="skip VACUUM afterwards")
+    args = parser.parse_args()
+
+    if config.DB_MIGRATE_ON_STARTUP:
+        models.sync_schema(database.engine)
+    db = database.SessionLocal()
+    try:
+        converted = history.compact_legacy_rows(db, max(1, args.batch_size))
+    finally:
+        db.close()
+    print(f"✅ {converted} attempts compacted")
+
+    if converted and not args.no_vacuum and database.engine.dialect.name == "sqlite":
+        with database.engine.connect() as con:
+            con.execute(text("VACUUM"))
+        print("🧹 Database vacuumed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+
+# --- ALIGNMENT SETTINGS ---
+# Sakoe-Chiba band half-width, as a fraction of the longer melody (never below ALIGN_BAND_MIN notes)
+ALIGN_BAND_FRACTION = float(os.getenv("ALIGN_BAND_FRACTION", 0.25))
+ALIGN_BAND_MIN = int(os.getenv("ALIGN_BAND_MIN", 3))
+# Local cost is in semitones of pitch error; the timing terms steer the path
+# between equally good pitch matches (repeated notes, ornaments) and keep it in order.
+ONSET_WEIGHT = float(os.getenv("ALIGN_ONSET_WEIGHT", 1.0))        # per second of tempo-normalized onset difference
+DURATION_WEIGHT = float(os.getenv("ALIGN_DURATION_WEIGHT", 0.5))  # per doubling/halving of note length
+# Rhythm errors larger than these are called out in the per-note feedback
+TIMING_TOLERANCE = float(os.getenv("TIMING_TOLERANCE", 0.15))      # seconds
+DURATION_TOLERANCE = float(os.getenv("DURATION_TOLERANCE", 0.35))  # fraction of the teacher's note length
+
+
+def note_features(notes):
+    """
+    (n, 3) array of pitch, onset and duration from note dicts or a
+    transcription.NOTE_DTYPE array. Onsets are relative to the first note.
+    """
+    if isinstance(notes, np.ndarray) and notes.dtype.names:
+        pitch, start, duration = notes["pitch"], notes["start"], notes["duration"]
+    else:
+        pitch = [n["pitch"] for n in notes]
+        start = [n["start"] for n in notes]
+        duration = [n["duration"] for n in notes]
+    features = np.column_stack((pitch, start, duration)).astype(np.float64)
+    if len(features):
+        features[:, 1] -= features[0, 1]
+    return features
+
+
+def _span(features):
+    return features[-1, 1] + features[-1, 2] if len(features) else 0.0
+
+
+def sakoe_chiba_band(n, m, radius=None):
+    """Per-row [lo, hi) column ranges of a band around the (stretched) diagonal."""
+    slope = (m - 1) / max(n - 1, 1)
+    if radius is None:
+        radius = max(ALIGN_BAND_MIN, int(np.ceil(ALIGN_BAND_FRACTION * max(n, m))))
+    # Wide enough that neighbouring rows always overlap, so the end cell stays reachable
+    radius = max(radius, int(np.ceil(slope)))
+    centre = np.arange(n) * slope
+    lo = np.clip(np.floor(centre - radius), 0, m).astype(np.int64)
+    hi = np.clip(np.ceil(centre + radius) + 1, 0, m).astype(np.int64)
+    return lo, hi
+
+
+def dtw(cost, lo, hi):
+    """
+    Exact DTW inside a band. Each row is solved in one vectorized step: the
+    left-neighbour recurrence D[j] = min(T[j], c[j] + D[j-1]) unrolls to
+    S[j] + cummin(T - S)[j] with S the running sum of the row's costs.
+    Returns (total cost, path as an (k, 2) array of (teacher, student) indices).
+    """
+    n, m = cost.shape
+    D = np.full((n + 1, m + 1), np.inf)
+    D[0, 0] = 0.0
+    for i in range(1, n + 1):
+        a, b = lo[i - 1], hi[i - 1]
+        row_cost = cost[i - 1, a:b]
+        from_above = np.minimum(D[i - 1, a:b], D[i - 1, a + 1:b + 1])  # diagonal, vertical
+        running = np.cumsum(row_cost)
+        D[i, a + 1:b + 1] = running + np.minimum.accumulate(row_cost + from_above - running)
+
+    # Backtrack; ties prefer the diagonal so equal-length melodies pair note for note
+    path = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        path.append((i - 1, j - 1))
+        steps = (D[i - 1, j - 1], D[i - 1, j], D[i, j - 1])
+        move = int(np.argmin(steps))
+        if move == 0:
+            i, j = i - 1, j - 1
+        elif move == 1:
+            i -= 1
+        else:
+            j -= 1
+    return float(D[n, m]), np.array(path[::-1], dtype=np.int64).reshape(-1, 2)
+
+
+class NoteAlignment:
+    """Result of aligning a student take to the teacher melody, note by note."""
+
+    def __init__(self, path, pitch_distance, tempo_ratio, matches):
+        self.path = path                    # (k, 2) teacher/student index pairs
+        self.pitch_distance = pitch_distance  # sum of |semitone error| along the path
+        self.tempo_ratio = tempo_ratio      # student span / teacher span
+        self.matches = matches              # one dict per teacher note
+
+
+def align_notes(teacher_notes, student_notes) -> NoteAlignment:
+    teacher, student = note_features(teacher_notes), note_features(student_notes)
+    n, m = len(teacher), len(student)
+
+    # Compare rhythm at the teacher's tempo so a uniformly slower take isn't "late" everywhere
+    teacher_span, student_span = _span(teacher), _span(student)
+    tempo_ratio = student_span / teacher_span if teacher_span > 0 and student_span > 0 else 1.0
+    s_pitch = student[:, 0]
+    s_onset = student[:, 1] / tempo_ratio
+    s_duration = student[:, 2] / tempo_ratio
+
+    pitch_error = s_pitch[None, :] - teacher[:, [0]]
+    onset_error = s_onset[None, :] - teacher[:, [1]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        duration_log = np.abs(np.log2(np.maximum(s_duration[None, :], 1e-3) / np.maximum(teacher[:, [2]], 1e-3)))
+    cost = np.abs(pitch_error) + ONSET_WEIGHT * np.abs(onset_error) + DURATION_WEIGHT * duration_log
+
+    lo, hi = sakoe_chiba_band(n, m)
+    _, path = dtw(cost, lo, hi)
+    t_idx, s_idx = path[:, 0], path[:, 1]
+    pitch_distance = float(np.abs(pitch_error[t_idx, s_idx]).sum())
+
+    # Each teacher note is judged against its cheapest partner on the path
+    order = np.lexsort((cost[t_idx, s_idx], t_idx))
+    first = np.unique(t_idx[order], return_index=True)[1]
+    best_student = s_idx[order][first]
+
+    matches = []
+    for t, s in zip(range(n), best_student.tolist()):
+        matches.append({
+            "teacher_index": t,
+            "student_index": s,
+            "pitch_error": float(pitch_error[t, s]),
+            "timing_error": float(onset_error[t, s]),
+            "duration_error": float(s_duration[s] - teacher[t, 2]),
+        })
+    return NoteAlignment(path, pitch_distance, tempo_ratio, matches)
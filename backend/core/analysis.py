@@ -0,0 +1,234 @@
+import librosa
+import numpy as np
+import os
+import warnings
+from functools import cached_property
+
+# Suppress warnings
+warnings.filterwarnings("ignore")
+
+# --- SHARED ANALYSIS SETTINGS ---
+# Every stage (transcription, DTW scoring, dashboard graphs, PDF report) reads
+# from the same frame grid, so these are the only place the resolution is set.
+TARGET_SR = 16000
+HOP_LENGTH = 512     # ~32ms per frame at 16 kHz
+FRAME_LENGTH = 2048
+FMIN = 50
+FMAX = 1000
+# pyin's working matrices grow with signal length; long recordings are
+# pitch-tracked in blocks of this many frames (~30s) to keep memory flat
+PYIN_BLOCK_FRAMES = 960
+
+# --- PITCH ESTIMATOR ---
+# Deployment default; a request can still pick another one per analysis
+PITCH_ESTIMATOR = os.getenv("PITCH_ESTIMATOR", "pyin")
+# YIN: a frame is voiced when its normalized difference dips below this
+YIN_THRESHOLD = float(os.getenv("YIN_THRESHOLD", 0.1))
+
+# Arrays persisted when an analysis is cached (the raw waveform is not kept)
+FEATURE_FIELDS = ("f0", "voiced_flag", "voiced_probs", "midi_pitch", "onset_env", "rms", "chroma")
+
+
+class AudioAnalysis:
+    """
+    One decoded recording plus every frame-level feature the pipeline needs.
+    Built once per file; transcription, feedback graphs and the PDF report
+    all read from it instead of decoding and running pyin again.
+    """
+
+    def __init__(self, y, sr=TARGET_SR, hop_length=HOP_LENGTH, estimator=None):
+        self.y = y
+        self.sr = sr
+        self.hop_length = hop_length
+        self.duration = len(y) / float(sr)
+
+        # 1. PITCH (the most expensive step, run it exactly once)
+        estimator = get_estimator(estimator)
+        self.estimator = estimator.name
+        self.f0, self.voiced_flag, self.voiced_probs = estimator.estimate(y, sr, hop_length)
+        self.midi_pitch = librosa.hz_to_midi(np.nan_to_num(self.f0))
+        self.midi_pitch[self.f0 == 0] = 0
+
+        # 2. ONSET ENVELOPE & LOUDNESS
+        self.onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
+        self.rms = librosa.feature.rms(y=y, frame_length=FRAME_LENGTH, hop_length=hop_length)[0]
+
+    @cached_property
+    def chroma(self):
+        # Only the student heatmap needs this, so it is computed on first use.
+        return librosa.feature.chroma_cqt(y=self.y, sr=self.sr, hop_length=self.hop_length)
+
+    @property
+    def times(self):
+        return librosa.times_like(self.f0, sr=self.sr, hop_length=self.hop_length)
+
+    def to_arrays(self):
+        """Flattens the features into a dict of arrays (for np.savez)."""
+        arrays = {field: getattr(self, field) for field in FEATURE_FIELDS}
+        arrays["meta"] = np.array([self.sr, self.hop_length, self.duration], dtype=np.float64)
+        arrays["estimator"] = np.array(self.estimator)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuilds a cached analysis without decoding audio or running pyin."""
+        analysis = cls.__new__(cls)
+        sr, hop_length, duration = arrays["meta"]
+        analysis.y = None
+        analysis.sr = int(sr)
+        analysis.hop_length = int(hop_length)
+        analysis.duration = float(duration)
+        # Entries cached before estimators were pluggable are all pyin
+        analysis.estimator = str(arrays["estimator"]) if "estimator" in arrays else "pyin"
+        for field in FEATURE_FIELDS:
+            # Assigning chroma here also pre-fills the cached_property
+            setattr(analysis, field, arrays[field])
+        return analysis
+
+
+def blockwise_pyin(y, sr=TARGET_SR, hop_length=HOP_LENGTH, block_frames=PYIN_BLOCK_FRAMES,
+                   fmin=FMIN, fmax=FMAX, frame_length=FRAME_LENGTH):
+    """
+    Same frame grid as librosa.pyin(center=True), computed in bounded blocks.
+    Each block gets the exact samples its frames would see in a full-length
+    call, so only the Viterbi smoothing restarts at block boundaries.
+    """
+    pad = frame_length // 2
+    n_frames = 1 + len(y) // hop_length
+    if n_frames <= block_frames:
+        return librosa.pyin(y, fmin=fmin, fmax=fmax, sr=sr, frame_length=frame_length, hop_length=hop_length)
+
+    y_padded = np.pad(y, pad)
+    results = []
+    for first in range(0, n_frames, block_frames):
+        last = min(first + block_frames, n_frames)
+        block = y_padded[first * hop_length: (last - 1) * hop_length + frame_length]
+        results.append(librosa.pyin(block, fmin=fmin, fmax=fmax, sr=sr, frame_length=frame_length,
+                                    hop_length=hop_length, center=False))
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+class PitchEstimator:
+    """
+    Frame-level f0 tracker on the shared frame grid (center=True, 1 + len(y) // hop frames).
+    estimate() returns (f0 in Hz with NaN where unvoiced, voiced_flag, voiced_probs),
+    the same triple librosa.pyin returns, so every consumer works with any estimator.
+    """
+    name = None
+
+    def __init__(self, fmin=FMIN, fmax=FMAX, frame_length=FRAME_LENGTH):
+        self.fmin = fmin
+        self.fmax = fmax
+        self.frame_length = frame_length
+
+    def estimate(self, y, sr, hop_length):
+        raise NotImplementedError
+
+
+class PyinEstimator(PitchEstimator):
+    """Probabilistic YIN with Viterbi smoothing: most robust, slowest."""
+    name = "pyin"
+
+    def estimate(self, y, sr, hop_length):
+        return blockwise_pyin(y, sr, hop_length, fmin=self.fmin, fmax=self.fmax, frame_length=self.frame_length)
+
+
+class YinEstimator(PitchEstimator):
+    """
+    Plain YIN, vectorized over frames: FFT cross-correlation for the difference
+    function, cumulative-mean normalization, first dip under the threshold and
+    parabolic refinement. No pitch-state decoding, so it is several times faster
+    than pyin at the cost of the odd octave slip on breathy or noisy frames.
+    """
+    name = "yin"
+
+    def __init__(self, fmin=FMIN, fmax=FMAX, frame_length=FRAME_LENGTH, threshold=YIN_THRESHOLD):
+        super().__init__(fmin, fmax, frame_length)
+        self.threshold = threshold
+
+    def estimate(self, y, sr, hop_length, block_frames=PYIN_BLOCK_FRAMES):
+        min_period = max(int(np.floor(sr / self.fmax)), 1)
+        max_period = min(int(np.ceil(sr / self.fmin)), self.frame_length - 1)
+        window = self.frame_length - max_period
+        n_fft = 1 << int(np.ceil(np.log2(self.frame_length + window)))
+
+        frames = librosa.util.frame(np.pad(np.asarray(y, dtype=np.float32), self.frame_length // 2),
+                                    frame_length=self.frame_length, hop_length=hop_length).T
+        results = [self._track(frames[first:first + block_frames], sr, min_period, max_period, window, n_fft)
+                   for first in range(0, len(frames), block_frames)]
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+    def _track(self, frames, sr, min_period, max_period, window, n_fft):
+        # Difference function d(tau) = E(head) + E(shifted head) - 2 * correlation
+        head = frames[:, :window]
+        correlation = np.fft.irfft(
+            np.fft.rfft(frames, n_fft) * np.conj(np.fft.rfft(head, n_fft)), n_fft
+        )[:, :max_period + 1]
+        energy = np.concatenate((np.zeros((len(frames), 1)), np.cumsum(frames.astype(np.float64) ** 2, axis=1)), axis=1)
+        lags = np.arange(max_period + 1)
+        shifted_energy = energy[:, lags + window] - energy[:, lags]
+        difference = np.maximum(energy[:, [window]] + shifted_energy - 2 * correlation, 0)
+
+        # Cumulative mean normalized difference (1 at lag 0 by definition)
+        cumulative = np.cumsum(difference[:, 1:], axis=1)
+        normalized = np.ones_like(difference)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            normalized[:, 1:] = difference[:, 1:] * lags[1:] / cumulative
+        normalized = np.nan_to_num(normalized, nan=1.0, posinf=1.0)
+
+        # First local minimum under the threshold inside the allowed period range
+        search = normalized[:, min_period:max_period + 1]
+        is_dip = np.zeros(search.shape, dtype=bool)
+        is_dip[:, 1:-1] = (search[:, 1:-1] <= search[:, :-2]) & (search[:, 1:-1] < search[:, 2:])
+        is_dip &= search < self.threshold
+        voiced = is_dip.any(axis=1)
+        best = np.where(voiced, is_dip.argmax(axis=1), search.argmin(axis=1))
+
+        # Parabolic interpolation around the chosen lag
+        rows = np.arange(len(frames))
+        inner = np.clip(best, 1, search.shape[1] - 2)
+        left, centre, right = search[rows, inner - 1], search[rows, inner], search[rows, inner + 1]
+        curvature = left - 2 * centre + right
+        shift = np.where(np.abs(curvature) > 1e-12, 0.5 * (left - right) / np.where(curvature == 0, 1, curvature), 0.0)
+        shift = np.where(best == inner, np.clip(shift, -1, 1), 0.0)
+        period = min_period + best + shift
+
+        f0 = np.where(voiced, sr / period, np.nan)
+        voiced_probs = np.clip(1 - search[rows, best], 0, 1)
+        return f0, voiced, voiced_probs
+
+
+# Register additional estimators here; names are what requests and PITCH_ESTIMATOR use
+PITCH_ESTIMATORS = {cls.name: cls for cls in (PyinEstimator, YinEstimator)}
+
+
+def get_estimator(estimator=None) -> PitchEstimator:
+    """Accepts an estimator instance, a registered name, or None for the deployment default."""
+    if isinstance(estimator, PitchEstimator):
+        return estimator
+    name = estimator or PITCH_ESTIMATOR
+    if name not in PITCH_ESTIMATORS:
+        raise ValueError(f"Unknown pitch estimator '{name}'")
+    return PITCH_ESTIMATORS[name]()
+
+
+def normalize_volume(y):
+    # Bring every recording to roughly -20 dBFS RMS before analysis
+    rms = np.sqrt(np.mean(y**2))
+    if rms > 0:
+        return y * ((10**(-20/20)) / (rms + 1e-9))
+    return y
+
+
+def load_pcm(pcm_path: str):
+    """Maps raw 16 kHz mono float32 PCM written by core.ingest / core.archive (no decode/resample)."""
+    return np.memmap(pcm_path, dtype=np.float32, mode="r")
+
+
+def analyze_audio(audio_path: str, pcm_path: str = None, estimator=None) -> AudioAnalysis:
+    """Decodes and resamples a file once and computes all shared features."""
+    if pcm_path and os.path.exists(pcm_path) and os.path.getsize(pcm_path) > 0:
+        y, sr = load_pcm(pcm_path), TARGET_SR
+    else:
+        y, sr = librosa.load(audio_path, sr=TARGET_SR, mono=True)
+    return AudioAnalysis(normalize_volume(y), sr=sr, estimator=estimator)
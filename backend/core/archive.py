@@ -0,0 +1,332 @@
+"""
+Archival tier for student recordings.
+
+Uploads land in storage/history as they arrived (often large browser WAVs).
+Once an attempt is scored, archive_attempt() turns that into:
+
+  * a compact playback copy (mono Opus in .ogg) kept in the object store,
+    under the key History.audio_filename;
+  * the decoded 16 kHz mono float32 samples in ARCHIVE_CACHE_DIR, which
+    re-analysis memory-maps instead of decoding the recording again.
+
+The sample cache is disposable (LRU under ARCHIVE_CACHE_MB, rebuilt from the
+playback copy on demand); the object store is the only durable copy.
+Recordings older than ARCHIVE_RETENTION_DAYS are deleted by `python archive.py`.
+"""
+import importlib
+import os
+import shutil
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .analysis import TARGET_SR, load_pcm
+from .history import HISTORY_DIR
+from . import database, models
+
+# --- ARCHIVE SETTINGS ---
+# "local" (a directory, default storage/history) or "package.module:Class" for another ObjectStore
+ARCHIVE_STORE = os.getenv("ARCHIVE_STORE", "local")
+ARCHIVE_STORE_ROOT = os.getenv("ARCHIVE_STORE_ROOT", HISTORY_DIR)
+ARCHIVE_SAMPLE_RATE = 48000   # Opus only encodes at 8/12/16/24/48 kHz
+# libsndfile's Opus quality knob: 0 = largest/best, 1 = smallest. 0.7 is ~80 kbit/s mono.
+ARCHIVE_COMPRESSION_LEVEL = float(os.getenv("ARCHIVE_COMPRESSION_LEVEL", 0.7))
+ARCHIVE_EXTENSION = ".ogg"
+# Already-compressed browser formats are kept as uploaded: re-encoding lossy
+# audio would cost quality for little space
+ARCHIVE_PASSTHROUGH_EXTENSIONS = {".ogg", ".opus", ".webm", ".m4a", ".mp3", ".aac"}
+
+# Decoded samples (and recordings fetched from a remote store), evicted least recently used first
+ARCHIVE_CACHE_DIR = os.getenv("ARCHIVE_CACHE_DIR", "storage/archive_cache")
+ARCHIVE_CACHE_MB = int(os.getenv("ARCHIVE_CACHE_MB", 1024))
+# Each process keeps a running total of what it adds to the cache and only scans the
+# directory when that goes over budget, or after this many writes (other processes add files too)
+ARCHIVE_CACHE_RESCAN_WRITES = int(os.getenv("ARCHIVE_CACHE_RESCAN_WRITES", 64))
+# 0 keeps recordings forever; otherwise older attempts keep their score and feedback but lose the audio
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", 0))
+
+
+# --- OBJECT STORES ---
+class ObjectStore:
+    """Durable home of archived recordings. Keys are History.audio_filename values."""
+
+    name = None
+
+    def put(self, key: str, path: str):
+        """Stores the local file under key; the file is consumed (moved or uploaded, then removed)."""
+        raise NotImplementedError
+
+    def fetch(self, key: str, dest_path: str) -> bool:
+        """Copies the object to dest_path. False if there is no such key."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def local_path(self, key: str):
+        """Path on this machine if the store can serve the object directly, else None."""
+        return None
+
+
+class LocalObjectStore(ObjectStore):
+    name = "local"
+
+    def __init__(self, root=ARCHIVE_STORE_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, key, path):
+        if os.path.abspath(path) != os.path.abspath(self._path(key)):
+            shutil.move(path, self._path(key))
+
+    def fetch(self, key, dest_path):
+        if not os.path.exists(self._path(key)): return False
+        shutil.copyfile(self._path(key), dest_path)
+        return True
+
+    def delete(self, key):
+        try: os.remove(self._path(key))
+        except FileNotFoundError: pass
+
+    def local_path(self, key):
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+
+OBJECT_STORES = {cls.name: cls for cls in (LocalObjectStore,)}
+_store = None
+
+
+def get_store() -> ObjectStore:
+    global _store
+    if _store is None:
+        if ARCHIVE_STORE in OBJECT_STORES:
+            _store = OBJECT_STORES[ARCHIVE_STORE]()
+        elif ":" in ARCHIVE_STORE:
+            module_name, class_name = ARCHIVE_STORE.split(":", 1)
+            _store = getattr(importlib.import_module(module_name), class_name)()
+        else:
+            raise ValueError(f"Unknown archive store '{ARCHIVE_STORE}'. Options: {', '.join(OBJECT_STORES)} or module:Class")
+    return _store
+
+
+# --- SAMPLE CACHE ---
+_cache_bytes = None      # this process's running estimate of the cache size (None until the first scan)
+_writes_since_scan = 0
+
+
+def pcm_cache_path(audio_filename: str) -> str:
+    # Keyed by the stem, which survives the upload -> .ogg rename
+    return os.path.join(ARCHIVE_CACHE_DIR, os.path.splitext(audio_filename)[0] + ".f32")
+
+
+def _atomic_write(path, data: np.ndarray):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    data.astype(np.float32).tofile(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def local_audio(audio_filename: str):
+    """A readable local path for the recording: the upload, the local store, or a cached fetch."""
+    if not audio_filename: return None
+    staged = os.path.join(HISTORY_DIR, audio_filename)
+    if os.path.isfile(staged): return staged
+    store = get_store()
+    path = store.local_path(audio_filename)
+    if path: return path
+
+    fetched = os.path.join(ARCHIVE_CACHE_DIR, audio_filename)
+    if os.path.exists(fetched):
+        os.utime(fetched)
+        return fetched
+    os.makedirs(ARCHIVE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{fetched}.{os.getpid()}.tmp"
+    if store.fetch(audio_filename, tmp_path):
+        os.replace(tmp_path, fetched)
+        _cache_added(os.path.getsize(fetched))
+        return fetched
+
+    # A page loaded before the attempt was archived still asks for the upload's name
+    stem, ext = os.path.splitext(audio_filename)
+    return local_audio(stem + ARCHIVE_EXTENSION) if ext != ARCHIVE_EXTENSION else None
+
+
+def cached_pcm(audio_filename: str):
+    """Path of the decoded 16 kHz samples, decoding the archived recording on a cache miss. None if it is gone."""
+    path = pcm_cache_path(audio_filename)
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        os.utime(path)  # LRU: eviction goes by mtime
+        return path
+    audio_path = local_audio(audio_filename)
+    if audio_path is None: return None
+    import librosa  # decoding happens in workers; the API tier never loads it at startup
+    y, _ = librosa.load(audio_path, sr=TARGET_SR, mono=True)
+    _atomic_write(path, y)
+    _cache_added(len(y) * 4)
+    return path
+
+
+def load_samples(audio_filename: str):
+    """The recording as a read-only memory-mapped float32 array at TARGET_SR, or None."""
+    path = cached_pcm(audio_filename)
+    return load_pcm(path) if path else None
+
+
+def evict_cache(budget_mb=None):
+    """Deletes least recently used cache files until the directory fits the budget. Returns bytes freed."""
+    global _cache_bytes, _writes_since_scan
+    if budget_mb is None: budget_mb = ARCHIVE_CACHE_MB
+    if not os.path.isdir(ARCHIVE_CACHE_DIR):
+        _cache_bytes, _writes_since_scan = 0, 0
+        return 0
+    entries = [entry for entry in os.scandir(ARCHIVE_CACHE_DIR) if entry.is_file() and not entry.name.endswith(".tmp")]
+    total = sum(entry.stat().st_size for entry in entries)
+    budget, freed = budget_mb * 1024 * 1024, 0
+    for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+        if total - freed <= budget: break
+        size = entry.stat().st_size
+        try: os.remove(entry.path)
+        except FileNotFoundError: continue
+        freed += size
+    _cache_bytes, _writes_since_scan = total - freed, 0
+    return freed
+
+
+def _cache_added(nbytes: int):
+    """Accounts for a new cache file; scans and evicts only when the running total says it's needed."""
+    global _cache_bytes, _writes_since_scan
+    _writes_since_scan += 1
+    if _cache_bytes is None or _writes_since_scan >= ARCHIVE_CACHE_RESCAN_WRITES:
+        evict_cache()
+        return
+    _cache_bytes += nbytes
+    if _cache_bytes > ARCHIVE_CACHE_MB * 1024 * 1024:
+        evict_cache()
+
+
+# --- ARCHIVAL ---
+def _encode_playback(audio_path: str, out_path: str) -> bool:
+    import soundfile as sf  # only the archiving worker needs libsndfile's encoder
+    if "OPUS" not in sf.available_subtypes("OGG"): return False  # libsndfile older than 1.0.29
+    import librosa
+    y, _ = librosa.load(audio_path, sr=ARCHIVE_SAMPLE_RATE, mono=True)
+    sf.write(out_path, y, ARCHIVE_SAMPLE_RATE, format="OGG", subtype="OPUS", compression_level=ARCHIVE_COMPRESSION_LEVEL)
+    return True
+
+
+def _uploads_live_in_store() -> bool:
+    store = get_store()
+    return isinstance(store, LocalObjectStore) and os.path.abspath(store.root) == os.path.abspath(HISTORY_DIR)
+
+
+def needs_archiving(audio_filename: str) -> bool:
+    """True while the recording is still the raw upload sitting in storage/history."""
+    if not audio_filename or not os.path.isfile(os.path.join(HISTORY_DIR, audio_filename)): return False
+    # A passthrough upload already in its final place is archived as-is
+    return os.path.splitext(audio_filename)[1].lower() not in ARCHIVE_PASSTHROUGH_EXTENSIONS or not _uploads_live_in_store()
+
+
+def archive_attempt(history_id: int, pcm_path: str = None):
+    """
+    Worker-side: moves one attempt's upload into the archive tier.
+    pcm_path: samples already decoded at ingest; they become the cache entry.
+    Returns the new audio_filename (None if the attempt has no recording).
+    """
+    db = database.SessionLocal()
+    encoded_path = None
+    try:
+        row = db.query(models.History.id, models.History.audio_filename).filter(models.History.id == history_id).first()
+        filename = row.audio_filename if row else None
+        if not filename:
+            return None
+
+        # 1. Decoded samples for re-analysis: reuse the ingest decode when there is one
+        cache_path = pcm_cache_path(filename)
+        if pcm_path and os.path.exists(pcm_path) and os.path.getsize(pcm_path) > 0:
+            os.makedirs(ARCHIVE_CACHE_DIR, exist_ok=True)
+            shutil.move(pcm_path, cache_path)
+            _cache_added(os.path.getsize(cache_path))
+        if not needs_archiving(filename):
+            return filename
+        upload_path = os.path.join(HISTORY_DIR, filename)
+        if not os.path.exists(cache_path):
+            cached_pcm(filename)
+
+        # 2. Compact playback copy
+        key, source = filename, upload_path
+        if os.path.splitext(filename)[1].lower() not in ARCHIVE_PASSTHROUGH_EXTENSIONS:
+            encoded_path = os.path.join(HISTORY_DIR, f".{os.path.splitext(filename)[0]}.{os.getpid()}{ARCHIVE_EXTENSION}")
+            if _encode_playback(upload_path, encoded_path):
+                key, source = os.path.splitext(filename)[0] + ARCHIVE_EXTENSION, encoded_path
+        get_store().put(key, source)
+
+        # 3. Point the attempt at it; the upload goes once nothing references it
+        if key != filename:
+            db.query(models.History).filter(models.History.id == history_id, models.History.audio_filename == filename) \
+                .update({models.History.audio_filename: key}, synchronize_session=False)
+            db.commit()
+            try: os.remove(upload_path)
+            except FileNotFoundError: pass
+        print(f"🗄️ Archived attempt {history_id} as {key}")
+        return key
+    finally:
+        db.close()
+        for path in (pcm_path, encoded_path):
+            if path and os.path.exists(path): os.remove(path)
+
+
+async def archive_in_background(executor, history_id: int, pcm_path: str = None):
+    """Runs archive_attempt after the response is sent. Failures leave the upload for `python archive.py`."""
+    try:
+        await executor.run(archive_attempt, history_id, pcm_path)
+    except Exception as e:
+        print(f"⚠️ Archiving attempt {history_id} deferred: {getattr(e, 'detail', e)}")
+        if pcm_path and os.path.exists(pcm_path):
+            os.remove(pcm_path)
+
+
+def pending_archive_ids(db, batch_size=200):
+    """Ids of attempts whose upload still sits un-archived in storage/history, oldest first."""
+    last_id = 0
+    while True:
+        rows = (
+            db.query(models.History.id, models.History.audio_filename)
+            .filter(models.History.id > last_id, models.History.audio_filename.isnot(None))
+            .order_by(models.History.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows: return
+        last_id = rows[-1].id
+        yield from (row.id for row in rows if needs_archiving(row.audio_filename))
+
+
+# --- RETENTION ---
+def enforce_retention(db, days=ARCHIVE_RETENTION_DAYS, batch_size=200):
+    """Deletes recordings of attempts older than `days`. Scores and feedback stay. Returns the count."""
+    if days <= 0: return 0
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    store, removed = get_store(), 0
+    while True:
+        rows = (
+            db.query(models.History.id, models.History.audio_filename)
+            .filter(models.History.date < cutoff, models.History.audio_filename.isnot(None))
+            .order_by(models.History.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows: return removed
+        for row in rows:
+            store.delete(row.audio_filename)
+            for path in (os.path.join(HISTORY_DIR, row.audio_filename), pcm_cache_path(row.audio_filename),
+                         os.path.join(ARCHIVE_CACHE_DIR, row.audio_filename)):
+                try: os.remove(path)
+                except FileNotFoundError: pass
+        db.query(models.History).filter(models.History.id.in_([row.id for row in rows])) \
+            .update({models.History.audio_filename: None}, synchronize_session=False)
+        db.commit()
+        removed += len(rows)
@@ -0,0 +1,148 @@
+import hashlib
+import mimetypes
+import os
+import stat
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+# --- CACHE POLICY ---
+# Vite fingerprints every file under dist/assets, so a URL there never changes content
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# index.html and the other top-level files keep their names across builds: revalidate (cheap 304s)
+PAGE_CACHE_CONTROL = "no-cache"
+# Archived attempts get a fresh name per upload and are never rewritten
+AUDIO_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# Sibling files written by `npm run build` (scripts/precompress.js), best first
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _stat_etag(stat_result: os.stat_result) -> str:
+    return '"' + hashlib.md5(f"{stat_result.st_mtime_ns}-{stat_result.st_size}".encode()).hexdigest() + '"'
+
+
+def _content_etag(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return '"' + digest.hexdigest()[:32] + '"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """True when the client's If-None-Match already names this representation."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match: return False
+    if if_none_match.strip() == "*": return True
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    return etag.removeprefix("W/") in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0: continue
+            except ValueError:
+                continue
+        if coding: accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticAsset:
+    """One file of the frontend build plus its precompressed siblings, stat'ed and hashed once."""
+
+    __slots__ = ("path", "stat_result", "etag", "media_type", "cache_control", "variants")
+
+    def __init__(self, path: str, cache_control: str):
+        self.path = path
+        self.stat_result = os.stat(path)
+        self.etag = _content_etag(path)
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.cache_control = cache_control
+        # encoding -> (path, stat, etag); each encoding is its own representation with its own tag
+        self.variants = {}
+        for encoding, suffix in PRECOMPRESSED:
+            variant_path = path + suffix
+            if os.path.isfile(variant_path):
+                self.variants[encoding] = (variant_path, os.stat(variant_path), f'{self.etag[:-1]}-{encoding}"')
+
+    def representation(self, request: Request):
+        """(content-encoding or None, path, stat, etag) best suited to the request."""
+        # Byte ranges always address the plain file; players never ask for compressed audio anyway
+        if self.variants and "range" not in request.headers:
+            accepted = accepted_encodings(request)
+            for encoding, _ in PRECOMPRESSED:
+                if encoding in self.variants and encoding in accepted:
+                    return (encoding, *self.variants[encoding])
+        return None, self.path, self.stat_result, self.etag
+
+
+class AssetIndex:
+    """
+    In-memory map of the built frontend (URL path -> StaticAsset), built once
+    at startup so serving a page or an asset never touches the filesystem
+    except to stream the bytes. Rebuild by restarting after a deploy.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files = {}
+        variant_suffixes = tuple(suffix for _, suffix in PRECOMPRESSED)
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name.endswith(variant_suffixes) and os.path.isfile(path[:path.rindex(".")]): continue
+                url_path = os.path.relpath(path, root).replace(os.sep, "/")
+                immutable = url_path.startswith("assets/")
+                self.files[url_path] = StaticAsset(path, IMMUTABLE_CACHE_CONTROL if immutable else PAGE_CACHE_CONTROL)
+        self.index_page = self.files.get("index.html")
+        compressed = sum(1 for asset in self.files.values() if asset.variants)
+        print(f"📦 Frontend index: {len(self.files)} files ({compressed} precompressed)")
+
+    def lookup(self, url_path: str):
+        return self.files.get(url_path)
+
+    def serve(self, request: Request, url_path: str):
+        """The file at url_path, or index.html for client-side routes. None means 404."""
+        asset = self.lookup(url_path)
+        if asset is None:
+            # Unknown bundle files are real 404s; anything else is a client-side route
+            if url_path.startswith("assets/") or self.index_page is None: return None
+            asset = self.index_page
+        return asset_response(request, asset)
+
+
+def asset_response(request: Request, asset: StaticAsset):
+    encoding, path, stat_result, etag = asset.representation(request)
+    headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+    if asset.variants:
+        headers["Vary"] = "Accept-Encoding"
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path, headers=headers, media_type=asset.media_type, stat_result=stat_result)
+
+
+def file_response(request: Request, path: str, cache_control: str):
+    """
+    Serves a file from disk with one stat: strong ETag, 304 on a matching
+    If-None-Match, and Range/If-Range handled by FileResponse (206 partials
+    for seeking audio players). Returns None if there is no such file.
+    """
+    try:
+        stat_result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not stat.S_ISREG(stat_result.st_mode): return None
+
+    etag = _stat_etag(stat_result)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers, stat_result=stat_result)
@@ -1,3 +1,8 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,21 +11,95 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from . import database, models
+from .ratelimit import SlidingWindowLimiter, too_many_requests
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "music_tutor_secret_key_change_me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Authenticated requests resolve the user from the token's "uid" claim plus this
+# cache; the users table is only read on a miss. Call invalidate_user() whenever
+# a user row is created, changed or removed so this process sees it at once;
+# other processes (and rows edited by hand) catch up within USER_CACHE_TTL seconds.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 300))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 4096))
+_user_cache = OrderedDict()   # user id -> (expires_at, AuthUser)
+_user_cache_lock = threading.Lock()
+
+# --- PASSWORD HASHING ---
+# bcrypt cost factor (each +1 doubles the work). Stored hashes below it are
+# upgraded the next time their owner logs in successfully.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# bcrypt runs on its own small pool so a burst of logins can't take every
+# core away from analysis; requests beyond the queue limit get a 503.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", 64))
+# Per client IP, failed logins/registrations and successful ones are limited
+# separately: a whole class behind one NAT signs in at once, so successes get
+# a far larger budget than guesses. Failed logins are also limited per username.
+AUTH_FAILURES_PER_IP = int(os.getenv("AUTH_FAILURES_PER_IP", 30))
+AUTH_SUCCESSES_PER_IP = int(os.getenv("AUTH_SUCCESSES_PER_IP", 600))
+AUTH_IP_WINDOW = float(os.getenv("AUTH_IP_WINDOW", 60))
+LOGIN_FAILURES_PER_USER = int(os.getenv("LOGIN_FAILURES_PER_USER", 5))
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", 300))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+_hash_pool = ThreadPoolExecutor(max_workers=max(1, PASSWORD_HASH_WORKERS), thread_name_prefix="bcrypt")
+_hash_pending = 0  # only touched from the event loop thread
+
+ip_failure_limiter = SlidingWindowLimiter(AUTH_FAILURES_PER_IP, AUTH_IP_WINDOW)
+ip_success_limiter = SlidingWindowLimiter(AUTH_SUCCESSES_PER_IP, AUTH_IP_WINDOW)
+login_failure_limiter = SlidingWindowLimiter(LOGIN_FAILURES_PER_USER, LOGIN_FAILURE_WINDOW)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token") # Updated URL path
 
+def check_ip(ip):
+    """Raises 429 while an IP is out of either budget; callers record the outcome once it is known."""
+    wait = max(ip_failure_limiter.retry_after(ip), ip_success_limiter.retry_after(ip))
+    if wait > 0:
+        raise too_many_requests(wait)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _verify_and_update(password, hashed_password):
+    if hashed_password is None:
+        # Unknown user: spend the same time as a real check so usernames can't be probed by latency
+        pwd_context.dummy_verify()
+        return False, None
+    return pwd_context.verify_and_update(password, hashed_password)
+
+async def _run_hash(fn, *args):
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ins at once, please retry shortly",
+            headers={"Retry-After": "2"},
+        )
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_pool, fn, *args)
+    finally:
+        _hash_pending -= 1
+
+async def hash_password_async(password):
+    return await _run_hash(get_password_hash, password)
+
+async def verify_password_async(password, hashed_password):
+    """
+    (valid, new_hash) from the bcrypt pool. new_hash is set when the stored
+    hash is weaker than the current settings and should replace it.
+    hashed_password=None (no such user) still costs one full verification.
+    """
+    return await _run_hash(_verify_and_update, password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -30,6 +109,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_user_token(user: models.User, expires_delta: Optional[timedelta] = None):
+    """Access token carrying everything authorization needs, so requests skip the users table."""
+    return create_access_token(data={"sub": user.username, "uid": user.id}, expires_delta=expires_delta)
+
 def get_db():
     db = database.SessionLocal()
     try:
@@ -37,7 +120,45 @@ def get_db():
     finally:
         db.close()
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+class AuthUser:
+    """The authenticated user as endpoints see it; a plain object, safe to share across requests."""
+    __slots__ = ("id", "username")
+
+    def __init__(self, id: int, username: str):
+        self.id = id
+        self.username = username
+
+def _cached_user(user_id):
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is None: return None
+        if entry[0] < time.monotonic():
+            del _user_cache[user_id]
+            return None
+        _user_cache.move_to_end(user_id)
+        return entry[1]
+
+def _remember_user(user: AuthUser):
+    with _user_cache_lock:
+        _user_cache[user.id] = (time.monotonic() + USER_CACHE_TTL, user)
+        _user_cache.move_to_end(user.id)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+
+def invalidate_user(user_id: int = None):
+    """Drops one user (or everyone, with no id) from the cache."""
+    with _user_cache_lock:
+        if user_id is None: _user_cache.clear()
+        else: _user_cache.pop(user_id, None)
+
+def _load_user(db: Session, user_id=None, username=None):
+    query = db.query(models.User.id, models.User.username)
+    row = query.filter(models.User.id == user_id).first() if user_id is not None \
+        else query.filter(models.User.username == username).first()
+    return AuthUser(row.id, row.username) if row else None
+
+def get_user_from_token(token: str, db: Session = None):
+    """Shared by HTTP dependencies and WebSocket handshakes (which can't use OAuth2 headers)."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -46,12 +167,29 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
+        user_id = payload.get("uid")  # absent from tokens issued before it was added
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.username == username).first()
+
+    user = _cached_user(user_id) if user_id is not None else None
     if user is None:
+        own_session = db is None
+        if own_session: db = database.SessionLocal()
+        try:
+            user = _load_user(db, user_id, username)
+        finally:
+            if own_session: db.close()
+        # A recycled id must never authenticate a token issued to someone else
+        if user is None or user.username != username:
+            raise credentials_exception
+        _remember_user(user)
+    elif user.username != username:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    # No session dependency: a cache hit never touches the database. Sync on
+    # purpose: FastAPI runs it in the threadpool, so a cache miss's query never blocks the event loop.
+    return get_user_from_token(token)
@@ -1,13 +1,57 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
-# This creates a local SQLite file named 'music_tutor.db'
-SQLALCHEMY_DATABASE_URL = "sqlite:///./music_tutor.db"
+import config
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Defaults to a local SQLite file named 'music_tutor.db' (see config.py)
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def make_engine(url=SQLALCHEMY_DATABASE_URL):
+    if not url.startswith("sqlite"):
+        # Server databases: a real pool, checked before use so restarts/idle timeouts don't surface as errors
+        return create_engine(
+            url,
+            echo=config.DB_ECHO,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+
+    connect_args = {"check_same_thread": False, "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        # One shared connection, or every session would see its own empty database
+        engine = create_engine(url, echo=config.DB_ECHO, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        # Connections are cheap, but reusing them keeps the page cache and mmap warm
+        engine = create_engine(
+            url,
+            echo=config.DB_ECHO,
+            connect_args=connect_args,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+        )
+    event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
+
+# --- EXECUTOR SETTINGS ---
+# "process" runs analysis in worker processes (scales with cores),
+# "thread" keeps it in-process (handy for debugging and tests).
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "process")
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", os.cpu_count() or 1))
+# Max jobs running + waiting before new requests are turned away with a 503
+ANALYSIS_QUEUE_LIMIT = int(os.getenv("ANALYSIS_QUEUE_LIMIT", ANALYSIS_WORKERS * 4))
+ANALYSIS_RETRY_AFTER = int(os.getenv("ANALYSIS_RETRY_AFTER", 5))
+
+
+def warm_worker():
+    """
+    Runs once per worker (the analysis tier): import the heavy stack that the
+    API process defers, and JIT-compile pyin up front.
+    """
+    import numpy as np
+    import librosa.display  # noqa: F401  (librosa core + scipy)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot  # noqa: F401  (heatmaps)
+    from . import pipeline, report_pdf  # noqa: F401
+    from .analysis import AudioAnalysis, TARGET_SR
+    from .database import engine
+
+    # Connections inherited from the parent process must not be reused after fork
+    engine.dispose(close=False)
+
+    # A short noise burst is enough to trigger numba compilation inside pyin
+    AudioAnalysis(np.random.default_rng(0).standard_normal(TARGET_SR // 4).astype(np.float32) * 0.01)
+
+
+def _noop():
+    return None
+
+
+def _process_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, initializer=warm_worker)
+
+def _thread_pool(workers):
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+
+# Register additional pool factories here to plug in another backend
+EXECUTOR_BACKENDS = {
+    "process": _process_pool,
+    "thread": _thread_pool,
+}
+
+
+class AnalysisExecutor:
+    """
+    Runs CPU-bound pipeline functions off the event loop with bounded back-pressure.
+    Only call run() from the event loop thread; the pending counter relies on it.
+    """
+
+    def __init__(self, backend=ANALYSIS_EXECUTOR, workers=ANALYSIS_WORKERS, queue_limit=ANALYSIS_QUEUE_LIMIT):
+        if backend not in EXECUTOR_BACKENDS:
+            raise ValueError(f"Unknown analysis executor '{backend}'. Options: {', '.join(EXECUTOR_BACKENDS)}")
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.queue_limit = max(1, queue_limit)
+        self._pool = None
+        self._pending = 0
+
+    def start(self):
+        if self._pool is None:
+            self._pool = EXECUTOR_BACKENDS[self.backend](self.workers)
+            # Pools spawn workers lazily; touch each slot so warm-up happens now, not on the first upload
+            for _ in range(self.workers):
+                self._pool.submit(_noop)
+            print(f"⚙️ Analysis executor: {self.backend} x{self.workers} (queue limit {self.queue_limit})")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def pending(self):
+        return self._pending
+
+    async def run(self, fn, *args, **kwargs):
+        if self._pending >= self.queue_limit:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Analysis queue is full, please retry shortly",
+                headers={"Retry-After": str(ANALYSIS_RETRY_AFTER)},
+            )
+        self.start()
+        self._pending += 1
+        try:
+            # run_in_executor takes no keyword arguments; a partial of a module-level function still pickles
+            call = functools.partial(fn, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+        finally:
+            self._pending -= 1
+
+
+executor = AnalysisExecutor()
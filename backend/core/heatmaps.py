@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+
+from .analysis import TARGET_SR, HOP_LENGTH
+from .feedback import render_heatmap_png
+from . import archive
+
+# Chroma heatmaps of archived attempts, rendered the first time the dashboard
+# or a report asks for one. The recording never changes, so neither does the
+# image: entries are keyed by History id and never invalidated.
+HEATMAP_DIR = "storage/heatmaps"
+
+
+def heatmap_cache_path(history_id: int) -> str:
+    return os.path.join(HEATMAP_DIR, f"{history_id}.png")
+
+
+def render_history_heatmap(history_id: int, audio_filename: str):
+    """Worker-side: renders the heatmap of one archived recording into the cache. Returns the path or None."""
+    path = heatmap_cache_path(history_id)
+    if os.path.exists(path): return path
+
+    if not audio_filename: return None
+    try:
+        y = archive.load_samples(audio_filename)
+        if y is None: return None
+        import librosa  # only processes that render heatmaps pay for it
+        chroma = librosa.feature.chroma_cqt(y=np.asarray(y), sr=TARGET_SR, hop_length=HOP_LENGTH)
+        png = render_heatmap_png(chroma, TARGET_SR, HOP_LENGTH)
+    except Exception as e:
+        print(f"❌ Heatmap for attempt {history_id} failed: {e}")
+        return None
+
+    os.makedirs(HEATMAP_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(png)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,190 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import zlib
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+HISTORY_DIR = "storage/history"
+ANALYSIS_COMPRESSION_LEVEL = int(os.getenv("ANALYSIS_COMPRESSION_LEVEL", 6))
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Columns the history list needs; the stored analysis is only read by attempt_detail()
+SUMMARY_COLUMNS = (
+    models.History.id,
+    models.History.score,
+    models.History.date,
+    models.History.feedback_summary,
+    models.History.audio_filename,
+    models.History.lesson_id,
+)
+
+
+# Everything load_analysis() needs to rebuild a stored result
+ANALYSIS_COLUMNS = (
+    models.History.analysis_blob,
+    models.History.teacher_snapshot_hash,
+    models.History.analysis_data,
+)
+
+
+def new_archive_filename(user_id: int, file_extension: str) -> str:
+    return f"{user_id}_{uuid.uuid4()}{file_extension or '.wav'}"
+
+
+def save_attempt(db: Session, user_id: int, audio_path: str, full_response: dict, archived_filename: str = None) -> models.History:
+    """
+    Records the analysis result. Pass archived_filename when the upload was
+    already written to storage/history during ingest; otherwise it is copied.
+    """
+    unique_filename = archived_filename
+    if unique_filename is None:
+        unique_filename = new_archive_filename(user_id, os.path.splitext(audio_path)[1])
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+        shutil.copy(audio_path, os.path.join(HISTORY_DIR, unique_filename))
+
+    feedback = full_response["feedback"]
+    packed = pack_analysis(full_response)
+    for retry in (False, True):
+        try:
+            new_attempt = models.History(
+                score=feedback['score'],
+                feedback_summary=feedback['comments'][0],
+                audio_filename=unique_filename,
+                user_id=user_id,
+                lesson_id=full_response.get("lesson_id"),
+                **analysis_columns(db, packed)
+            )
+            db.add(new_attempt)
+            db.commit()
+            return new_attempt
+        except IntegrityError:
+            # Another writer stored the same teacher snapshot first; it exists now
+            db.rollback()
+            if retry: raise
+
+
+# --- ANALYSIS STORAGE ---
+# Results are stored as compact, zlib-compressed JSON without their teacher
+# snapshot. Snapshots (reference notes + MusicXML) are identical for every
+# attempt against the same reference, so they live once per content hash in
+# teacher_snapshots and are spliced back in on read.
+def _compress(data: bytes) -> bytes:
+    return zlib.compress(data, ANALYSIS_COMPRESSION_LEVEL)
+
+
+def pack_analysis(full_response: dict):
+    """(analysis_blob, snapshot_hash, snapshot_blob); pure, so workers can do it."""
+    body = {k: v for k, v in full_response.items() if k != "teacher_data"}
+    blob = _compress(json.dumps(body, separators=(",", ":")).encode())
+    teacher = full_response.get("teacher_data")
+    if teacher is None:
+        return blob, None, None
+    canonical = json.dumps(teacher, separators=(",", ":"), sort_keys=True).encode()
+    return blob, hashlib.sha256(canonical).hexdigest(), _compress(canonical)
+
+
+def analysis_columns(db: Session, packed) -> dict:
+    """History column values for a packed result; adds its snapshot if new (caller commits)."""
+    blob, snapshot_hash, snapshot_blob = packed
+    if snapshot_hash is not None and db.get(models.TeacherSnapshot, snapshot_hash) is None:
+        db.add(models.TeacherSnapshot(hash=snapshot_hash, data=snapshot_blob))
+        db.flush()
+    return {"analysis_blob": blob, "teacher_snapshot_hash": snapshot_hash, "analysis_data": None}
+
+
+def analysis_json(db: Session, row, with_teacher=True) -> bytes:
+    """
+    The stored result as JSON bytes, exactly what the API returns. row is a
+    History object or any row with ANALYSIS_COLUMNS; legacy text is passed through.
+    with_teacher=False skips the snapshot lookup for callers that don't need it.
+    """
+    if row.analysis_blob is None:
+        return row.analysis_data.encode() if row.analysis_data else None
+    body = zlib.decompress(row.analysis_blob)
+    if row.teacher_snapshot_hash is None or not with_teacher:
+        return body
+    snapshot = db.query(models.TeacherSnapshot.data).filter(models.TeacherSnapshot.hash == row.teacher_snapshot_hash).scalar()
+    teacher = zlib.decompress(snapshot) if snapshot is not None else b"null"
+    # body is a non-empty JSON object: re-open it and append the shared snapshot
+    return body[:-1] + b',"teacher_data":' + teacher + b"}"
+
+
+def load_analysis(db: Session, row, with_teacher=True):
+    data = analysis_json(db, row, with_teacher)
+    return json.loads(data) if data is not None else None
+
+
+def compact_legacy_rows(db: Session, batch_size: int = 200):
+    """Moves rows still holding plain-text analysis_data to the packed format. Returns rows converted."""
+    converted, last_id = 0, 0
+    while True:
+        rows = db.query(models.History.id, models.History.analysis_data) \
+            .filter(models.History.id > last_id, models.History.analysis_blob.is_(None),
+                    models.History.analysis_data.isnot(None)) \
+            .order_by(models.History.id).limit(batch_size).all()
+        if not rows: return converted
+        last_id = rows[-1].id
+        updates = []
+        for row_id, analysis_data in rows:
+            try: full_response = json.loads(analysis_data)
+            except ValueError: continue  # unreadable either way; left untouched
+            if isinstance(full_response, dict) and full_response:
+                updates.append({"id": row_id, **analysis_columns(db, pack_analysis(full_response))})
+        if updates:
+            db.execute(update(models.History), updates)
+        db.commit()
+        converted += len(updates)
+        print(f"🗜️ Compacted {converted} attempts")
+
+
+# --- HISTORY LISTING ---
+def encode_cursor(date: datetime, history_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{date.isoformat()}|{history_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        date, history_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date), int(history_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def history_page(db: Session, user_id: int, limit: int = HISTORY_PAGE_SIZE, cursor: str = None):
+    """
+    Newest-first page of attempt summaries. Keyset pagination on (date, id)
+    walks ix_history_user_date, so every page costs the same however long
+    the history is. Pass the returned next_cursor to get the following page.
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    # date is set on insert; an undated row could not be placed in the keyset order
+    query = db.query(*SUMMARY_COLUMNS).filter(models.History.user_id == user_id, models.History.date.isnot(None))
+    if cursor:
+        query = query.filter(tuple_(models.History.date, models.History.id) < decode_cursor(cursor))
+    # One extra row tells us whether another page exists
+    rows = query.order_by(models.History.date.desc(), models.History.id.desc()).limit(limit + 1).all()
+
+    items = [row._asdict() for row in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1].date, rows[limit - 1].id) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def attempt_detail(db: Session, user_id: int, history_id: int) -> bytes:
+    """The stored analysis JSON for one of the user's attempts (decompressed, never re-encoded)."""
+    row = db.query(*ANALYSIS_COLUMNS) \
+        .filter(models.History.id == history_id, models.History.user_id == user_id).first()
+    data = analysis_json(db, row) if row is not None else None
+    if data is None:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+    return data
@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import os
+import shutil
+from fastapi import UploadFile
+
+from .analysis import TARGET_SR
+
+# Bytes pulled from the upload per step; peak memory stays at one chunk
+INGEST_CHUNK_SIZE = 256 * 1024
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+
+
+class IngestResult:
+    def __init__(self, paths, pcm_path, size, content_hash):
+        self.paths = paths            # every sink the raw upload was written to
+        self.pcm_path = pcm_path      # decoded 16 kHz mono float32, or None if decode fell back
+        self.size = size
+        self.content_hash = content_hash
+
+
+def pcm_path_for(audio_path: str) -> str:
+    return os.path.splitext(audio_path)[0] + ".f32"
+
+
+async def _start_decoder(pcm_path):
+    """ffmpeg reading the upload from stdin and writing raw PCM as bytes arrive."""
+    if not shutil.which(FFMPEG_BIN):
+        return None
+    try:
+        return await asyncio.create_subprocess_exec(
+            FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y",
+            "-i", "pipe:0",
+            "-ac", "1", "-ar", str(TARGET_SR), "-f", "f32le", pcm_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except OSError:
+        return None
+
+
+async def ingest_upload(upload: UploadFile, sink_paths, pcm_path=None) -> IngestResult:
+    """
+    Single pass over the upload: every chunk is hashed, written to each sink
+    (e.g. the working copy and the history archive) and piped to ffmpeg, so
+    decoding overlaps the transfer instead of starting after it.
+    Containers ffmpeg can't read from a pipe (e.g. mp4 with a trailing moov
+    atom) simply leave pcm_path unset and analysis falls back to librosa.load.
+    """
+    decoder = await _start_decoder(pcm_path) if pcm_path else None
+    decoder_ok = decoder is not None
+    digest = hashlib.sha256()
+    size = 0
+    sinks = [open(path, "wb") for path in sink_paths]
+    try:
+        while True:
+            chunk = await upload.read(INGEST_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            digest.update(chunk)
+            for sink in sinks:
+                sink.write(chunk)
+            if decoder_ok:
+                try:
+                    decoder.stdin.write(chunk)
+                    await decoder.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    decoder_ok = False  # ffmpeg gave up on this container
+        if decoder_ok:
+            decoder.stdin.close()
+            decoder_ok = (await decoder.wait()) == 0
+    finally:
+        for sink in sinks:
+            sink.close()
+        if decoder is not None and decoder.returncode is None:
+            decoder.kill()
+            await decoder.wait()
+
+    if not decoder_ok and pcm_path:
+        try: os.remove(pcm_path)
+        except OSError: pass
+
+    return IngestResult(list(sink_paths), pcm_path if decoder_ok else None, size, digest.hexdigest())
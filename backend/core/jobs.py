@@ -0,0 +1,240 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import update
+
+from . import database, models, pipeline, history, archive
+from .ingest import pcm_path_for
+
+# --- JOB SETTINGS ---
+# "inline": the API process dispatches jobs to its own executor.
+# "external": jobs are only picked up by a separate `python worker.py` process.
+JOB_RUNNER = os.getenv("JOB_RUNNER", "inline")
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", 200))
+# A job stuck in "running" this long is assumed orphaned by a crash/restart
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 15 * 60))
+# How often a running dispatcher looks for such jobs (workers can die at any time, not just at startup)
+JOB_REQUEUE_INTERVAL = float(os.getenv("JOB_REQUEUE_INTERVAL", 60))
+JOB_UPLOAD_DIR = "storage/jobs"
+
+FINISHED_STATUSES = ("done", "failed")
+
+# Set when a job is submitted so an in-process dispatcher reacts immediately
+_wakeup = None
+
+
+def _wakeup_event():
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def create_job(db, user_id: int, file_extension: str, lesson_id: int = None, estimator: str = None):
+    """Creates a queued job row. The caller writes the upload to job.audio_path."""
+    queued = db.query(models.AnalysisJob).filter(models.AnalysisJob.status == "queued").count()
+    if queued >= JOB_QUEUE_LIMIT:
+        raise HTTPException(status_code=503, detail="Too many queued jobs, please retry shortly",
+                            headers={"Retry-After": str(int(JOB_POLL_INTERVAL * 10))})
+
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    job_id = str(uuid.uuid4())
+    job = models.AnalysisJob(
+        id=job_id,
+        status="queued",
+        stage="uploading",
+        audio_path=os.path.join(JOB_UPLOAD_DIR, f"{job_id}{file_extension}"),
+        user_id=user_id,
+        lesson_id=lesson_id,
+        estimator=estimator
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def enqueue(db, job: models.AnalysisJob):
+    """Marks an uploaded job as ready for a dispatcher to claim and returns its status (blocking)."""
+    job.stage = "queued"
+    db.commit()
+    return job_status(job)
+
+
+def wake_dispatcher():
+    """Lets an in-process dispatcher claim new work right away. Event loop thread only."""
+    _wakeup_event().set()
+
+
+def _remove_uploads(audio_path):
+    for path in (audio_path, pcm_path_for(audio_path)):
+        try: os.remove(path)
+        except OSError: pass
+
+
+def fail_upload(db, job: models.AnalysisJob, error: str):
+    """Marks a job whose upload never completed as failed and drops whatever was written."""
+    job.status, job.stage, job.error = "failed", "failed", error
+    db.commit()
+    _remove_uploads(job.audio_path)
+
+
+def job_status(job: models.AnalysisJob):
+    return {
+        "id": job.id,
+        "status": job.status,
+        "stage": job.stage,
+        "error": job.error,
+        "history_id": job.history_id,
+        "lesson_id": job.lesson_id,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+def _set_fields(job_id, **fields):
+    db = database.SessionLocal()
+    try:
+        fields["updated_at"] = datetime.utcnow()
+        db.execute(update(models.AnalysisJob).where(models.AnalysisJob.id == job_id).values(**fields))
+        db.commit()
+    finally:
+        db.close()
+
+
+def claim_next_job():
+    """Atomically moves the oldest ready job to "running". Safe across processes."""
+    db = database.SessionLocal()
+    try:
+        candidates = (
+            db.query(models.AnalysisJob.id)
+            .filter(models.AnalysisJob.status == "queued", models.AnalysisJob.stage == "queued")
+            .order_by(models.AnalysisJob.created_at)
+            .limit(5)
+            .all()
+        )
+        for (job_id,) in candidates:
+            result = db.execute(
+                update(models.AnalysisJob)
+                .where(models.AnalysisJob.id == job_id, models.AnalysisJob.status == "queued")
+                .values(status="running", stage="starting", updated_at=datetime.utcnow())
+            )
+            db.commit()
+            if result.rowcount == 1:
+                return job_id
+        return None
+    finally:
+        db.close()
+
+
+def requeue_stale_jobs():
+    """
+    Puts jobs orphaned by a crashed or restarted worker back in the queue, and
+    fails jobs whose upload was cut off by a crashed API process (they would
+    otherwise count against JOB_QUEUE_LIMIT forever).
+    """
+    db = database.SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        result = db.execute(
+            update(models.AnalysisJob)
+            .where(models.AnalysisJob.status == "running", models.AnalysisJob.updated_at < cutoff)
+            .values(status="queued", stage="queued", updated_at=datetime.utcnow())
+        )
+        db.commit()
+        if result.rowcount:
+            print(f"♻️ Re-queued {result.rowcount} stale analysis job(s)")
+
+        abandoned = (
+            db.query(models.AnalysisJob.id, models.AnalysisJob.audio_path)
+            .filter(models.AnalysisJob.status == "queued", models.AnalysisJob.stage == "uploading",
+                    models.AnalysisJob.updated_at < cutoff)
+            .all()
+        )
+        expired = 0
+        for job_id, audio_path in abandoned:
+            # Guarded on the stage so an upload that just finished is never failed
+            result = db.execute(
+                update(models.AnalysisJob)
+                .where(models.AnalysisJob.id == job_id, models.AnalysisJob.stage == "uploading")
+                .values(status="failed", stage="failed", error="Upload was interrupted", updated_at=datetime.utcnow())
+            )
+            db.commit()
+            if result.rowcount:
+                _remove_uploads(audio_path)
+                expired += 1
+        if expired:
+            print(f"🧹 Expired {expired} interrupted upload(s)")
+    finally:
+        db.close()
+
+
+def run_job(job_id: str):
+    """Worker-side entry point: runs the full analysis and stores it as a History row."""
+    db = database.SessionLocal()
+    audio_path = None
+    try:
+        job = db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job_id).first()
+        if job is None: return
+
+        audio_path = job.audio_path
+        pcm_path = pcm_path_for(audio_path)
+        full_response = pipeline.run_analysis(job.audio_path, job.lesson_id, pcm_path,
+                                              progress=lambda stage: _set_fields(job_id, stage=stage),
+                                              estimator=job.estimator)
+
+        _set_fields(job_id, stage="saving")
+        attempt = history.save_attempt(db, job.user_id, job.audio_path, full_response)
+        _set_fields(job_id, status="done", stage="done", history_id=attempt.id)
+        # Compact playback copy + cached samples; the ingest PCM becomes the cache entry
+        try:
+            archive.archive_attempt(attempt.id, pcm_path)
+        except Exception as e:
+            print(f"⚠️ Archiving attempt {attempt.id} deferred: {e}")
+    except Exception as e:
+        print(f"❌ Job {job_id} failed: {e}")
+        _set_fields(job_id, status="failed", stage="failed", error=str(e))
+    finally:
+        db.close()
+        # Success or failure, the upload is spent (the archive holds its own copy; a retry re-uploads)
+        if audio_path:
+            _remove_uploads(audio_path)
+
+
+async def _run_claimed(executor, job_id):
+    try:
+        await executor.run(run_job, job_id)
+    except HTTPException:
+        # Executor saturated by synchronous requests; back off, then hand the job back
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+        await asyncio.to_thread(_set_fields, job_id, status="queued", stage="queued")
+    except Exception as e:
+        await asyncio.to_thread(_set_fields, job_id, status="failed", stage="failed", error=str(e))
+
+
+async def dispatch_jobs(executor, poll_interval=JOB_POLL_INTERVAL):
+    """Claims queued jobs and feeds them to the executor, never more than it has workers."""
+    wakeup = _wakeup_event()
+    running = set()
+    next_requeue = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        # Database calls run in a thread so a locked SQLite file never stalls the API's event loop
+        if loop.time() >= next_requeue:
+            await asyncio.to_thread(requeue_stale_jobs)
+            next_requeue = loop.time() + JOB_REQUEUE_INTERVAL
+        while len(running) < executor.workers:
+            job_id = await asyncio.to_thread(claim_next_job)
+            if job_id is None: break
+            task = asyncio.create_task(_run_claimed(executor, job_id))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: wakeup.set())  # a slot just freed up
+
+        wakeup.clear()
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=poll_interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,96 @@
+import os
+import uuid
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from . import models, reference_cache
+from .feedback import get_teacher_audio_path, save_reference_melody, REFERENCE_FILE
+
+LESSON_DIR = "storage/lessons"
+ATTEMPT_DIR = "storage/attempts"
+
+
+def new_reference_path(lesson_id: int, file_extension: str) -> str:
+    # Unique per upload, so replacing a reference never touches a file a worker may be reading
+    return os.path.join(LESSON_DIR, f"{lesson_id}_{uuid.uuid4().hex}{file_extension or '.wav'}")
+
+
+def new_attempt_path(file_extension: str) -> str:
+    """Per-request scratch location (no more shared student_attempt.* files)."""
+    return os.path.join(ATTEMPT_DIR, f"{uuid.uuid4().hex}{file_extension or '.wav'}")
+
+
+def lesson_summary(lesson: models.Lesson):
+    return {
+        "id": lesson.id,
+        "title": lesson.title,
+        "owner_id": lesson.owner_id,
+        "created_at": lesson.created_at,
+        "updated_at": lesson.updated_at,
+    }
+
+
+def create_lesson(db: Session, user: models.User, title: str = None) -> models.Lesson:
+    lesson = models.Lesson(title=title or "Untitled lesson", owner_id=user.id)
+    db.add(lesson)
+    db.commit()
+    return lesson
+
+
+def get_owned_lesson(db: Session, lesson_id: int, user: models.User) -> models.Lesson:
+    lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
+    if lesson is None or lesson.owner_id != user.id:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+    return lesson
+
+
+def _import_legacy_lesson(db: Session):
+    """Turns a pre-lesson global teacher_reference.* file into a lesson, once."""
+    teacher_path = get_teacher_audio_path()
+    if not teacher_path: return None
+
+    notes = None
+    if os.path.exists(REFERENCE_FILE):
+        with open(REFERENCE_FILE, "r") as f: notes = f.read()
+    lesson = models.Lesson(title="Reference lesson", audio_path=teacher_path, notes=notes)
+    db.add(lesson)
+    db.commit()
+    return lesson
+
+
+def resolve_lesson(db: Session, user: models.User, lesson_id: int = None):
+    """
+    Explicit lesson_id wins. Otherwise the user's newest lesson, then the
+    newest lesson anyone taught (students practising a teacher's lesson).
+    """
+    if lesson_id is not None:
+        lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
+        if lesson is None:
+            raise HTTPException(status_code=404, detail="Lesson not found")
+        return lesson
+
+    ready = db.query(models.Lesson).filter(models.Lesson.audio_path.isnot(None))
+    lesson = ready.filter(models.Lesson.owner_id == user.id).order_by(models.Lesson.updated_at.desc()).first()
+    if lesson is None:
+        lesson = ready.order_by(models.Lesson.updated_at.desc()).first()
+    if lesson is None and db.query(models.Lesson).count() == 0:
+        lesson = _import_legacy_lesson(db)
+    return lesson
+
+
+def set_reference(db: Session, lesson: models.Lesson, audio_path: str, content_hash: str, notes):
+    """Points a lesson at a new recording and drops the artifacts it replaced."""
+    old_path, old_hash = lesson.audio_path, lesson.content_hash
+    lesson.audio_path = audio_path
+    lesson.content_hash = content_hash
+    save_reference_melody(lesson, notes)
+    db.commit()
+
+    if old_hash and old_hash != content_hash:
+        still_used = db.query(models.Lesson).filter(models.Lesson.content_hash == old_hash).count()
+        if not still_used:
+            reference_cache.invalidate(old_hash)
+    if old_path and old_path != audio_path and old_path.startswith(LESSON_DIR):
+        for path in (old_path, os.path.splitext(old_path)[0] + ".f32"):
+            try: os.remove(path)
+            except OSError: pass
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, LargeBinary, Index, inspect, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -9,6 +9,20 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     attempts = relationship("History", back_populates="owner")
+    lessons = relationship("Lesson", back_populates="owner")
+
+class Lesson(Base):
+    __tablename__ = "lessons"
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String)
+    audio_path = Column(String)                # teacher reference recording
+    content_hash = Column(String, index=True)  # key into core.reference_cache
+    notes = Column(Text)                       # derived reference melody (JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # None = imported legacy reference
+    owner = relationship("User", back_populates="lessons")
 
 class History(Base):
     __tablename__ = "history"
@@ -19,8 +33,59 @@ class History(Base):
     
     # --- NEW FIELDS ---
     audio_filename = Column(String)  # To find the .wav file
-    analysis_data = Column(Text)     # Stores the full JSON result
+    analysis_data = Column(Text)     # Legacy: full JSON result (rows written before analysis_blob)
     # ------------------
+    # Read both through core.history.load_analysis()
+    analysis_blob = Column(LargeBinary, nullable=True)  # compressed result minus teacher_data
+    teacher_snapshot_hash = Column(String, ForeignKey("teacher_snapshots.hash"), nullable=True)
     
     user_id = Column(Integer, ForeignKey("users.id"))
-    owner = relationship("User", back_populates="attempts")
\ No newline at end of file
+    owner = relationship("User", back_populates="attempts")
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=True)  # reference this attempt was scored against
+
+    # Newest-first history pages per user; SQLite appends the rowid (id), so it also covers the (date, id) keyset
+    __table_args__ = (Index("ix_history_user_date", "user_id", "date"),)
+
+class TeacherSnapshot(Base):
+    """Frozen teacher_data shared by every attempt scored against the same reference."""
+    __tablename__ = "teacher_snapshots"
+    hash = Column(String, primary_key=True)  # sha256 of the canonical JSON
+    data = Column(LargeBinary)               # compressed JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+    id = Column(String, primary_key=True, index=True)  # uuid4 string
+    status = Column(String, default="queued", index=True)  # queued | running | done | failed
+    stage = Column(String, default="queued")  # fine-grained progress for polling/streaming
+    audio_path = Column(String)  # per-job upload, consumed by the worker
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user_id = Column(Integer, ForeignKey("users.id"))
+    history_id = Column(Integer, ForeignKey("history.id"), nullable=True)  # result lives on the History row
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=True)
+    estimator = Column(String, nullable=True)  # pitch estimator picked at submit time (None = default)
+
+def sync_schema(engine):
+    """
+    create_all() only creates missing tables. Columns and indexes added to
+    existing tables since a database was created are added here (nullable
+    columns only).
+    """
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as con:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                con.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+        for table in Base.metadata.sorted_tables:
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=con)
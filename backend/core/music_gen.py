@@ -1,108 +1,658 @@
-import matplotlib
-# --- CRITICAL: Set backend to non-interactive 'Agg' before importing pyplot ---
-matplotlib.use('Agg') 
-import matplotlib.pyplot as plt
+import re
+from datetime import date
+from functools import lru_cache
 
-from music21 import stream, note, tempo, meter, metadata
-import tempfile
-import os
+# music21 is only imported by the fallback path below; importing it costs
+# seconds of worker start-up and the common case never needs it.
 
-def generate_musicxml(notes_data):
+# --- NOTATION SETTINGS ---
+BPM = 120                 # 120 BPM = 2 Quarter notes per second
+TIME_SIGNATURE = '4/4'
+# Rendered documents kept in memory, keyed by the quantized events + tempo/meter
+MUSICXML_CACHE_SIZE = 256
+
+# --- NATIVE WRITER SETTINGS ---
+# Divisions per quarter note; same value music21 writes, so both paths agree
+DIVISIONS = 10080
+MEASURE_SIXTEENTHS = 16
+TITLE = "AI Music Tutor Transcription"
+COMPOSER = "User"
+
+# Names the native writer understands: step, optional single sharp/flat, octave
+_PITCH_NAME = re.compile(r'^([A-G])(#|-|b)?(\d)$')
+_ACCIDENTALS = {'#': 'sharp', '-': 'flat', 'b': 'flat'}
+_ALTER = {'sharp': 1, 'flat': -1, 'natural': 0}
+_STEPS = 'CDEFGAB'
+# Cached documents hold this slot instead of a date (a process can outlive the
+# day); generate_musicxml fills it in on every call.
+_ENCODING_DATE_SLOT = '<encoding-date>{today}</encoding-date>'
+_ENCODING_DATE = re.compile(r'<encoding-date>[^<]*</encoding-date>')
+
+# Written (type, dots) for a length in 16ths; lengths with no single value are
+# split into tied components the same way music21 splits "complex" durations
+_NOTATED = {
+    1: (('16th', 0),),
+    2: (('eighth', 0),),
+    3: (('eighth', 1),),
+    4: (('quarter', 0),),
+    5: (('quarter', 0), ('16th', 0)),
+    6: (('quarter', 1),),
+    7: (('quarter', 2),),
+    8: (('half', 0),),
+    9: (('half', 0), ('16th', 0)),
+    10: (('half', 0), ('eighth', 0)),
+    11: (('half', 0), ('eighth', 1)),
+    12: (('half', 1),),
+    13: (('half', 0), ('quarter', 0), ('16th', 0)),
+    14: (('half', 2),),
+    15: (('half', 3),),
+    16: (('whole', 0),),
+}
+# Number of beams each beamable type carries
+_BEAM_LEVELS = {'eighth': 1, '16th': 2}
+_BEAM_XML = {'start': 'begin', 'continue': 'continue', 'stop': 'end',
+             'partial-right': 'forward hook', 'partial-left': 'backward hook'}
+# Clefs music21's bestClef() chooses between: (sign, line, octave change,
+# middle line as a diatonic note number - which decides stem directions)
+_CLEFS = {
+    'treble8va': ('G', 2, 1, 28),
+    'treble': ('G', 2, 0, 35),
+    'bass': ('F', 4, 0, 23),
+    'bass8vb': ('F', 4, -1, 23),
+}
+
+
+@lru_cache(maxsize=1024)
+def _is_valid_pitch(pitch_name):
+    if _PITCH_NAME.match(pitch_name):
+        return True
+    from music21 import pitch
+    try:
+        pitch.Pitch(pitch_name)
+        return True
+    except Exception:
+        return False
+
+def quantize_notes(notes_data, bpm=BPM):
     """
-    Converts a list of note dictionaries into MusicXML string.
-    Uses makeMeasures() to ensure valid sheet music structure.
+    Converts note dicts (seconds) into a tuple of ("rest"|pitch_name, quarterLength)
+    events on a 16th-note grid. This tuple is the cache key for the rendered XML.
     """
-    try:
-        s = stream.Score()
-        p = stream.Part()
-        
-        # 1. Setup Metadata
-        s.insert(0, metadata.Metadata())
-        s.metadata.title = "AI Music Tutor Transcription"
-        s.metadata.composer = "User"
-
-        # 2. Setup Tempo & Time Signature (Insert into Part, let music21 handle measures later)
-        # 120 BPM = 2 Quarter notes per second
-        p.append(meter.TimeSignature('4/4'))
-        p.append(tempo.MetronomeMark(number=120))
-        
-        bpm = 120
-        seconds_per_quarter = 60 / bpm
-        current_position_quarters = 0.0
-        
-        for n_data in notes_data:
-            # --- A. Data Retrieval ---
-            pitch_name = n_data.get("name", "C4")
-            # Safety replacement for symbols
-            pitch_name = pitch_name.replace('♯', '#').replace('♭', 'b')
-            
-            start_sec = n_data.get("start", 0.0)
-            duration_sec = n_data.get("duration", 1.0)
-            
-            # --- B. Timing Calculation ---
-            # Convert Seconds -> Quarter Notes
-            # Formula: time / seconds_per_quarter
-            note_start_quarters = start_sec / seconds_per_quarter
-            note_dur_quarters = duration_sec / seconds_per_quarter
-            
-            # Quantize duration to nearest 16th note (0.25)
-            # We enforce a minimum duration of 0.25 so notes are visible
-            q_duration = max(0.25, round(note_dur_quarters * 4) / 4)
-            
-            # --- C. Handle Rests (Gaps) ---
-            # If the note starts significantly later than our current cursor, insert a Rest
-            gap = note_start_quarters - current_position_quarters
-            
-            # If gap is larger than a 32nd note (0.125), add a rest
-            if gap > 0.125:
-                r = note.Rest()
-                # Quantize the rest too
-                r_dur = round(gap * 4) / 4
-                if r_dur > 0:
-                    r.quarterLength = r_dur
-                    p.append(r)
-                    current_position_quarters += r_dur
-            
-            # --- D. Create Note ---
-            try:
-                n = note.Note(pitch_name)
-                n.quarterLength = q_duration
-                p.append(n)
-                
-                # Advance cursor
-                current_position_quarters += q_duration
-                
-                # Sync cursor to actual start time + duration to prevent drift
-                # (Optional, but helps keep alignment with audio)
-                current_position_quarters = max(current_position_quarters, note_start_quarters + q_duration)
-
-            except Exception as e:
-                print(f"Skipping invalid note: {pitch_name} - Error: {e}")
+    seconds_per_quarter = 60 / bpm
+    current_position_quarters = 0.0
+    events = []
+
+    for n_data in notes_data:
+        # --- A. Data Retrieval ---
+        pitch_name = n_data.get("name", "C4")
+        # Safety replacement for symbols
+        pitch_name = pitch_name.replace('♯', '#').replace('♭', 'b')
+
+        start_sec = n_data.get("start", 0.0)
+        duration_sec = n_data.get("duration", 1.0)
+
+        # --- B. Timing Calculation ---
+        # Convert Seconds -> Quarter Notes
+        # Formula: time / seconds_per_quarter
+        note_start_quarters = start_sec / seconds_per_quarter
+        note_dur_quarters = duration_sec / seconds_per_quarter
+
+        # Quantize duration to nearest 16th note (0.25)
+        # We enforce a minimum duration of 0.25 so notes are visible
+        q_duration = max(0.25, round(note_dur_quarters * 4) / 4)
+
+        # --- C. Handle Rests (Gaps) ---
+        # If the note starts significantly later than our current cursor, insert a Rest
+        gap = note_start_quarters - current_position_quarters
+
+        # If gap is larger than a 32nd note (0.125), add a rest
+        if gap > 0.125:
+            # Quantize the rest too
+            r_dur = round(gap * 4) / 4
+            if r_dur > 0:
+                events.append(("rest", r_dur))
+                current_position_quarters += r_dur
+
+        # --- D. Note ---
+        if not _is_valid_pitch(pitch_name):
+            print(f"Skipping invalid note: {pitch_name}")
+            continue
+        events.append((pitch_name, q_duration))
+
+        # Advance cursor
+        current_position_quarters += q_duration
+
+        # Sync cursor to actual start time + duration to prevent drift
+        # (Optional, but helps keep alignment with audio)
+        current_position_quarters = max(current_position_quarters, note_start_quarters + q_duration)
+
+    return tuple(events)
+
+
+# --- NATIVE WRITER ---
+# Covers what the pipeline produces: one monophonic part in 4/4, 16th grid,
+# plain naturals/sharps/flats. Notation follows what music21's makeNotation()
+# does for the same input (barline ties, accidentals, beams, stems), so the
+# two writers are interchangeable.
+
+class _Pitch:
+    """Mutable accidental state of one sounding note, as makeAccidentals tracks it."""
+    __slots__ = ("step", "octave", "accidental", "display")
+
+    def __init__(self, step, octave, accidental):
+        self.step = step
+        self.octave = octave
+        self.accidental = accidental  # None, 'sharp', 'flat' or 'natural'
+        self.display = None
+
+    @property
+    def name(self):
+        return self.step + {'sharp': '#', 'flat': '-'}.get(self.accidental, '')
+
+    def show(self):
+        # A displayed accidental on a plain note is an explicit natural sign
+        if self.accidental is None:
+            self.accidental = 'natural'
+        self.display = True
+
+
+def _native_supported(events, time_signature):
+    if time_signature != TIME_SIGNATURE or not events:
+        return False
+    for name, quarter_length in events:
+        if quarter_length <= 0 or (quarter_length * 4) != int(quarter_length * 4):
+            return False
+        if name != "rest" and not _PITCH_NAME.match(name):
+            return False
+    return True
+
+
+def _update_accidental(p, past, past_measure):
+    """
+    music21's Pitch.updateAccidentalDisplay() narrowed to the settings used here:
+    no key signature, cautionary accidentals by pitch class, no chords.
+    """
+    acc = p.accidental
+    history = past_measure + past
+    if not history:
+        if acc is not None:
+            p.display = acc != 'natural'
+        return
+
+    for q in reversed(past):
+        if q.step == p.step and q.octave == p.octave:
+            if q.name != p.name:
+                p.show()
+                return
+            break
+
+    from_history = False
+    show_if_unmatched = False
+    name_with_octave = (p.name, p.octave)
+    for i in range(len(history) - 1, -1, -1):
+        q = history[i]
+        in_measure = i >= len(past_measure)
+        repeats = in_measure and all((r.name, r.octave) == name_with_octave for r in history[i:])
+        if not in_measure and acc is not None:
+            p.display = True
+            return
+        if q.step != p.step:
+            continue
+        octave_match = q.octave == p.octave
+        q_acc = q.accidental
+
+        if repeats and q_acc is not None and q.display is True:
+            if acc is not None:
+                p.display = False
+            return
+        elif repeats and q_acc is not None and acc is not None and q_acc == acc:
+            if q.display is False:
+                show_if_unmatched = True
+                continue
+            p.display = False
+            from_history = True
+            break
+        elif q_acc == 'natural' and acc in (None, 'natural'):
+            if acc is not None:
+                p.display = False
+            from_history = True
+            break
+        elif q_acc is not None and q.name != p.name and q_acc != 'natural' and (acc is None or p.display is False):
+            p.show()
+            from_history = True
+            break
+        elif q_acc in (None, 'natural') and acc is not None and acc != 'natural':
+            p.display = True
+            from_history = True
+            break
+        elif q_acc is not None and acc is not None and q_acc != acc:
+            p.display = True
+            from_history = True
+            break
+        elif q_acc is None and acc is not None:
+            p.display = acc != 'natural'
+            from_history = True
+            break
+        elif not repeats and q_acc is not None and acc is not None and q_acc == acc and octave_match:
+            if q.display is False:
+                show_if_unmatched = True
+            else:
+                p.display = True
+                return
+
+    if show_if_unmatched:
+        p.show()
+    elif not from_history and acc is not None:
+        p.display = acc != 'natural'
+
+
+def _beam_measure(items, start_offset):
+    """
+    Beams for one measure, following TimeSignature.getBeams() for 4/4:
+    primary beams group within a quarter, secondary beams within an eighth.
+    items are (offset, length, type, is_note) in 16ths; returns {number: type} or None per item.
+    """
+    beams = [
+        {number: None for number in range(1, _BEAM_LEVELS[kind] + 1)}
+        if is_note and kind in _BEAM_LEVELS else None
+        for _, _, kind, is_note in items
+    ]
+    if len(items) <= 1:
+        return [None] * len(items)
+
+    # A beamable note with nothing beamable on either side stays unbeamed
+    last = None
+    for i in range(len(beams)):
+        following = beams[i + 1] if i + 1 < len(beams) else None
+        if last is None and following is None:
+            beams[i] = None
+        last = beams[i]
+
+    for depth in range(2):
+        number = depth + 1
+        span = 4 if depth == 0 else 2
+        for i, (offset, length, _, _) in enumerate(items):
+            current = beams[i]
+            if current is None or number not in current:
+                continue
+            start = offset + start_offset
+            end = start_next = start + length
+            is_first, is_last = i == 0, i == len(items) - 1
+            following = beams[i + 1] if not is_last else None
+            previous = beams[i - 1] if not is_first else None
+            span_start = (start // span) * span
+            span_end = span_start + span
+            next_span_start = 0 if following is None else (start_next // span) * span
+
+            if end == span_end and (start == span_start or (previous is None and number == 1)):
+                beams[i] = None
                 continue
 
-        # --- E. AUTOMATIC MEASURE CREATION ---
-        # This is the magic function that fixes "Empty Sheet" issues.
-        # It takes the long stream of notes/rests and chops them into 4/4 measures.
-        p.makeMeasures(inPlace=True)
-        s.append(p)
-
-        # 3. Write to Temp File & Read Back
-        with tempfile.NamedTemporaryFile(suffix=".musicxml", delete=False) as tmp:
-            temp_path = tmp.name
-            
-        s.write('musicxml', fp=temp_path)
-        
-        with open(temp_path, 'r', encoding='utf-8') as f:
-            xml_content = f.read()
-            
-        # Cleanup
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
-            
-        return xml_content
+            if is_first and start_offset == 0:
+                kind = 'start'
+                if following is None or number not in following:
+                    kind = 'partial-right'
+            elif is_last:
+                kind = 'stop'
+                if previous is None or number not in previous:
+                    kind = 'partial-left'
+            elif previous is None or number not in previous:
+                if number == 1 and following is None:
+                    beams[i] = None
+                    continue
+                elif following is None and number > 1:
+                    kind = 'partial-left'
+                elif start_next >= span_end:
+                    kind = 'partial-left'
+                elif following is None or number not in following:
+                    kind = 'partial-right'
+                else:
+                    kind = 'start'
+            elif previous[number] in ('stop', 'partial-left'):
+                if following is not None:
+                    kind = 'start' if number in following else 'partial-right'
+                else:
+                    kind = 'partial-left'
+            elif following is None or number not in following:
+                kind = 'stop'
+            elif start_next < span_end:
+                kind = 'continue'
+            elif start_next >= next_span_start:
+                kind = 'stop'
+            current[number] = kind
+
+    # Drop hook-only groups and point hooks inside a group the right way
+    for i, current in enumerate(beams):
+        if current is None:
+            continue
+        if not {'start', 'stop', 'continue'} & set(current.values()):
+            beams[i] = None
+            continue
+        has_start = has_stop = False
+        for number, kind in current.items():
+            if kind == 'start':
+                has_start = True
+            elif kind == 'stop':
+                has_stop = True
+            elif has_start and kind == 'partial-left':
+                current[number] = 'partial-right'
+            elif has_stop and kind == 'partial-right':
+                current[number] = 'partial-left'
+
+    # Join a forward hook to a following backward hook / beam start
+    for current, following in zip(beams[:-1], beams[1:]):
+        if not current or not following:
+            continue
+        for number, kind in current.items():
+            if kind != 'partial-right' or number not in following:
+                continue
+            if following[number] in ('partial-right', 'continue', 'stop'):
+                continue
+            current[number] = 'start'
+            following[number] = {'partial-left': 'stop', 'start': 'continue'}.get(following[number], following[number])
+    for previous, current in zip(beams[:-1], beams[1:]):
+        if not current or not previous:
+            continue
+        for number, kind in current.items():
+            if kind == 'partial-left' and number in previous and previous[number] == 'stop':
+                current[number] = 'stop'
+                previous[number] = 'continue'
+    return beams
+
+
+def _layout(events):
+    """
+    Picks the clef and splits the event stream into measures of notated pieces:
+    dicts with offset/length (16ths), pitch, ties, beams and stem.
+    """
+    # 1. Absolute positions, and the measure each event starts in
+    placed = []
+    position = 0
+    for name, quarter_length in events:
+        length = int(quarter_length * 4)
+        pitch = None
+        if name != "rest":
+            step, accidental, octave = _PITCH_NAME.match(name).groups()
+            pitch = _Pitch(step, int(octave), _ACCIDENTALS.get(accidental))
+        placed.append((position, length, pitch))
+        position += length
+    total = position
+    clef = _best_clef([pitch for _, _, pitch in placed if pitch is not None])
+    n_measures = -(-total // MEASURE_SIXTEENTHS)
+
+    # 2. Accidentals, measure by measure, before any barline splitting
+    starts = [[] for _ in range(n_measures)]
+    for start, _, pitch in placed:
+        if pitch is not None:
+            starts[start // MEASURE_SIXTEENTHS].append(pitch)
+    for index, pitches in enumerate(starts):
+        past_measure = list(starts[index - 1]) if index > 0 else []
+        past = []
+        for pitch in pitches:
+            _update_accidental(pitch, past, past_measure)
+            past.append(pitch)
+
+    # 3. Split at barlines; tied pieces after the first hide their accidental
+    measures = [[] for _ in range(n_measures)]
+    for start, length, pitch in placed:
+        end = start + length
+        cursor = start
+        while cursor < end:
+            barline = (cursor // MEASURE_SIXTEENTHS + 1) * MEASURE_SIXTEENTHS
+            piece_end = min(end, barline)
+            measures[cursor // MEASURE_SIXTEENTHS].append({
+                "offset": cursor % MEASURE_SIXTEENTHS,
+                "length": piece_end - cursor,
+                "pitch": pitch,
+                "show_accidental": pitch is not None and cursor == start and pitch.display is True,
+                "tie_stop": pitch is not None and cursor > start,
+                "tie_start": pitch is not None and piece_end < end,
+            })
+            cursor = piece_end
+
+    # 4. Beams per measure (an incomplete last measure is beamed as if right-aligned)
+    for index, pieces in enumerate(measures):
+        filled = sum(piece["length"] for piece in pieces)
+        start_offset = MEASURE_SIXTEENTHS - filled if filled < MEASURE_SIXTEENTHS else 0
+        items = []
+        for piece in pieces:
+            notated = _NOTATED[piece["length"]]
+            kind = notated[0][0] if len(notated) == 1 else 'complex'
+            items.append((piece["offset"], piece["length"], kind, piece["pitch"] is not None))
+        for piece, beams in zip(pieces, _beam_measure(items, start_offset)):
+            piece["beams"] = beams
+            piece["stem"] = None
+
+        if len(pieces) == 1 and pieces[0]["pitch"] is None and pieces[0]["length"] == MEASURE_SIXTEENTHS:
+            pieces[0]["whole_measure"] = True
+        if index == n_measures - 1 and filled < MEASURE_SIXTEENTHS:
+            pieces.append({"offset": filled, "length": MEASURE_SIXTEENTHS - filled, "pitch": None,
+                           "hidden": True, "beams": None, "stem": None,
+                           "show_accidental": False, "tie_stop": False, "tie_start": False})
+
+    # 5. Stems: one direction per beam group, from its first and last notes
+    mid_line = _CLEFS[clef][3]
+    group, in_group = [], False
+    for piece in (piece for pieces in measures for piece in pieces if piece["pitch"] is not None):
+        primary = piece["beams"][1] if piece["beams"] else None
+        if primary == 'start':
+            in_group = True
+        if in_group:
+            group.append(piece)
+        if primary == 'stop':
+            if group:
+                _set_group_stem(group, mid_line)
+            group, in_group = [], False
+    if group:
+        _set_group_stem(group, mid_line)
+    return clef, measures
+
+
+def _diatonic_number(p):
+    return p.octave * 7 + _STEPS.index(p.step) + 1
+
+
+def _best_clef(pitches):
+    """clef.bestClef(): average height with a bonus for very high / very low notes."""
+    heights = [
+        n + 3 if n > 33 else (n - 3 if n < 24 else n)
+        for n in map(_diatonic_number, pitches)
+    ]
+    average = sum(heights) / len(heights) if heights else 29.0
+    if average > 49:
+        return 'treble8va'
+    if average > 28:
+        return 'treble'
+    if average > 10:
+        return 'bass'
+    return 'bass8vb'
+
 
+def _set_group_stem(group, mid_line):
+    first, last = group[0]["pitch"], group[-1]["pitch"]
+    distance = sum(_diatonic_number(p) - mid_line for p in (first, last))
+    for piece in group:
+        piece["stem"] = 'down' if distance >= 0 else 'up'
+
+
+def _note_xml(out, piece):
+    """Appends the <note> elements for one piece (several when it needs tied components)."""
+    pitch = piece["pitch"]
+    components = _NOTATED[piece["length"]]
+    # Components carry the piece's beams only when it notates as a single value
+    if len(components) > 1:
+        components = [(kind, dots, None) for kind, dots in components]
+    else:
+        components = [(components[0][0], components[0][1], piece["beams"])]
+
+    for i, (kind, dots, beams) in enumerate(components):
+        first, last = i == 0, i == len(components) - 1
+        ql = {'16th': 1, 'eighth': 2, 'quarter': 4, 'half': 8, 'whole': 16}[kind]
+        length = ql * (2 - 0.5 ** dots)
+        ties = []
+        if pitch is not None:
+            if piece["tie_stop"] or not first:
+                ties.append('stop')
+            if piece["tie_start"] or not last:
+                ties.append('start')
+
+        out.append('      <note print-object="no" print-spacing="yes">' if piece.get("hidden") else '      <note>')
+        if pitch is None and piece.get("whole_measure"):
+            # Bar rest: centred by the renderer, so no written type
+            out.append('        <rest measure="yes" />')
+            out.append(f'        <duration>{MEASURE_SIXTEENTHS * DIVISIONS // 4}</duration>')
+            out.append('      </note>')
+            continue
+        if pitch is None:
+            out.append('        <rest />')
+        else:
+            out.append('        <pitch>')
+            out.append(f'          <step>{pitch.step}</step>')
+            if pitch.accidental is not None:
+                out.append(f'          <alter>{_ALTER[pitch.accidental]}</alter>')
+            out.append(f'          <octave>{pitch.octave}</octave>')
+            out.append('        </pitch>')
+        out.append(f'        <duration>{int(length * DIVISIONS) // 4}</duration>')
+        for tie in ties:
+            out.append(f'        <tie type="{tie}" />')
+        out.append(f'        <type>{kind}</type>')
+        out.extend('        <dot />' for _ in range(dots))
+        if first and piece["show_accidental"]:
+            out.append(f'        <accidental>{pitch.accidental}</accidental>')
+        if piece["stem"]:
+            out.append(f'        <stem>{piece["stem"]}</stem>')
+        for number, beam_type in (beams or {}).items():
+            out.append(f'        <beam number="{number}">{_BEAM_XML[beam_type]}</beam>')
+        if ties:
+            out.append('        <notations>')
+            out.extend(f'          <tied type="{tie}" />' for tie in ties)
+            out.append('        </notations>')
+        out.append('      </note>')
+
+
+def _write_musicxml(events, bpm):
+    """Direct string emitter for the common case; no music21 objects involved."""
+    out = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<!DOCTYPE score-partwise  PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" '
+        '"http://www.musicxml.org/dtds/partwise.dtd">',
+        '<score-partwise version="4.0">',
+        '  <work>',
+        f'    <work-title>{TITLE}</work-title>',
+        '  </work>',
+        f'  <movement-title>{TITLE}</movement-title>',
+        '  <identification>',
+        f'    <creator type="composer">{COMPOSER}</creator>',
+        '    <encoding>',
+        f'      {_ENCODING_DATE_SLOT}',
+        '      <supports element="beam" type="yes" />',
+        '      <supports element="stem" type="yes" />',
+        '      <supports element="accidental" type="yes" />',
+        '    </encoding>',
+        '  </identification>',
+        '  <defaults>',
+        '    <scaling>',
+        '      <millimeters>7</millimeters>',
+        '      <tenths>40</tenths>',
+        '    </scaling>',
+        '  </defaults>',
+        '  <part-list>',
+        '    <score-part id="P1">',
+        '      <part-name />',
+        '    </score-part>',
+        '  </part-list>',
+        '  <part id="P1">',
+    ]
+    clef, measures = _layout(events)
+    sign, line, octave_change, _ = _CLEFS[clef]
+    for index, pieces in enumerate(measures):
+        out.append(f'    <measure implicit="no" number="{index + 1}">')
+        if index == 0:
+            out.extend([
+                '      <attributes>',
+                f'        <divisions>{DIVISIONS}</divisions>',
+                '        <time>',
+                '          <beats>4</beats>',
+                '          <beat-type>4</beat-type>',
+                '        </time>',
+                '        <clef>',
+                f'          <sign>{sign}</sign>',
+                f'          <line>{line}</line>',
+            ])
+            if octave_change:
+                out.append(f'          <clef-octave-change>{octave_change}</clef-octave-change>')
+            out.extend([
+                '        </clef>',
+                '      </attributes>',
+                '      <direction>',
+                '        <direction-type>',
+                '          <metronome parentheses="no">',
+                '            <beat-unit>quarter</beat-unit>',
+                f'            <per-minute>{bpm:g}</per-minute>',
+                '          </metronome>',
+                '        </direction-type>',
+                f'        <sound tempo="{bpm:g}" />',
+                '      </direction>',
+            ])
+        for piece in pieces:
+            _note_xml(out, piece)
+        if index == len(measures) - 1:
+            out.extend([
+                '      <barline location="right">',
+                '        <bar-style>light-heavy</bar-style>',
+                '      </barline>',
+            ])
+        out.append('    </measure>')
+    out.extend(['  </part>', '</score-partwise>'])
+    return '\n'.join(out)
+
+
+def _render_with_music21(events, bpm, time_signature):
+    """Fallback for anything the native writer doesn't cover (other meters, odd spellings)."""
+    from music21 import stream, note, tempo, meter, metadata
+    from music21.musicxml.m21ToXml import GeneralObjectExporter
+
+    s = stream.Score()
+    p = stream.Part()
+
+    # 1. Setup Metadata
+    s.insert(0, metadata.Metadata())
+    s.metadata.title = TITLE
+    s.metadata.composer = COMPOSER
+
+    # 2. Setup Tempo & Time Signature (Insert into Part, let music21 handle measures later)
+    p.append(meter.TimeSignature(time_signature))
+    p.append(tempo.MetronomeMark(number=bpm))
+
+    for name, quarter_length in events:
+        el = note.Rest() if name == "rest" else note.Note(name)
+        el.quarterLength = quarter_length
+        p.append(el)
+
+    # --- E. AUTOMATIC MEASURE CREATION ---
+    # Chops the stream into measures and ties notes across barlines
+    # (makeMeasures alone leaves them overhanging the bar).
+    p.makeNotation(inPlace=True)
+    s.append(p)
+
+    # 3. Serialize in memory (no temp-file round trip)
+    return GeneralObjectExporter(s).parse().decode('utf-8')
+
+@lru_cache(maxsize=MUSICXML_CACHE_SIZE)
+def _render_musicxml(events, bpm, time_signature):
+    if _native_supported(events, time_signature):
+        return _write_musicxml(events, bpm)
+    return _ENCODING_DATE.sub(_ENCODING_DATE_SLOT, _render_with_music21(events, bpm, time_signature), count=1)
+
+def generate_musicxml(notes_data, bpm=BPM, time_signature=TIME_SIGNATURE):
+    """
+    Converts a list of note dictionaries into MusicXML string.
+    The usual monophonic 4/4 case is written directly; anything else goes
+    through music21. Identical quantized melodies are served from an in-memory LRU cache.
+    """
+    try:
+        xml = _render_musicxml(quantize_notes(notes_data, bpm), bpm, time_signature)
+        return xml.replace(_ENCODING_DATE_SLOT, f'<encoding-date>{date.today().isoformat()}</encoding-date>', 1)
     except Exception as e:
         print(f"Error generating MusicXML: {e}")
-        return ""
\ No newline at end of file
+        return ""
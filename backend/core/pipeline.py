@@ -0,0 +1,79 @@
+"""
+CPU-bound analysis entry points.
+
+Everything here takes file paths / ids and returns plain, picklable data so it
+can run inside an AnalysisExecutor worker process instead of on the event loop.
+Lessons are loaded by id from the database, so any worker (or node) can serve
+any request without shared scratch files.
+"""
+from .analysis import analyze_audio
+from .transcription import extract_notes_from_analysis
+from .music_gen import generate_musicxml
+from .feedback import calculate_feedback, load_teacher_reference
+from . import reference_cache, database, models
+
+
+def run_teach(teacher_path: str, pcm_path: str = None, content_hash: str = None):
+    # Analysis, notes and MusicXML are cached by content hash
+    reference = reference_cache.build_reference(teacher_path, pcm_path, content_hash)
+    if not reference.notes:
+        return None
+    return {"notes": reference.notes, "musicxml": reference.musicxml, "content_hash": reference.content_hash}
+
+
+def _no_progress(stage):
+    pass
+
+
+def _load_lesson(lesson_id):
+    if lesson_id is None: return None
+    db = database.SessionLocal()
+    try:
+        lesson = db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
+        if lesson is not None:
+            db.expunge(lesson)  # plain attribute access only from here on
+        return lesson
+    finally:
+        db.close()
+
+
+def _score_student(student_path: str, lesson_id, pcm_path: str = None, progress=_no_progress, estimator=None):
+    # Each recording is decoded and pitch-tracked exactly once
+    progress("analyzing")
+    lesson = _load_lesson(lesson_id)
+    student_analysis = analyze_audio(student_path, pcm_path, estimator)
+    teacher_reference = load_teacher_reference(lesson)
+    teacher_analysis = teacher_reference.analysis if teacher_reference else None
+    progress("transcribing")
+    student_notes = extract_notes_from_analysis(student_analysis)
+    progress("scoring")
+    feedback = calculate_feedback(student_notes, student_analysis, lesson, teacher_analysis)
+    return student_analysis, student_notes, feedback, teacher_reference
+
+
+def run_analysis(student_path: str, lesson_id, pcm_path: str = None, progress=_no_progress, estimator=None):
+    """
+    pcm_path: audio already decoded during ingest (skips librosa.load).
+    progress(stage) is called as each step starts (used by background jobs).
+    estimator: pitch estimator name for the student take (None = deployment default).
+    """
+    student_analysis, student_notes, feedback, teacher_reference = _score_student(student_path, lesson_id, pcm_path, progress, estimator)
+    progress("rendering")
+    student_xml = generate_musicxml(student_notes)
+
+    # We freeze the lesson's (cached) teacher reference into the result.
+    teacher_snapshot = {
+        "notes": teacher_reference.notes if teacher_reference else None,
+        "musicxml": teacher_reference.musicxml if teacher_reference else ""
+    }
+
+    return {
+        "status": "success",
+        "mode": "student",
+        "lesson_id": lesson_id,
+        "estimator": student_analysis.estimator,
+        "notes": student_notes,
+        "musicxml": student_xml,
+        "feedback": feedback,
+        "teacher_data": teacher_snapshot
+    }
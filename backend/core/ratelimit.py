@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import deque
+from fastapi import HTTPException, status
+
+
+class SlidingWindowLimiter:
+    """
+    At most `limit` events per key in any `window` seconds, kept in process
+    memory (each API process limits independently). Thread-safe.
+    """
+
+    # Sweep idle keys once the table grows past this, so one-off IPs don't pile up
+    MAX_KEYS = 10000
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        events = self._events.get(key)
+        if events is None: return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def retry_after(self, key) -> float:
+        """Seconds until the key may act again (0 if it may act now)."""
+        now = time.monotonic()
+        with self._lock:
+            events = self._recent(key, now)
+            if events is None or len(events) < self.limit: return 0.0
+            return events[0] + self.window - now
+
+    def _record(self, key, now):
+        if len(self._events) > self.MAX_KEYS:
+            for stale in list(self._events):
+                self._recent(stale, now)
+        self._events.setdefault(key, deque()).append(now)
+
+    def hit(self, key):
+        with self._lock:
+            self._record(key, time.monotonic())
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+    def enforce(self, key, detail="Too many attempts, please retry later"):
+        """Raises 429 if the key is over its limit; otherwise records the event."""
+        with self._lock:
+            now = time.monotonic()
+            events = self._recent(key, now)
+            if events is None or len(events) < self.limit:
+                self._record(key, now)
+                return
+            wait = events[0] + self.window - now
+        raise too_many_requests(wait, detail)
+
+
+def too_many_requests(retry_after: float, detail="Too many attempts, please retry later"):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(int(retry_after) + 1)},
+    )
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import numpy as np
+from collections import OrderedDict
+
+from .analysis import AudioAnalysis, analyze_audio, PITCH_ESTIMATOR, PITCH_ESTIMATORS
+from .transcription import extract_notes_from_analysis
+from .music_gen import generate_musicxml
+
+# Teacher-side artifacts are computed once at /api/teach time and stored here,
+# keyed by the SHA-256 of the uploaded audio bytes. Lessons point at entries
+# through Lesson.content_hash, so identical uploads share one entry.
+# References use the deployment's PITCH_ESTIMATOR; non-pyin entries get a
+# suffix so switching estimators never serves another tracker's contour.
+REFERENCE_CACHE_DIR = "storage/reference_cache"
+
+# In-process LRU copy so a warm worker skips even the .npz read
+MEMORY_CACHE_SIZE = int(os.getenv("REFERENCE_MEMORY_CACHE_SIZE", 32))
+_memory = OrderedDict()
+
+
+class TeacherReference:
+    """Everything derived from one teacher recording: analysis, notes and MusicXML."""
+
+    def __init__(self, content_hash, analysis: AudioAnalysis, notes, musicxml):
+        self.content_hash = content_hash
+        self.analysis = analysis
+        self.notes = notes
+        self.musicxml = musicxml
+
+
+def file_content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_key(content_hash, estimator=PITCH_ESTIMATOR):
+    return content_hash if estimator == "pyin" else f"{content_hash}.{estimator}"
+
+
+def _entry_paths(content_hash, estimator=PITCH_ESTIMATOR):
+    base = os.path.join(REFERENCE_CACHE_DIR, _cache_key(content_hash, estimator))
+    return base + ".npz", base + ".json"
+
+
+def _atomic_write(path, write_fn, mode="wb"):
+    # Write next to the target and rename, so other workers never read half a file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode) as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
+
+
+def _store(reference: TeacherReference):
+    os.makedirs(REFERENCE_CACHE_DIR, exist_ok=True)
+    npz_path, json_path = _entry_paths(reference.content_hash, reference.analysis.estimator)
+    _atomic_write(npz_path, lambda f: np.savez(f, **reference.analysis.to_arrays()))
+    _atomic_write(
+        json_path,
+        lambda f: json.dump({"notes": reference.notes, "musicxml": reference.musicxml}, f),
+        mode="w"
+    )
+    _remember(reference)
+
+
+def _remember(reference: TeacherReference):
+    key = _cache_key(reference.content_hash, reference.analysis.estimator)
+    _memory[key] = reference
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def get_reference(content_hash):
+    """Returns the cached reference for a content hash, or None on a miss."""
+    key = _cache_key(content_hash)
+    if key in _memory:
+        _memory.move_to_end(key)
+        return _memory[key]
+
+    npz_path, json_path = _entry_paths(content_hash)
+    if not (os.path.exists(npz_path) and os.path.exists(json_path)):
+        return None
+
+    with np.load(npz_path) as arrays:
+        analysis = AudioAnalysis.from_arrays(arrays)
+    with open(json_path, "r") as f:
+        payload = json.load(f)
+
+    reference = TeacherReference(content_hash, analysis, payload["notes"], payload["musicxml"])
+    _remember(reference)
+    return reference
+
+
+def build_reference(audio_path: str, pcm_path: str = None, content_hash: str = None) -> TeacherReference:
+    """
+    Analyzes a teacher recording, reusing the cache if these exact bytes were seen before.
+    content_hash may be passed in when ingest already hashed the upload.
+    """
+    content_hash = content_hash or file_content_hash(audio_path)
+    cached = get_reference(content_hash)
+    if cached is not None:
+        return cached
+
+    analysis = analyze_audio(audio_path, pcm_path)
+    analysis.chroma  # Precompute so cached entries never need the waveform
+    notes = extract_notes_from_analysis(analysis)
+    musicxml = generate_musicxml(notes) if notes else ""
+
+    reference = TeacherReference(content_hash, analysis, notes, musicxml)
+    _store(reference)
+    return reference
+
+
+def invalidate(content_hash):
+    # Drop every estimator's variant, not just the current default's
+    for estimator in PITCH_ESTIMATORS:
+        _memory.pop(_cache_key(content_hash, estimator), None)
+        for path in _entry_paths(content_hash, estimator):
+            try: os.remove(path)
+            except OSError: pass
@@ -0,0 +1,162 @@
+"""PDF layout of the performance report (reportlab). Imported by report-rendering workers only."""
+import base64
+import io
+import math
+from xml.sax.saxutils import escape
+
+from reportlab.graphics.shapes import Drawing, Line, PolyLine, String
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+ACCENT = colors.HexColor("#2f5aff")
+HIGHLIGHT = colors.HexColor("#ff0055")
+TEACHER_COLOR = colors.HexColor("#2ca02c")
+STUDENT_COLOR = colors.HexColor("#d62728")
+
+
+# --- LAYOUT ---
+# Drawn straight onto reportlab flowables: the pitch contour stored with the
+# attempt becomes vector lines and the cached heatmap PNG (core.heatmaps) is
+# embedded as-is, so no HTML is laid out here.
+_styles = getSampleStyleSheet()
+_title = ParagraphStyle("ReportTitle", parent=_styles["Title"], fontName="Helvetica-Bold", textColor=colors.HexColor("#333333"))
+_subtitle = ParagraphStyle("ReportSubtitle", parent=_styles["Normal"], alignment=TA_CENTER, textColor=colors.HexColor("#666666"))
+_heading = ParagraphStyle("ReportHeading", parent=_styles["Heading2"], textColor=colors.HexColor("#444444"),
+                          borderColor=HIGHLIGHT, borderPadding=(0, 0, 0, 6), leftIndent=8)
+_body = ParagraphStyle("ReportBody", parent=_styles["Normal"], fontName="Helvetica", leading=14)
+_score_label = ParagraphStyle("ScoreLabel", parent=_body, alignment=TA_CENTER)
+_score_value = ParagraphStyle("ScoreValue", parent=_body, alignment=TA_CENTER, fontName="Helvetica-Bold",
+                              fontSize=36, leading=42, textColor=ACCENT)
+
+
+def _section(title):
+    # Pink bar on the left of each section title, like the web dashboard
+    return Table([["", Paragraph(title, _heading)]], colWidths=[1.5 * mm, None], style=TableStyle([
+        ("BACKGROUND", (0, 0), (0, 0), HIGHLIGHT),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("LEFTPADDING", (0, 0), (-1, -1), 0),
+    ]), hAlign="LEFT")
+
+
+def _ticks(lo, hi, count=5):
+    step_raw = (hi - lo) / count if hi > lo else 1.0
+    magnitude = 10 ** math.floor(math.log10(step_raw))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= step_raw)
+    first = math.ceil(lo / step) * step
+    return [first + i * step for i in range(int((hi - first) / step + 1e-9) + 1)]
+
+
+def _pitch_series(graph_data):
+    """(seconds, {"teacher": [...], "student": [...]}) from columnar or legacy row graph data."""
+    if "seconds" in graph_data:
+        pitch = graph_data.get("pitch") or {}
+        return graph_data["seconds"], {key: (pitch.get(key) or {}).get("mean") or [] for key in ("teacher", "student")}
+    # Attempts stored before graph data went columnar
+    rows = graph_data.get("pitch_data") or []
+    return [p["seconds"] for p in rows], {key: [p[key] for p in rows] for key in ("teacher", "student")}
+
+
+def _pitch_chart(seconds, series, width, height=70 * mm):
+    """Teacher vs student contour as vector lines (None = unvoiced gap)."""
+    voiced = [v for values in series.values() for v in values if v is not None]
+    drawing = Drawing(width, height)
+    if not voiced or not seconds: return None
+
+    left, right, bottom, top = 42, width - 6, 26, height - 18
+    x_lo, x_hi = min(seconds), max(seconds) or 1.0
+    y_lo, y_hi = min(voiced), max(voiced)
+    pad = max((y_hi - y_lo) * 0.08, 5.0)
+    y_lo, y_hi = y_lo - pad, y_hi + pad
+    sx = lambda x: left + (x - x_lo) / ((x_hi - x_lo) or 1.0) * (right - left)
+    sy = lambda y: bottom + (y - y_lo) / (y_hi - y_lo) * (top - bottom)
+
+    grid = colors.Color(0, 0, 0, alpha=0.12)
+    for t in _ticks(x_lo, x_hi):
+        drawing.add(Line(sx(t), bottom, sx(t), top, strokeColor=grid, strokeWidth=0.5))
+        drawing.add(String(sx(t), bottom - 10, f"{t:g}", fontSize=7, textAnchor="middle"))
+    for f in _ticks(y_lo, y_hi):
+        drawing.add(Line(left, sy(f), right, sy(f), strokeColor=grid, strokeWidth=0.5))
+        drawing.add(String(left - 4, sy(f) - 2.5, f"{f:g}", fontSize=7, textAnchor="end"))
+    drawing.add(String((left + right) / 2, 2, "Time (s)", fontSize=8, textAnchor="middle"))
+    drawing.add(String(2, top + 6, "Frequency (Hz)", fontSize=8))
+
+    for key, color, dash in (("teacher", TEACHER_COLOR, None), ("student", STUDENT_COLOR, [4, 2])):
+        run = []
+        for s, value in zip(seconds, series[key]):
+            if value is None:
+                if len(run) >= 4: drawing.add(PolyLine(run, strokeColor=color, strokeWidth=1.5, strokeDashArray=dash))
+                run = []
+            else:
+                run += [sx(s), sy(value)]
+        if len(run) >= 4: drawing.add(PolyLine(run, strokeColor=color, strokeWidth=1.5, strokeDashArray=dash))
+
+    for i, (label, color, dash) in enumerate((("Reference", TEACHER_COLOR, None), ("Student", STUDENT_COLOR, [4, 2]))):
+        x = right - 130 + i * 70
+        drawing.add(Line(x, top + 8, x + 16, top + 8, strokeColor=color, strokeWidth=1.5, strokeDashArray=dash))
+        drawing.add(String(x + 20, top + 5.5, label, fontSize=8))
+    return drawing
+
+
+def _png(png_bytes, width):
+    data = io.BytesIO(png_bytes)
+    w, h = ImageReader(data).getSize()
+    data.seek(0)
+    return Image(data, width=width, height=width * h / w)
+
+
+def generate_performance_pdf(score, feedback_list, graph_data, heatmap_png=None):
+    graph_data = graph_data or {}
+    if heatmap_png is None and graph_data.get("heatmap"):
+        heatmap_png = base64.b64decode(graph_data["heatmap"])
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=18 * mm, rightMargin=18 * mm,
+                            topMargin=15 * mm, bottomMargin=15 * mm, title="Music Tutor Analysis Report")
+    width = doc.width
+    unavailable = Paragraph("Not available for this attempt.", _body)
+
+    story = [
+        Paragraph("Music Tutor Analysis Report", _title),
+        Paragraph("Generated by AI Performance Tutor", _subtitle),
+        Spacer(1, 4 * mm),
+        Table([[Paragraph("Performance Score", _score_label)], [Paragraph(f"{score}%", _score_value)]],
+              colWidths=[width], style=TableStyle([
+                  ("BACKGROUND", (0, 0), (-1, -1), colors.HexColor("#f0f4ff")),
+                  ("LINEABOVE", (0, 0), (-1, 0), 2, ACCENT),
+                  ("TOPPADDING", (0, 0), (-1, -1), 6),
+                  ("BOTTOMPADDING", (0, -1), (-1, -1), 10),
+              ])),
+        Spacer(1, 6 * mm),
+    ]
+
+    story.append(_section("1. Pitch Accuracy (Intonation)"))
+    chart = _pitch_chart(*_pitch_series(graph_data), width)
+    if chart is None:
+        story.append(unavailable)
+    else:
+        story += [Paragraph("The <b>Green line</b> represents the teacher's reference pitch. "
+                            "The <b>Red dashed line</b> is your performance.", _body), Spacer(1, 3 * mm), chart]
+
+    story += [Spacer(1, 6 * mm), _section("2. Tonal Harmony")]
+    if heatmap_png:
+        story += [Paragraph("This heatmap shows the energy distribution of your notes over time.", _body),
+                  Spacer(1, 3 * mm), _png(heatmap_png, width)]
+    else:
+        story.append(unavailable)
+
+    story += [Spacer(1, 6 * mm), _section("3. Detailed Feedback")]
+    rows = [[Paragraph(escape(item["message"]), _body)] for item in feedback_list]
+    if rows:
+        story.append(Table(rows, colWidths=[width], style=TableStyle([
+            ("LINEBELOW", (0, 0), (-1, -1), 0.5, colors.HexColor("#eeeeee")),
+            ("TOPPADDING", (0, 0), (-1, -1), 5),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
+        ])))
+
+    doc.build(story)
+    buf.seek(0)
+    return buf
@@ -0,0 +1,84 @@
+import os
+import zipfile
+
+from . import database, models, history, heatmaps
+
+# Rendered PDFs are cached per History row. Bump the version whenever the
+# report layout changes so stale files are simply never looked up again.
+REPORT_DIR = "storage/reports"
+REPORT_RENDERER_VERSION = 2
+EXPORT_DIR = os.path.join(REPORT_DIR, "exports")
+
+
+def report_cache_path(history_id: int) -> str:
+    return os.path.join(REPORT_DIR, f"{history_id}_v{REPORT_RENDERER_VERSION}.pdf")
+
+
+# --- RENDERING ---
+def render_history_report(history_id: int):
+    """
+    Worker-side: builds the PDF from the analysis already stored on the
+    History row and writes it to the cache. Returns the cached path.
+    """
+    db = database.SessionLocal()
+    try:
+        attempt = db.query(models.History).filter(models.History.id == history_id).first()
+        analysis_data = history.load_analysis(db, attempt, with_teacher=False) if attempt is not None else None
+        if analysis_data is None: return None
+    finally:
+        db.close()
+
+    feedback = analysis_data.get("feedback") or {}
+    graph_data = feedback.get("graph_data") or {}
+    heatmap_png = None
+    if not graph_data.get("heatmap"):
+        heatmap_path = heatmaps.render_history_heatmap(history_id, attempt.audio_filename)
+        if heatmap_path:
+            with open(heatmap_path, "rb") as f:
+                heatmap_png = f.read()
+    # Layout lives in its own module so the API process never imports reportlab
+    from .report_pdf import generate_performance_pdf
+    try:
+        pdf_buffer = generate_performance_pdf(
+            feedback.get("score", attempt.score),
+            feedback.get("detailed_breakdown") or [],
+            graph_data,
+            heatmap_png
+        )
+    except Exception as e:
+        print(f"❌ Report for attempt {history_id} failed: {e}")
+        return None
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    path = report_cache_path(history_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_buffer.getbuffer())
+    os.replace(tmp_path, path)
+    return path
+
+
+def render_history_reports(history_ids):
+    """Worker-side batch: one executor call renders a whole chunk. Returns {id: path or None}."""
+    return {history_id: render_history_report(history_id) for history_id in history_ids}
+
+
+def missing_reports(history_ids):
+    return [history_id for history_id in history_ids if not os.path.exists(report_cache_path(history_id))]
+
+
+def write_export_zip(attempts, path):
+    """
+    Zips cached reports for (id, date) pairs into path. PDFs are already
+    compressed, so entries are stored rather than deflated again.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for history_id, date in attempts:
+            pdf_path = report_cache_path(history_id)
+            if not os.path.exists(pdf_path): continue
+            stamp = date.strftime("%Y-%m-%d_%H%M") if date else "undated"
+            archive.write(pdf_path, f"MusicTutor_Report_{stamp}_{history_id}.pdf")
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,219 @@
+"""
+Batch re-scoring of stored attempts.
+
+Walks History rows in id order, re-runs the student pipeline on the archived
+recording in worker processes and writes the new score and stored result back
+in batched transactions. Progress is checkpointed to a small JSON file so an
+interrupted run picks up where it stopped.
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from . import database, models, pipeline, reports, history, archive, lessons
+from .executor import warm_worker
+
+# --- RESCORE SETTINGS ---
+RESCORE_BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", 50))
+RESCORE_CHECKPOINT = os.getenv("RESCORE_CHECKPOINT", "storage/rescore_checkpoint.json")
+# Attempts waiting in the pool per worker; keeps memory flat on big tables
+RESCORE_PREFETCH = 2
+
+
+def rescore_attempt(history_id: int, audio_filename: str, lesson_id, estimator=None):
+    """
+    Worker-side: scores one archived recording against its lesson's current
+    reference. Returns (history_id, row fields or None, error or None).
+    """
+    if lesson_id is None:
+        return history_id, None, "no lesson to score against"
+    try:
+        # Decoded samples come from the archive cache (memory-mapped), not a fresh decode
+        pcm_path = archive.cached_pcm(audio_filename)
+        if pcm_path is None:
+            return history_id, None, "audio file missing"
+        result = pipeline.run_analysis(pcm_path, lesson_id, pcm_path, estimator=estimator)
+    except Exception as e:
+        return history_id, None, str(e) or type(e).__name__
+
+    feedback = result["feedback"]
+    if not feedback["detailed_breakdown"]:
+        # "No data." (no reference melody or no notes heard) must not replace a real score
+        return history_id, None, "nothing to score: " + feedback["comments"][0]
+    return history_id, {
+        "id": history_id,
+        "lesson_id": lesson_id,
+        "score": feedback["score"],
+        "feedback_summary": feedback["comments"][0],
+        "packed": history.pack_analysis(result),  # compressed here, in parallel
+    }, None
+
+
+# --- CHECKPOINT ---
+def load_checkpoint(path=RESCORE_CHECKPOINT):
+    """{"last_id": every row up to here is settled, "failed": {id: error}}"""
+    if not os.path.exists(path):
+        return {"last_id": 0, "failed": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint, path=RESCORE_CHECKPOINT):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def _stored_estimator(db, row):
+    try: analysis = history.load_analysis(db, row, with_teacher=False)
+    except ValueError: return None
+    return analysis.get("estimator") if isinstance(analysis, dict) else None
+
+
+def _pending_rows(db, after_id, user_id=None, lesson_id=None, limit=None, ids=None):
+    # Only the columns the workers need; the stored result is read once for its estimator
+    query = db.query(models.History.id, models.History.audio_filename, models.History.lesson_id,
+                     models.History.user_id, *history.ANALYSIS_COLUMNS) \
+        .filter(models.History.audio_filename.isnot(None))
+    if ids is not None:
+        query = query.filter(models.History.id.in_(ids))
+    else:
+        query = query.filter(models.History.id > after_id)
+    if user_id is not None:
+        query = query.filter(models.History.user_id == user_id)
+    if lesson_id is not None:
+        query = query.filter(models.History.lesson_id == lesson_id)
+    query = query.order_by(models.History.id)
+    if limit is not None:
+        query = query.limit(limit)
+    for row in query.yield_per(500):
+        yield row.id, row.audio_filename, row.lesson_id, row.user_id, _stored_estimator(db, row)
+
+
+def _resolve_legacy_lessons(db, rows):
+    """
+    Attempts stored before lessons existed have no lesson_id. Score them against
+    the lesson /api/analyze would pick for their owner today (lessons.resolve_lesson);
+    the row is updated to point at it. Stays None when there is no lesson at all.
+    """
+    by_user = {}
+    for row_id, audio_filename, row_lesson_id, row_user_id, row_estimator in rows:
+        if row_lesson_id is None:
+            if row_user_id not in by_user:
+                user = db.query(models.User).filter(models.User.id == row_user_id).first()
+                lesson = lessons.resolve_lesson(db, user, None) if user else None
+                by_user[row_user_id] = lesson.id if lesson else None
+            row_lesson_id = by_user[row_user_id]
+        yield row_id, audio_filename, row_lesson_id, row_estimator
+
+
+def _flush(rows):
+    """One transaction per batch; ORM bulk UPDATE keyed by primary key."""
+    if not rows: return
+    db = database.SessionLocal()
+    try:
+        for retry in (False, True):
+            try:
+                updates = [{"id": row["id"], "score": row["score"], "feedback_summary": row["feedback_summary"],
+                            "lesson_id": row["lesson_id"], **history.analysis_columns(db, row["packed"])} for row in rows]
+                db.execute(update(models.History), updates)
+                db.commit()
+                break
+            except IntegrityError:
+                # A teacher snapshot was stored concurrently by the API; it exists now
+                db.rollback()
+                if retry: raise
+    finally:
+        db.close()
+    # Reports render from analysis_data, so cached PDFs for these rows are stale now
+    for row in rows:
+        try: os.remove(reports.report_cache_path(row["id"]))
+        except OSError: pass
+
+
+def rescore_history(workers, batch_size=RESCORE_BATCH_SIZE, checkpoint_path=RESCORE_CHECKPOINT,
+                    user_id=None, lesson_id=None, estimator=None, limit=None, retry_failed=False):
+    """
+    Re-scores every matching History row after the checkpoint. estimator
+    overrides the one each attempt was originally scored with.
+    Returns (updated, failed) counts for this run.
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    failed = checkpoint["failed"]
+    retry_ids = sorted(int(i) for i in failed) if retry_failed else []
+    if retry_failed:
+        failed.clear()
+
+    db = database.SessionLocal()
+    try:
+        pending = list(_pending_rows(db, checkpoint["last_id"], user_id, lesson_id, ids=retry_ids)) if retry_ids else []
+        pending += _pending_rows(db, checkpoint["last_id"], user_id, lesson_id, limit)
+        todo = list(_resolve_legacy_lessons(db, pending))
+    finally:
+        db.close()
+
+    print(f"🔁 Re-scoring {len(todo)} attempts with {workers} workers (resuming after id {checkpoint['last_id']})")
+    if not todo:
+        return 0, 0
+
+    updated = errors = 0
+    last_submitted = checkpoint["last_id"]
+    batch = []
+    in_flight = {}      # future -> history id
+    unsettled = set()   # submitted, not yet committed or recorded as failed
+    rows = iter(todo)
+
+    def settle():
+        # The watermark only moves past ids whose result is durable
+        nonlocal batch
+        _flush(batch)
+        for row in batch:
+            unsettled.discard(row["id"])
+        batch = []
+        checkpoint["last_id"] = max(checkpoint["last_id"], (min(unsettled) - 1) if unsettled else last_submitted)
+        save_checkpoint(checkpoint, checkpoint_path)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_worker) as pool:
+        try:
+            while True:
+                while len(in_flight) < workers * RESCORE_PREFETCH:
+                    row = next(rows, None)
+                    if row is None: break
+                    row_id, audio_filename, row_lesson_id, row_estimator = row
+                    future = pool.submit(rescore_attempt, row_id, audio_filename, row_lesson_id,
+                                         estimator or row_estimator)
+                    in_flight[future] = row_id
+                    unsettled.add(row_id)
+                    last_submitted = max(last_submitted, row_id)
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del in_flight[future]
+                    row_id, fields, error = future.result()
+                    if error is None:
+                        batch.append(fields)
+                        updated += 1
+                    else:
+                        failed[str(row_id)] = error
+                        unsettled.discard(row_id)
+                        errors += 1
+                        print(f"⚠️ Attempt {row_id}: {error}")
+
+                if len(batch) >= batch_size:
+                    settle()
+                    archive.evict_cache()  # a full pass would otherwise decode every attempt into the cache
+                    print(f"💾 {updated} updated, {errors} failed, {len(todo) - updated - errors} to go")
+        finally:
+            # Ctrl-C: keep whatever already finished, drop the rest
+            for future in in_flight:
+                future.cancel()
+            settle()
+
+    print(f"✅ Re-scored {updated} attempts ({errors} failed)")
+    return updated, errors
@@ -0,0 +1,234 @@
+import numpy as np
+from math import gcd
+
+from .analysis import TARGET_SR, HOP_LENGTH, FRAME_LENGTH, FMIN, FMAX
+from .transcription import make_note, MIN_NOTE_DURATION
+
+# --- LIVE TRACKING SETTINGS ---
+# Frames quieter than this RMS are treated as unvoiced (live audio can't be
+# loudness-normalized up front the way whole files are).
+SILENCE_RMS = 0.01
+# A pitch must move this many semitones away from the running note...
+PITCH_CHANGE_SEMITONES = 0.75
+# ...for this many consecutive frames before it counts as a new onset (~64ms)
+PITCH_CHANGE_FRAMES = 2
+# Cap (in semitones) on the per-note cost used by the live aligner
+ALIGN_MAX_COST = 2.0
+
+
+class StreamResampler:
+    """
+    Chunked equivalent of scipy.signal.resample_poly(x, up, down) over the
+    whole stream: same Kaiser FIR, but input history is carried between
+    chunks and output samples are indexed globally. Chunk boundaries then add
+    no edge transients, and the output length never drifts from
+    input_length * up / down (only the last half-filter of a stream is never emitted).
+    """
+
+    def __init__(self, up, down):
+        from scipy.signal import firwin  # scipy.signal alone is over a second of import
+        self.up, self.down = up, down
+        max_rate = max(up, down)
+        self._half = 10 * max_rate  # resample_poly's default filter half-length
+        h = firwin(2 * self._half + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up
+        self._n_taps = -(-len(h) // up)
+        h = np.concatenate((h, np.zeros(self._n_taps * up - len(h))))
+        # Polyphase layout: _phases[p, t] = h[t * up + p]
+        self._phases = h.reshape(self._n_taps, up).T.astype(np.float32)
+        self._taps = np.arange(self._n_taps)
+        # Input samples still needed, starting at global input index _start (zeros before the stream)
+        self._history = np.zeros(self._n_taps - 1, dtype=np.float32)
+        self._start = -(self._n_taps - 1)
+        self._received = 0
+        self._next_out = 0
+
+    def process(self, samples):
+        buffer = np.concatenate((self._history, samples))
+        self._received += len(samples)
+
+        # Output n needs input up to (n * down + half) // up; emit every n that is complete
+        n_end = max(self._next_out, -((self._half - self._received * self.up) // self.down))
+        n = np.arange(self._next_out, n_end)
+        position = n * self.down + self._half
+        newest = position // self.up - self._start
+        out = np.einsum("ij,ij->i", buffer[newest[:, None] - self._taps], self._phases[position % self.up])
+        self._next_out = n_end
+
+        keep_from = (self._next_out * self.down + self._half) // self.up - (self._n_taps - 1)
+        self._history = buffer[keep_from - self._start:]
+        self._start = keep_from
+        return out.astype(np.float32)
+
+
+class StreamingTranscriber:
+    """
+    Incremental version of extract_notes_from_audio for live PCM.
+
+    feed() accepts arbitrary-size chunks and only ever processes the new
+    frames (plus one frame of context), so per-chunk cost is proportional
+    to chunk length. Uses YIN instead of pyin: pyin's Viterbi pass needs the
+    whole signal and is far too slow for a per-chunk budget.
+    """
+
+    def __init__(self, input_sr=TARGET_SR, sr=TARGET_SR, hop_length=HOP_LENGTH, frame_length=FRAME_LENGTH):
+        self.input_sr = input_sr
+        self.sr = sr
+        self.hop_length = hop_length
+        self.frame_length = frame_length
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._frame_index = 0
+
+        # Resampler for clients that can't capture at 16 kHz
+        divisor = gcd(int(input_sr), int(sr))
+        up, down = int(sr) // divisor, int(input_sr) // divisor
+        self._resampler = StreamResampler(up, down) if up != down else None
+
+        # Note segmenter state
+        self._note_start = None
+        self._note_frames = []
+        self._pending_frames = []
+        self.notes = []
+
+    def _frame_time(self, frame_index):
+        # Centre of the frame, to line up with librosa's centred frame times
+        return (frame_index * self.hop_length + self.frame_length / 2) / self.sr
+
+    def feed(self, samples):
+        """Consumes one PCM chunk; returns pitch and note events it completed."""
+        samples = np.asarray(samples, dtype=np.float32)
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        self._buffer = np.concatenate((self._buffer, samples))
+
+        if len(self._buffer) < self.frame_length:
+            return []
+        n_frames = 1 + (len(self._buffer) - self.frame_length) // self.hop_length
+        usable = self._buffer[: self.frame_length + (n_frames - 1) * self.hop_length]
+
+        import librosa  # loaded by the first live session (or warm_up()), not at API startup
+        f0 = librosa.yin(usable, fmin=FMIN, fmax=FMAX, sr=self.sr,
+                         frame_length=self.frame_length, hop_length=self.hop_length, center=False)
+        frames = librosa.util.frame(usable, frame_length=self.frame_length, hop_length=self.hop_length)
+        rms = np.sqrt(np.mean(frames ** 2, axis=0))
+        midi = np.where(rms > SILENCE_RMS, librosa.hz_to_midi(f0), 0.0)
+
+        # Keep the overlap needed for the next frame
+        self._buffer = self._buffer[n_frames * self.hop_length:]
+
+        events = []
+        for i in range(n_frames):
+            events.extend(self._step(self._frame_index + i, float(midi[i])))
+        self._frame_index += n_frames
+
+        if n_frames:
+            last = float(f0[-1]) if midi[-1] > 0 else None
+            events.append({"type": "pitch", "time": self._frame_time(self._frame_index - 1),
+                           "hz": last, "midi": float(midi[-1]) if last else None})
+        return events
+
+    def _step(self, frame_index, midi):
+        if midi <= 0:
+            # Unvoiced frame ends the current note (same rule as the sustained fallback)
+            return self._close_note(frame_index)
+
+        if self._note_start is None:
+            self._note_start = frame_index
+            self._note_frames = [midi]
+            return []
+
+        if abs(midi - np.median(self._note_frames)) > PITCH_CHANGE_SEMITONES:
+            self._pending_frames.append(midi)
+            if len(self._pending_frames) < PITCH_CHANGE_FRAMES:
+                return []
+            # Sustained pitch jump acts as an onset: split the note here
+            pending = self._pending_frames
+            change_at = frame_index - len(pending) + 1
+            events = self._close_note(change_at)
+            self._note_start = change_at
+            self._note_frames = pending
+            return events
+
+        self._note_frames.extend(self._pending_frames)
+        self._note_frames.append(midi)
+        self._pending_frames = []
+        return []
+
+    def _close_note(self, end_frame):
+        events = []
+        if self._note_start is not None:
+            duration = (end_frame - self._note_start) * self.hop_length / self.sr
+            if duration > MIN_NOTE_DURATION:
+                note = make_note(self._frame_time(self._note_start), duration, self._note_frames)
+                self.notes.append(note)
+                events.append({"type": "note", **note})
+        self._note_start = None
+        self._note_frames = []
+        self._pending_frames = []
+        return events
+
+    def flush(self):
+        """Closes whatever note is still sounding at end of stream."""
+        return self._close_note(self._frame_index)
+
+
+class LiveAligner:
+    """
+    Running note alignment against the teacher melody (online DTW).
+
+    Each new student note adds one DTW column over the teacher notes, so an
+    update costs O(len(teacher)) and extra or skipped notes don't derail the
+    alignment the way a simple pointer would.
+    """
+
+    def __init__(self, teacher_notes):
+        self.teacher_notes = teacher_notes or []
+        self._teacher_pitch = np.array([n["pitch"] for n in self.teacher_notes], dtype=np.float64)
+        self._column = None
+        self._matched = set()
+
+    def step(self, student_note):
+        if len(self._teacher_pitch) == 0:
+            return {"type": "alignment", "status": "extra", "student": student_note["name"], "score": 0}
+
+        # Clip the local cost so one badly wrong note can't dominate the path
+        cost = np.minimum(np.abs(self._teacher_pitch - student_note["pitch"]), ALIGN_MAX_COST)
+        column = np.empty_like(cost)
+        if self._column is None:
+            column[:] = np.cumsum(cost)
+        else:
+            previous = self._column
+            column[0] = cost[0] + previous[0]
+            for i in range(1, len(cost)):
+                column[i] = cost[i] + min(previous[i], previous[i - 1], column[i - 1])
+        self._column = column
+
+        # Latest teacher note on the cheapest path end (ties favour progress)
+        teacher_index = len(column) - 1 - int(np.argmin(column[::-1]))
+        teacher_note = self.teacher_notes[teacher_index]
+
+        diff = student_note["pitch"] - teacher_note["pitch"]
+        status = "match" if abs(diff) < 0.5 else ("high" if diff > 0 else "low")
+        if status == "match":
+            self._matched.add(teacher_index)
+
+        return {
+            "type": "alignment",
+            "status": status,
+            "teacher_index": teacher_index + 1,
+            "expected": teacher_note["name"],
+            "student": student_note["name"],
+            "diff": diff,
+            "score": self.score,
+        }
+
+    @property
+    def score(self):
+        return int(round(100 * len(self._matched) / max(len(self.teacher_notes), 1)))
+
+
+def warm_up():
+    """Pays librosa's one-off lazy initialisation before the first live session does."""
+    t = np.arange(TARGET_SR) / TARGET_SR
+    transcriber = StreamingTranscriber()
+    transcriber.feed(0.5 * np.sin(2 * np.pi * 440 * t))
+    transcriber.flush()
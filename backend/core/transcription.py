@@ -2,101 +2,143 @@ import librosa
 import numpy as np
 import warnings
 
+from .analysis import AudioAnalysis, analyze_audio
+
 # Suppress warnings
 warnings.filterwarnings("ignore")
 
+# Voiced runs shorter than this are treated as noise, not notes
+MIN_NOTE_DURATION = 0.1
+
+# Compact per-note record used inside the pipeline; dicts only at the API boundary
+NOTE_DTYPE = np.dtype([("start", np.float64), ("duration", np.float64), ("pitch", np.int16)])
+
+# Precomputed once so naming a note is an array lookup, not a librosa call.
+# Same spelling as librosa.midi_to_note(unicode=False), built by hand so that
+# importing this module doesn't load librosa's core (and scipy with it).
+PITCH_CLASSES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+MIDI_NOTE_NAMES = np.array([f"{PITCH_CLASSES[m % 12]}{m // 12 - 1}" for m in range(128)])
+
+def note_name(midi):
+    return str(MIDI_NOTE_NAMES[int(np.clip(midi, 0, 127))])
+
+def make_note(start, duration, voiced_midi):
+    """Builds one note dict from the voiced MIDI frames of a segment (median pitch)."""
+    avg_pitch = int(round(np.median(voiced_midi)))
+    return {
+        "start": start,
+        "duration": duration,
+        "pitch": avg_pitch,
+        "name": note_name(avg_pitch)
+    }
+
+def notes_to_dicts(notes: np.ndarray):
+    """Structured NOTE_DTYPE array -> the note dicts the API, DB and MusicXML writer use."""
+    pitches = notes["pitch"].astype(np.int64)
+    names = MIDI_NOTE_NAMES[np.clip(pitches, 0, 127)].tolist()
+    return [
+        {"start": start, "duration": duration, "pitch": pitch, "name": name}
+        for start, duration, pitch, name in zip(
+            notes["start"].tolist(), notes["duration"].tolist(), pitches.tolist(), names
+        )
+    ]
+
+def _grouped_median(values, segment_ids, n_segments):
+    """
+    Median of values per segment id in one sort (ids < 0 are ignored).
+    Returns (medians, counts); segments without values get count 0.
+    """
+    keep = segment_ids >= 0
+    values, segment_ids = values[keep], segment_ids[keep]
+    counts = np.bincount(segment_ids, minlength=n_segments)
+    ordered = values[np.lexsort((values, segment_ids))]
+
+    medians = np.zeros(n_segments)
+    filled = counts > 0
+    first = np.cumsum(counts) - counts
+    lower = (first + (counts - 1) // 2)[filled]
+    upper = (first + counts // 2)[filled]
+    # Same arithmetic as np.median: mean of the two middle values
+    medians[filled] = (ordered[lower] + ordered[upper]) / 2
+    return medians, counts
+
+def _segment_by_onsets(analysis: AudioAnalysis):
+    """Strategy 1: one note per onset-to-onset span with any voiced frames."""
+    sr, hop_length = analysis.sr, analysis.hop_length
+    midi_pitch = analysis.midi_pitch
+    onsets = librosa.onset.onset_detect(onset_envelope=analysis.onset_env, sr=sr, hop_length=hop_length, backtrack=True)
+    onset_times = librosa.frames_to_time(onsets, sr=sr, hop_length=hop_length)
+    if len(onset_times) < 2:
+        return np.zeros(0, dtype=NOTE_DTYPE)
+
+    # Same frame maths as the per-onset loop this replaces
+    bounds = (onset_times * sr / hop_length).astype(np.int64)
+    idx_start, idx_end = bounds[:-1], bounds[1:]
+    valid = (idx_end > idx_start) & (idx_end < len(midi_pitch))
+
+    # Every frame gets the id of the span it falls in; frames outside valid spans and unvoiced ones are dropped
+    segment_ids = np.searchsorted(bounds, np.arange(len(midi_pitch)), side="right") - 1
+    in_span = (segment_ids >= 0) & (segment_ids < len(idx_start))
+    in_span[in_span] = valid[segment_ids[in_span]]
+    segment_ids[~(in_span & (midi_pitch > 0))] = -1
+
+    medians, counts = _grouped_median(midi_pitch, segment_ids, len(idx_start))
+    keep = counts > 0
+
+    notes = np.empty(int(keep.sum()), dtype=NOTE_DTYPE)
+    notes["start"] = onset_times[:-1][keep]
+    notes["duration"] = (onset_times[1:] - onset_times[:-1])[keep]
+    notes["pitch"] = np.rint(medians[keep])
+    return notes
+
+def _segment_sustained(analysis: AudioAnalysis):
+    """Strategy 2: one note per voiced run longer than MIN_NOTE_DURATION."""
+    midi_pitch = analysis.midi_pitch
+    is_voiced = midi_pitch > 0
+    difs = np.diff(np.concatenate(([0], is_voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(difs == 1)
+    ends = np.flatnonzero(difs == -1)
+
+    # Times generation must also match HOP_LENGTH
+    times = librosa.times_like(analysis.f0, sr=analysis.sr, hop_length=analysis.hop_length)
+    start_times = times[np.minimum(starts, len(times) - 1)]
+    durations = times[np.minimum(ends, len(times) - 1)] - start_times
+
+    # Runs are back to back, so a running count of starts labels each voiced frame
+    segment_ids = np.where(is_voiced, np.cumsum(difs[:-1] == 1) - 1, -1)
+    medians, _ = _grouped_median(midi_pitch, segment_ids, len(starts))
+    keep = durations > MIN_NOTE_DURATION
+
+    notes = np.empty(int(keep.sum()), dtype=NOTE_DTYPE)
+    notes["start"] = start_times[keep]
+    notes["duration"] = durations[keep]
+    notes["pitch"] = np.rint(medians[keep])
+    return notes
+
+def segment_notes(analysis: AudioAnalysis) -> np.ndarray:
+    """Segments notes from a precomputed AudioAnalysis into a NOTE_DTYPE array."""
+    notes = _segment_by_onsets(analysis)
+    if len(notes) == 0:
+        print("   ⚠️ Switching to Sustained Mode...")
+        notes = _segment_sustained(analysis)
+    return notes
+
 def extract_notes_from_audio(audio_path: str):
     print(f"🎵 Analyzing: {audio_path}")
     
     try:
-        # --- PERFORMANCE SETTINGS ---
-        # Optimization: Process every 512 samples (~32ms) instead of 256 (~16ms).
-        # This makes the analysis ~2x FASTER on low-CPU servers like Render.
-        TARGET_SR = 16000 
-        HOP_LENGTH = 512  
-        
-        # 1. LOAD AUDIO
-        y, sr = librosa.load(audio_path, sr=TARGET_SR, mono=True)
-        
-        # Normalize volume
-        rms = np.sqrt(np.mean(y**2))
-        if rms > 0:
-            y_norm = y * ((10**(-20/20)) / (rms + 1e-9))
-        else:
-            y_norm = y
-
-        # 2. PITCH DETECTION (Optimized)
-        f0, voiced_flag, voiced_probs = librosa.pyin(
-            y_norm, 
-            fmin=50, 
-            fmax=1000, 
-            sr=sr,
-            frame_length=2048,
-            hop_length=HOP_LENGTH # Using 512 here
-        )
-        
-        midi_pitch = librosa.hz_to_midi(np.nan_to_num(f0))
-        midi_pitch[f0 == 0] = 0
-        segments = []
-
-        # 3. ONSET DETECTION (Strategy 1)
-        onset_env = librosa.onset.onset_strength(y=y_norm, sr=sr)
-        onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, backtrack=True)
-        onset_times = librosa.frames_to_time(onsets, sr=sr)
-        
-        if len(onset_times) > 1:
-            for j in range(len(onset_times)-1):
-                t_start = onset_times[j]
-                t_end = onset_times[j+1]
-                
-                # Math must match the new HOP_LENGTH
-                idx_start = int(t_start * sr / HOP_LENGTH)
-                idx_end = int(t_end * sr / HOP_LENGTH)
-                
-                if idx_end > idx_start and idx_end < len(midi_pitch):
-                    segment_pitches = midi_pitch[idx_start:idx_end]
-                    voiced = segment_pitches[segment_pitches > 0]
-                    if len(voiced) > 0:
-                        avg_pitch = int(round(np.median(voiced)))
-                        segments.append({
-                            "start": t_start,
-                            "duration": t_end - t_start,
-                            "pitch": avg_pitch,
-                            "name": librosa.midi_to_note(avg_pitch, unicode=False)
-                        })
-
-        # 4. FALLBACK (Strategy 2 - Sustained Notes)
-        if not segments:
-            print("   ⚠️ Switching to Sustained Mode...")
-            is_voiced = (midi_pitch > 0).astype(int)
-            bounded = np.hstack(([0], is_voiced, [0]))
-            difs = np.diff(bounded)
-            starts = np.where(difs == 1)[0]
-            ends = np.where(difs == -1)[0]
-            
-            # Times generation must also match HOP_LENGTH
-            times = librosa.times_like(f0, sr=sr, hop_length=HOP_LENGTH)
-
-            for s, e in zip(starts, ends):
-                if e > s:
-                    # Safety check for index out of bounds
-                    end_idx = min(e, len(times)-1)
-                    start_idx = min(s, len(times)-1)
-                    
-                    dur = times[end_idx] - times[start_idx]
-                    
-                    if dur > 0.1:
-                        avg_pitch = int(round(np.median(midi_pitch[s:e])))
-                        segments.append({
-                            "start": times[start_idx],
-                            "duration": dur,
-                            "pitch": avg_pitch,
-                            "name": librosa.midi_to_note(avg_pitch, unicode=False)
-                        })
-
-        print(f"✅ Extracted {len(segments)} notes.")
-        return segments
+        return extract_notes_from_analysis(analyze_audio(audio_path))
+    except Exception as e:
+        print(f"❌ Error in transcription: {e}")
+        return []
+
+def extract_notes_from_analysis(analysis: AudioAnalysis):
+    """Segments notes from a precomputed AudioAnalysis (no decoding or pyin here)."""
+    try:
+        notes = segment_notes(analysis)
+        print(f"✅ Extracted {len(notes)} notes.")
+        return notes_to_dicts(notes)
 
     except Exception as e:
         print(f"❌ Error in transcription: {e}")
-        return []
\ No newline at end of file
+        return []
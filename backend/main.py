@@ -1,26 +1,45 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
-from fastapi.responses import Response, FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request, BackgroundTasks, status
+from fastapi.responses import FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-import shutil
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
 import os
-import glob
-import json
-import uuid  # For unique filenames
+import uuid
 
+import config
 # Import core modules
-# UPDATED: Added load_reference_melody to imports
-from core.transcription import extract_notes_from_audio
-from core.music_gen import generate_musicxml
-from core.feedback import calculate_feedback, save_reference_melody, load_reference_melody, generate_performance_pdf
-from core import models, database, auth
+# CPU-heavy work lives in core.pipeline and runs on the analysis executor
+from core import models, database, auth, pipeline, history, jobs, streaming, lessons, reports, heatmaps, assets, archive
+from core.ingest import ingest_upload, pcm_path_for
+from core.ratelimit import too_many_requests
+from core.executor import executor
+from core.analysis import PITCH_ESTIMATORS
+from routers import jobs as jobs_router, websocket as websocket_router, lessons as lessons_router
 
 # --- 1. DATABASE INIT ---
-models.Base.metadata.create_all(bind=database.engine)
+# Importing the app never touches the schema; migrations run here or via `python migrate.py`
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.DB_MIGRATE_ON_STARTUP:
+        models.sync_schema(database.engine)
+    if config.APP_TIER == "all":
+        # Spin up (and warm) the analysis workers before the first request arrives
+        executor.start()
+        streaming.warm_up()
+    # Background jobs: dispatch here unless a separate worker.py process owns them
+    dispatcher = asyncio.create_task(jobs.dispatch_jobs(executor)) if jobs.JOB_RUNNER == "inline" else None
+    yield
+    if dispatcher:
+        dispatcher.cancel()
+    executor.shutdown()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # --- 2. CORS SETUP ---
 app.add_middleware(
@@ -34,176 +53,342 @@ app.add_middleware(
 # --- 3. STORAGE SETUP ---
 os.makedirs("storage/audio_samples", exist_ok=True)
 os.makedirs("storage/history", exist_ok=True)
+os.makedirs(lessons.LESSON_DIR, exist_ok=True)
+os.makedirs(lessons.ATTEMPT_DIR, exist_ok=True)
+
+app.include_router(lessons_router.router)
+app.include_router(jobs_router.router)
+app.include_router(websocket_router.router)
 
 # --- 4. AUTH ENDPOINTS ---
 
+def _client_ip(request: Request):
+    return request.client.host if request.client else "unknown"
+
+# The auth handlers are async so they can await the bcrypt pool; their queries
+# and commits go through the threadpool so a slow or locked database never
+# blocks the event loop.
+def _user_by_name(db: Session, username: str):
+    return db.query(models.User).filter(models.User.username == username).first()
+
+def _commit(db: Session):
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+def _add_user(db: Session, username: str, hashed_password: str):
+    user = models.User(username=username, hashed_password=hashed_password)
+    db.add(user)
+    _commit(db)
+    return user.id
+
 @app.post("/api/register")
-def register(user_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(auth.get_db)):
-    existing = db.query(models.User).filter(models.User.username == user_data.username).first()
+async def register(request: Request, user_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(auth.get_db)):
+    ip = _client_ip(request)
+    auth.check_ip(ip)
+    existing = await run_in_threadpool(_user_by_name, db, user_data.username)
     if existing:
+        auth.ip_failure_limiter.hit(ip)
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_pw = auth.get_password_hash(user_data.password)
-    new_user = models.User(username=user_data.username, hashed_password=hashed_pw)
-    db.add(new_user)
-    db.commit()
+    hashed_pw = await auth.hash_password_async(user_data.password)
+    try:
+        new_user_id = await run_in_threadpool(_add_user, db, user_data.username, hashed_pw)
+    except IntegrityError:
+        # Same name registered while we were hashing
+        auth.ip_failure_limiter.hit(ip)
+        raise HTTPException(status_code=400, detail="Username already registered")
+    auth.ip_success_limiter.hit(ip)
+    # Ids of deleted users can be handed out again
+    auth.invalidate_user(new_user_id)
     return {"status": "success", "message": "User created"}
 
 @app.post("/api/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(auth.get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(auth.get_db)):
+    # Per-IP budgets for failures and successes, per-username limit on failures (blocks guessing one account from many IPs)
+    ip = _client_ip(request)
+    auth.check_ip(ip)
+    wait = auth.login_failure_limiter.retry_after(form_data.username)
+    if wait > 0:
+        raise too_many_requests(wait, "Too many failed logins for this account, please retry later")
+
+    user = await run_in_threadpool(_user_by_name, db, form_data.username)
+    valid, new_hash = await auth.verify_password_async(form_data.password, user.hashed_password if user else None)
+    if not valid:
+        auth.ip_failure_limiter.hit(ip)
+        auth.login_failure_limiter.hit(form_data.username)
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    
-    access_token = auth.create_access_token(data={"sub": user.username})
+    auth.ip_success_limiter.hit(ip)
+    auth.login_failure_limiter.reset(form_data.username)
+
+    # Issued before the commit below, which expires the row's attributes
+    access_token = auth.create_user_token(user)
+    if new_hash:
+        # Stored hash predates the current cost factor; upgrade it now that we know the password
+        user_id = user.id
+        user.hashed_password = new_hash
+        await run_in_threadpool(_commit, db)
+        auth.invalidate_user(user_id)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/api/me/history")
-def get_history(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
-    history = db.query(models.History).filter(models.History.user_id == current_user.id).order_by(models.History.date.desc()).all()
-    return history
+def get_history(
+    limit: int = history.HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,   # next_cursor from the previous page
+    current_user: auth.AuthUser = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    # Summaries only; the analysis blob of an attempt is fetched on demand below
+    return history.history_page(db, current_user.id, limit, cursor)
+
+@app.get("/api/me/history/{history_id}")
+def get_history_item(history_id: int, current_user: auth.AuthUser = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
+    # Stored JSON goes out as-is, no parse/serialize round trip
+    return Response(content=history.attempt_detail(db, current_user.id, history_id), media_type="application/json")
+
+def _owned_attempt_audio(db: Session, user_id: int, history_id: int):
+    return (
+        db.query(models.History.id, models.History.audio_filename)
+        .filter(models.History.id == history_id, models.History.user_id == user_id)
+        .first()
+    )
+
+@app.get("/api/me/history/{history_id}/heatmap")
+async def get_history_heatmap(history_id: int, current_user: auth.AuthUser = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
+    # Rendered from the archived recording on first request, then served from disk
+    attempt = await run_in_threadpool(_owned_attempt_audio, db, current_user.id, history_id)
+    if attempt is None:
+        raise HTTPException(status_code=404, detail="Attempt not found")
+    path = heatmaps.heatmap_cache_path(attempt.id)
+    if not os.path.exists(path):
+        path = await executor.run(heatmaps.render_history_heatmap, attempt.id, attempt.audio_filename)
+    if not path:
+        raise HTTPException(status_code=404, detail="Heatmap not available")
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "private, max-age=31536000, immutable"})
 
 # --- 5. CORE APP ENDPOINTS ---
 
+def _discard(*paths):
+    for path in paths:
+        if path:
+            try: os.remove(path)
+            except OSError: pass
+
+def _resolve_lesson_id(db: Session, user: auth.AuthUser, lesson_id: Optional[int]):
+    lesson = lessons.resolve_lesson(db, user, lesson_id)
+    return lesson.id if lesson else None
+
+def _save_attempt(db: Session, user_id: int, audio_path: str, full_response: dict, archived_filename: str):
+    # Read the id before leaving the thread; the commit expired the row
+    return history.save_attempt(db, user_id, audio_path, full_response, archived_filename).id
+
+def _teach_lesson_id(db: Session, user: auth.AuthUser, lesson_id: Optional[int], title: Optional[str]):
+    lesson = lessons.create_lesson(db, user, title) if lesson_id is None else lessons.get_owned_lesson(db, lesson_id, user)
+    return lesson.id
+
+def _set_lesson_reference(db: Session, lesson_id: int, audio_path: str, reference: dict):
+    lesson = db.get(models.Lesson, lesson_id)
+    lessons.set_reference(db, lesson, audio_path, reference["content_hash"], reference["notes"])
+
+def _delete_lesson(db: Session, lesson_id: int):
+    db.rollback()  # the session may hold a failed commit
+    lesson = db.get(models.Lesson, lesson_id)
+    if lesson is not None:
+        db.delete(lesson)
+        db.commit()
+
 @app.post("/api/teach")
-async def teach_lesson(file: UploadFile = File(...)):
+async def teach_lesson(
+    file: UploadFile = File(...),
+    lesson_id: Optional[int] = Form(None),   # re-record an existing lesson
+    title: Optional[str] = Form(None),
+    current_user: auth.AuthUser = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
     try:
-        # 1. DETECT EXTENSION
+        # 1. PICK LESSON (each upload is isolated per lesson, no shared teacher_reference.*)
+        is_new_lesson = lesson_id is None
+        lesson_id = await run_in_threadpool(_teach_lesson_id, db, current_user, lesson_id, title)
+
+        # 2. DETECT EXTENSION
         filename, file_extension = os.path.splitext(file.filename)
         if not file_extension:
             file_extension = ".wav"
             
-        file_location = f"storage/audio_samples/teacher_reference{file_extension}"
-        
-        # 2. SAVE FILE
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # 3. PROCESS
-        teacher_notes = extract_notes_from_audio(file_location)
-        if not teacher_notes:
-            return {"status": "error", "message": "No notes detected."}
+        file_location = lessons.new_reference_path(lesson_id, file_extension)
+        pcm_path = pcm_path_for(file_location)
 
-        save_reference_melody(teacher_notes)
-        xml_content = generate_musicxml(teacher_notes)
+        saved = False
+        try:
+            # 3. SAVE FILE (streamed in chunks, decoded to PCM while it arrives)
+            upload = await ingest_upload(file, [file_location], pcm_path)
 
-        return {"status": "success", "mode": "teacher", "notes": teacher_notes, "musicxml": xml_content}
+            # 4. PROCESS (in a worker; analysis, notes and MusicXML are cached by content hash)
+            reference = await executor.run(pipeline.run_teach, file_location, upload.pcm_path, upload.content_hash)
+
+            # 5. The new recording replaces the lesson's reference (old cache entry is evicted)
+            if reference:
+                await run_in_threadpool(_set_lesson_reference, db, lesson_id, file_location, reference)
+                saved = True
+        finally:
+            # Anything short of a saved reference (no notes, a full queue, a dropped upload,
+            # a cancelled request) leaves neither the files nor a lesson created for them
+            if not saved:
+                _discard(file_location, pcm_path)
+                if is_new_lesson:
+                    await run_in_threadpool(_delete_lesson, db, lesson_id)
+
+        if not saved:
+            return {"status": "error", "message": "No notes detected."}
+        return {"status": "success", "mode": "teacher", "lesson_id": lesson_id, "notes": reference["notes"], "musicxml": reference["musicxml"]}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/analyze")
 async def analyze_student(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
-    current_user: models.User = Depends(auth.get_current_user), 
+    lesson_id: Optional[int] = Form(None),   # defaults to the most recent lesson
+    estimator: Optional[str] = Form(None),   # "pyin" | "yin"; defaults to PITCH_ESTIMATOR
+    current_user: auth.AuthUser = Depends(auth.get_current_user), 
     db: Session = Depends(auth.get_db)
 ):
     try:
-        # 0. CLEANUP OLD FILES
-        old_files = glob.glob("storage/audio_samples/student_attempt.*")
-        for f in old_files:
-            try: os.remove(f)
-            except OSError: pass
+        if estimator and estimator not in PITCH_ESTIMATORS:
+            raise HTTPException(status_code=400, detail=f"Unknown estimator '{estimator}'")
+        lesson_id = await run_in_threadpool(_resolve_lesson_id, db, current_user, lesson_id)
 
         # 1. DETECT EXTENSION
         filename, file_extension = os.path.splitext(file.filename)
         if not file_extension:
             file_extension = ".wav"
 
-        temp_location = f"storage/audio_samples/student_attempt{file_extension}"
-
-        # 2. SAVE TEMP FILE
-        with open(temp_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # 3. ANALYZE STUDENT
-        student_notes = extract_notes_from_audio(temp_location)
-        feedback = calculate_feedback(student_notes, temp_location)
-        student_xml = generate_musicxml(student_notes)
-        
-        # 4. CAPTURE TEACHER DATA (The Missing Link!)
-        # We load the CURRENT teacher reference and freeze it into this history item.
-        teacher_notes = load_reference_melody()
-        teacher_xml = generate_musicxml(teacher_notes) if teacher_notes else ""
-        
-        teacher_snapshot = {
-            "notes": teacher_notes,
-            "musicxml": teacher_xml
-        }
-
-        full_response = {
-            "status": "success",
-            "mode": "student",
-            "notes": student_notes,
-            "musicxml": student_xml,
-            "feedback": feedback,
-            "teacher_data": teacher_snapshot # <--- SAVED HERE PERMANENTLY
-        }
-
-        # 5. SAVE TO DB
-        unique_filename = f"{current_user.id}_{uuid.uuid4()}{file_extension}"
-        history_path = f"storage/history/{unique_filename}"
-        shutil.copy(temp_location, history_path)
-
-        new_attempt = models.History(
-            score=feedback['score'],
-            feedback_summary=feedback['comments'][0],
-            audio_filename=unique_filename,
-            analysis_data=json.dumps(full_response),
-            user_id=current_user.id
-        )
-        db.add(new_attempt)
-        db.commit()
+        # Per-request paths: concurrent attempts never overwrite each other
+        archived_filename = history.new_archive_filename(current_user.id, file_extension)
+        archive_path = os.path.join(history.HISTORY_DIR, archived_filename)
+        pcm_path = pcm_path_for(lessons.new_attempt_path(file_extension))
+
+        try:
+            # 2. SAVE HISTORY ARCHIVE in one pass (decoded to PCM while it arrives)
+            upload = await ingest_upload(file, [archive_path], pcm_path)
+
+            # 3. ANALYZE STUDENT (in a worker process, off the event loop)
+            # 4. CAPTURE TEACHER DATA (The Missing Link!)
+            # The result includes a frozen teacher snapshot ("teacher_data") that is saved PERMANENTLY.
+            full_response = await executor.run(pipeline.run_analysis, archive_path, lesson_id,
+                                               upload.pcm_path, estimator=estimator)
+
+            # 5. SAVE TO DB
+            attempt_id = await run_in_threadpool(_save_attempt, db, current_user.id, archive_path, full_response, archived_filename)
+        except BaseException:
+            # Includes a half-written upload and a cancelled request: no files
+            # are kept for an attempt that was never recorded
+            _discard(archive_path, pcm_path)
+            raise
+        # Lets the dashboard fetch the lazily rendered heatmap of this attempt
+        full_response["history_id"] = attempt_id
+
+        # 6. ARCHIVE once the response is out: compact playback copy, and the
+        # PCM decoded at ingest is kept as the attempt's re-analysis cache
+        background_tasks.add_task(archive.archive_in_background, executor, attempt_id, upload.pcm_path)
 
         return full_response
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _report_attempt_id(db: Session, user_id: int, history_id: Optional[int]):
+    query = db.query(models.History.id).filter(models.History.user_id == user_id)
+    if history_id is not None:
+        return query.filter(models.History.id == history_id).scalar()
+    return query.order_by(models.History.date.desc()).limit(1).scalar()
+
 @app.get("/api/report")
-async def get_report():
+@app.get("/api/report/{history_id}")
+async def get_report(
+    history_id: Optional[int] = None,   # defaults to the user's latest attempt
+    current_user: auth.AuthUser = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
     try:
-        base_path = "storage/audio_samples/student_attempt"
-        student_path = None
-        for ext in [".wav", ".webm", ".mp3", ".flac", ".m4a", ".aac"]:
-            if os.path.exists(base_path + ext):
-                student_path = base_path + ext
-                break     
-        if not student_path:
+        attempt_id = await run_in_threadpool(_report_attempt_id, db, current_user.id, history_id)
+        if attempt_id is None:
              raise HTTPException(status_code=404, detail="No student recording found")
-        
-        student_notes = extract_notes_from_audio(student_path)
-        feedback = calculate_feedback(student_notes, student_path)
-        
-        pdf_buffer = generate_performance_pdf(student_path, feedback['score'], feedback['detailed_breakdown'])
-        if not pdf_buffer: 
+
+        # Rendered once from the stored analysis; repeat downloads are a file read
+        pdf_path = reports.report_cache_path(attempt_id)
+        if not os.path.exists(pdf_path):
+            pdf_path = await executor.run(reports.render_history_report, attempt_id)
+        if not pdf_path: 
             raise HTTPException(status_code=500, detail="Failed to generate PDF")
             
-        return Response(content=pdf_buffer.read(), media_type="application/pdf", headers={"Content-Disposition": "attachment; filename=Report.pdf"})
+        return FileResponse(pdf_path, media_type="application/pdf", filename="Report.pdf")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _export_attempts(db: Session, user_id: int):
+    """(id, date) of the user's attempts, newest first, and the ids whose report is not cached yet."""
+    attempts = (
+        db.query(models.History.id, models.History.date)
+        .filter(models.History.user_id == user_id)
+        .order_by(models.History.date.desc())
+        .all()
+    )
+    return [tuple(a) for a in attempts], reports.missing_reports([a.id for a in attempts])
+
+@app.get("/api/reports/export")
+async def export_reports(current_user: auth.AuthUser = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
+    """Every report of the user's attempts in one zip; uncached ones are rendered first."""
+    attempts, missing = await run_in_threadpool(_export_attempts, db, current_user.id)
+    if not attempts:
+        raise HTTPException(status_code=404, detail="No student recording found")
+
+    if missing:
+        # One chunk per worker so the reports render side by side
+        chunks = [missing[i::executor.workers] for i in range(min(executor.workers, len(missing)))]
+        await asyncio.gather(*(executor.run(reports.render_history_reports, chunk) for chunk in chunks))
+
+    export_path = os.path.join(reports.EXPORT_DIR, f"{current_user.id}_{uuid.uuid4().hex}.zip")
+    await run_in_threadpool(reports.write_export_zip, attempts, export_path)
+    return FileResponse(export_path, media_type="application/zip", filename="MusicTutor_Reports.zip",
+                        background=BackgroundTask(os.remove, export_path))
+
 # --- 6. AUDIO SERVING ---
 @app.get("/api/audio/{filename}")
-def get_audio(filename: str):
-    path = f"storage/history/{filename}"
-    if not os.path.exists(path):
+def get_audio(request: Request, filename: str):
+    # Range requests let the history player seek without downloading the whole take
+    response = None
+    if filename == os.path.basename(filename) and not filename.startswith("."):
+        # The upload until it is archived, then the store's copy (fetched to the cache if remote)
+        path = archive.local_audio(filename)
+        if path: response = assets.file_response(request, path, assets.AUDIO_CACHE_CONTROL)
+    if response is None:
         raise HTTPException(status_code=404, detail="Audio not found")
-    return FileResponse(path)
+    return response
 
 # --- 7. SERVE FRONTEND ---
 frontend_path = "../frontend/dist"
 if os.path.exists(frontend_path):
-    app.mount("/assets", StaticFiles(directory=f"{frontend_path}/assets"), name="assets")
+    # Every file of the build is indexed once here; requests are dictionary lookups
+    frontend_assets = assets.AssetIndex(frontend_path)
     @app.get("/{full_path:path}")
-    async def serve_react_app(full_path: str):
+    async def serve_react_app(request: Request, full_path: str):
         if full_path.startswith("api/"):
             raise HTTPException(status_code=404, detail="API Endpoint Not Found")
-        file_path = os.path.join(frontend_path, full_path)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return FileResponse(file_path)
-        return FileResponse(f"{frontend_path}/index.html")
+        response = frontend_assets.serve(request, full_path)
+        if response is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return response
 else:
     print("WARNING: Frontend build folder not found.")
 
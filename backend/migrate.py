@@ -0,0 +1,20 @@
+"""
+Brings the database schema up to date (new tables, columns and indexes).
+
+Run it once per deploy, before starting the API and workers:
+
+    python migrate.py
+
+and set DB_MIGRATE_ON_STARTUP=0 so several app processes never race to
+alter the schema at the same time.
+"""
+from core import models, database
+
+
+def main():
+    models.sync_schema(database.engine)
+    print(f"✅ Schema up to date ({database.engine.url.render_as_string(hide_password=True)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Re-score stored attempts after a scoring change.
+
+Re-runs transcription and feedback on every archived recording in
+storage/history and updates each History score and stored result in place:
+
+    python rescore.py --workers 8
+    python rescore.py --lesson-id 3 --estimator yin
+    python rescore.py --retry-failed
+
+Interrupt it at any time; the next run resumes from the checkpoint.
+Use --restart to start over (e.g. after changing scoring parameters again).
+"""
+import argparse
+import os
+
+import config
+from core import models, database, rescore
+from core.analysis import PITCH_ESTIMATORS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored History attempts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="analysis processes to run")
+    parser.add_argument("--batch-size", type=int, default=rescore.RESCORE_BATCH_SIZE, help="rows per update transaction")
+    parser.add_argument("--checkpoint", default=rescore.RESCORE_CHECKPOINT, help="progress file used to resume")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and re-score everything")
+    parser.add_argument("--retry-failed", action="store_true", help="also retry attempts that failed last time")
+    parser.add_argument("--user-id", type=int, help="only this user's attempts")
+    parser.add_argument("--lesson-id", type=int, help="only attempts against this lesson")
+    parser.add_argument("--estimator", choices=sorted(PITCH_ESTIMATORS), help="override each attempt's pitch estimator")
+    parser.add_argument("--limit", type=int, help="stop after this many attempts")
+    args = parser.parse_args()
+
+    if config.DB_MIGRATE_ON_STARTUP:
+        models.sync_schema(database.engine)
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    try:
+        rescore.rescore_history(
+            max(1, args.workers),
+            batch_size=max(1, args.batch_size),
+            checkpoint_path=args.checkpoint,
+            user_id=args.user_id,
+            lesson_id=args.lesson_id,
+            estimator=args.estimator,
+            limit=args.limit,
+            retry_failed=args.retry_failed,
+        )
+    except KeyboardInterrupt:
+        print("⏸️ Interrupted, progress saved to checkpoint")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.orm import Session
+
+from core import models, auth, database, jobs, lessons, history
+from core.ingest import ingest_upload, pcm_path_for
+from core.analysis import PITCH_ESTIMATORS
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+# How often the progress stream re-checks the job row
+STREAM_POLL_INTERVAL = 0.5
+
+
+def _get_owned_job(db: Session, job_id: str, user: auth.AuthUser) -> models.AnalysisJob:
+    job = db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job_id).first()
+    if job is None or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _create_job(db: Session, user: auth.AuthUser, lesson_id, file_extension, estimator):
+    # Resolved now so the job keeps its lesson even if a newer one is taught meanwhile
+    lesson = lessons.resolve_lesson(db, user, lesson_id)
+    job = jobs.create_job(db, user.id, file_extension, lesson.id if lesson else None, estimator)
+    return job, job.audio_path
+
+
+@router.post("", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    lesson_id: Optional[int] = Form(None),
+    estimator: Optional[str] = Form(None),   # "pyin" | "yin"; defaults to PITCH_ESTIMATOR
+    current_user: auth.AuthUser = Depends(auth.get_current_user),
+    db: Session = Depends(auth.get_db)
+):
+    """Stores the upload and returns a job id immediately; analysis runs in the background."""
+    filename, file_extension = os.path.splitext(file.filename)
+    if not file_extension:
+        file_extension = ".wav"
+
+    if estimator and estimator not in PITCH_ESTIMATORS:
+        raise HTTPException(status_code=400, detail=f"Unknown estimator '{estimator}'")
+
+    # Database work runs in the threadpool so a locked SQLite file never stalls the event loop
+    job, audio_path = await run_in_threadpool(_create_job, db, current_user, lesson_id, file_extension, estimator)
+    try:
+        # Decoding to PCM overlaps the upload; the worker skips librosa.load
+        await ingest_upload(file, [audio_path], pcm_path_for(audio_path))
+    except Exception as e:
+        await run_in_threadpool(jobs.fail_upload, db, job, str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    status = await run_in_threadpool(jobs.enqueue, db, job)
+    jobs.wake_dispatcher()
+    return status
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str, current_user: auth.AuthUser = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
+    return jobs.job_status(_get_owned_job(db, job_id, current_user))
+
+
+def _poll_status(job_id: str):
+    db = database.SessionLocal()
+    try:
+        job = db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job_id).first()
+        return jobs.job_status(job) if job is not None else None
+    finally:
+        db.close()
+
+
+@router.get("/{job_id}/events")
+def stream_job(job_id: str, current_user: auth.AuthUser = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
+    """Server-sent events: one message per stage change, closing once the job finishes."""
+    _get_owned_job(db, job_id, current_user)
+
+    async def event_stream():
+        last_stage = None
+        while True:
+            status = await run_in_threadpool(_poll_status, job_id)
+            if status is None:
+                # Row deleted mid-stream: end with a terminal event instead of a broken response
+                yield f"event: gone\ndata: {json.dumps({'id': job_id, 'status': 'gone'})}\n\n"
+                break
+
+            if status["stage"] != last_stage:
+                last_stage = status["stage"]
+                yield f"event: {status['status']}\ndata: {json.dumps(status, default=str)}\n\n"
+            if status["status"] in jobs.FINISHED_STATUSES:
+                break
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str, current_user: auth.AuthUser = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
+    """Returns the same payload /api/analyze does, once the job is done."""
+    job = _get_owned_job(db, job_id, current_user)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error or "Analysis failed")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is still {job.stage}")
+
+    attempt = db.query(*history.ANALYSIS_COLUMNS).filter(models.History.id == job.history_id).first()
+    data = history.analysis_json(db, attempt) if attempt is not None else None
+    if data is None:
+        raise HTTPException(status_code=404, detail="Result no longer available")
+    return Response(content=data, media_type="application/json")
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from core import models, auth, lessons
+from core.feedback import load_reference_melody
+
+router = APIRouter(prefix="/api/lessons", tags=["lessons"])
+
+
+@router.get("")
+def list_lessons(current_user: auth.AuthUser = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
+    """All lessons with a reference recording, newest first (students pick one to practise)."""
+    rows = (
+        db.query(models.Lesson)
+        .filter(models.Lesson.audio_path.isnot(None))
+        .order_by(models.Lesson.updated_at.desc())
+        .all()
+    )
+    return [lessons.lesson_summary(lesson) for lesson in rows]
+
+
+@router.get("/{lesson_id}")
+def get_lesson(lesson_id: int, current_user: auth.AuthUser = Depends(auth.get_current_user), db: Session = Depends(auth.get_db)):
+    lesson = lessons.resolve_lesson(db, current_user, lesson_id)
+    return {**lessons.lesson_summary(lesson), "notes": load_reference_melody(lesson)}
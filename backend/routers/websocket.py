@@ -0,0 +1,154 @@
+import json
+import os
+import time
+import numpy as np
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+
+from core import auth, database, lessons
+from core.feedback import load_reference_melody
+from core.streaming import StreamingTranscriber, LiveAligner
+
+router = APIRouter()
+
+# Wire formats accepted for binary PCM frames (little-endian, mono)
+PCM_FORMATS = {
+    "f32": (np.dtype("<f4"), 1.0),
+    "s16": (np.dtype("<i2"), 1.0 / 32768.0),
+}
+# Capture rates a client may announce (Hz)
+MIN_SAMPLE_RATE, MAX_SAMPLE_RATE = 8000, 192000
+# Longest binary frame accepted (seconds of audio at the announced rate); clients send ~100 ms
+MAX_FRAME_SECONDS = float(os.getenv("LIVE_MAX_FRAME_SECONDS", 1.0))
+
+
+def _parse_control(text, sample_rate, pcm_format):
+    """Control frame -> (message, error). message has the validated sample_rate/format filled in."""
+    try:
+        control = json.loads(text)
+    except ValueError:
+        return None, "Control frames must be JSON"
+    if not isinstance(control, dict):
+        return None, "Control frames must be JSON objects"
+    if control.get("type") == "stop":
+        return control, None
+
+    pcm_format = control.get("format", pcm_format)
+    if pcm_format not in PCM_FORMATS:
+        return None, f"Unsupported format '{pcm_format}'"
+    try:
+        sample_rate = int(control.get("sample_rate", sample_rate))
+    except (TypeError, ValueError):
+        return None, "sample_rate must be an integer"
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        return None, f"sample_rate must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE}"
+    return {**control, "sample_rate": sample_rate, "format": pcm_format}, None
+
+
+def _open_session(token, lesson_id):
+    """Authenticates the handshake and loads the lesson's teacher melody."""
+    db = database.SessionLocal()
+    try:
+        user = auth.get_user_from_token(token, db)
+        lesson = lessons.resolve_lesson(db, user, lesson_id)
+        return user, load_reference_melody(lesson)
+    finally:
+        db.close()
+
+
+def _process_chunk(transcriber, aligner, chunk):
+    """Pitch-tracks one chunk and aligns any finished notes (CPU-bound; runs in the threadpool)."""
+    events = transcriber.feed(chunk)
+    for event in [e for e in events if e["type"] == "note"]:
+        events.append(aligner.step(event))
+    return events
+
+
+def _finish(transcriber, aligner):
+    events = transcriber.flush()
+    for event in list(events):
+        events.append(aligner.step(event))
+    return events
+
+
+@router.websocket("/ws/live")
+async def live_session(websocket: WebSocket, token: str = Query(None), lesson_id: int = Query(None)):
+    """
+    Live pitch tracking while the student sings.
+
+    Protocol:
+      1. connect with ?token=<jwt>[&lesson_id=<id>] (defaults to the latest lesson)
+      2. optional text frame, before any audio: {"sample_rate": 44100, "format": "f32" | "s16"}
+      3. binary frames: raw mono PCM chunks of at most MAX_FRAME_SECONDS
+      4. text frame {"type": "stop"} -> final notes + score, then close
+    Server pushes "pitch", "note" and "alignment" events as they happen.
+    """
+    try:
+        user, teacher_notes = await run_in_threadpool(_open_session, token, lesson_id)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    sample_rate, pcm_format = 16000, "f32"
+    transcriber = StreamingTranscriber(input_sr=sample_rate)
+    aligner = LiveAligner(teacher_notes)
+    audio_started = False
+    max_chunk_ms = 0.0
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+            if message.get("text") is not None:
+                # A rejected frame leaves the current configuration in place
+                control, error = _parse_control(message["text"], sample_rate, pcm_format)
+                if error:
+                    await websocket.send_json({"type": "error", "message": error})
+                    continue
+                if control.get("type") == "stop":
+                    break
+                if audio_started:
+                    # The transcriber's clock and the aligner's position both belong to the running take
+                    await websocket.send_json({"type": "error", "message": "Reconnect to change sample_rate or format once audio has started"})
+                    continue
+                # (Re)configure the stream before audio starts flowing
+                sample_rate, pcm_format = control["sample_rate"], control["format"]
+                transcriber = StreamingTranscriber(input_sr=sample_rate)
+                await websocket.send_json({"type": "ready", "sample_rate": sample_rate, "format": pcm_format})
+                continue
+
+            dtype, scale = PCM_FORMATS[pcm_format]
+            payload = message.get("bytes") or b""
+            if len(payload) % dtype.itemsize:
+                await websocket.send_json({"type": "error", "message": f"Frame is not a whole number of {pcm_format} samples"})
+                continue
+            if len(payload) // dtype.itemsize > sample_rate * MAX_FRAME_SECONDS:
+                await websocket.send_json({"type": "error", "message": f"Frames may hold at most {MAX_FRAME_SECONDS:g} s of audio"})
+                continue
+            chunk = np.frombuffer(payload, dtype=dtype).astype(np.float32) * scale
+            audio_started = True
+
+            started = time.perf_counter()
+            events = await run_in_threadpool(_process_chunk, transcriber, aligner, chunk)
+            max_chunk_ms = max(max_chunk_ms, (time.perf_counter() - started) * 1000)
+
+            for event in events:
+                await websocket.send_json(event)
+
+        # Stream ended: close the last note and report the session
+        events = await run_in_threadpool(_finish, transcriber, aligner)
+        for event in events:
+            await websocket.send_json(event)
+        await websocket.send_json({
+            "type": "summary",
+            "user": user.username,
+            "notes": transcriber.notes,
+            "score": aligner.score,
+            "max_chunk_ms": round(max_chunk_ms, 2),
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
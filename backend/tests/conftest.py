@@ -0,0 +1,33 @@
+"""
+Every test session gets its own SQLite database and storage directory:
+the settings are read from the environment when config/core are imported,
+and the storage paths are relative to the working directory.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="music-tutor-tests-")
+
+sys.path.insert(0, BACKEND_DIR)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.chdir(WORK_DIR)
+
+import pytest
+
+from core import auth, database, models
+
+
+@pytest.fixture
+def db():
+    models.sync_schema(database.engine)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        models.Base.metadata.drop_all(database.engine)
+        # Ids restart with the tables; cached users must not outlive them
+        auth._user_cache.clear()
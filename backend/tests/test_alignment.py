@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from core.alignment import align_notes, dtw, sakoe_chiba_band
+
+
+def _brute_force_dtw(cost, lo=None, hi=None):
+    """Textbook full-matrix DTW; cells outside [lo, hi) are unreachable."""
+    n, m = cost.shape
+    D = np.full((n + 1, m + 1), np.inf)
+    D[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            if lo is not None and not lo[i - 1] <= j - 1 < hi[i - 1]:
+                continue
+            D[i, j] = cost[i - 1, j - 1] + min(D[i - 1, j - 1], D[i - 1, j], D[i, j - 1])
+    return D[n, m]
+
+
+def _check_path(path, cost, total, n, m):
+    assert tuple(path[0]) == (0, 0) and tuple(path[-1]) == (n - 1, m - 1)
+    steps = np.diff(path, axis=0)
+    assert ((steps >= 0) & (steps <= 1)).all() and (steps.sum(axis=1) > 0).all()
+    assert cost[path[:, 0], path[:, 1]].sum() == pytest.approx(total)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_banded_dtw_is_exact(seed):
+    rng = np.random.default_rng(seed)
+    n, m = int(rng.integers(1, 15)), int(rng.integers(1, 15))
+    cost = rng.uniform(0, 5, (n, m))
+
+    # A full-width band is plain DTW
+    total, path = dtw(cost, np.zeros(n, dtype=np.int64), np.full(n, m, dtype=np.int64))
+    assert total == pytest.approx(_brute_force_dtw(cost))
+    _check_path(path, cost, total, n, m)
+
+    # Narrow bands give the exact optimum over the cells they allow
+    lo, hi = sakoe_chiba_band(n, m, radius=int(rng.integers(0, 4)))
+    total, path = dtw(cost, lo, hi)
+    assert total == pytest.approx(_brute_force_dtw(cost, lo, hi))
+    _check_path(path, cost, total, n, m)
+    assert ((lo[path[:, 0]] <= path[:, 1]) & (path[:, 1] < hi[path[:, 0]])).all()
+
+
+def _melody():
+    pitches = [60, 62, 64, 65, 67, 65, 64, 62]
+    return [{"start": 0.5 * i, "duration": 0.45, "pitch": p} for i, p in enumerate(pitches)]
+
+
+def test_rhythm_errors_are_measured_at_the_teachers_tempo():
+    teacher = _melody()
+    # The whole take is 1.5x slower (and starts later), which is not a rhythm error
+    student = [{**note, "start": 2.0 + 1.5 * note["start"], "duration": 1.5 * note["duration"]} for note in teacher]
+    alignment = align_notes(teacher, student)
+
+    assert alignment.tempo_ratio == pytest.approx(1.5)
+    assert alignment.pitch_distance == 0
+    for t, match in enumerate(alignment.matches):
+        assert match["student_index"] == t
+        assert match["timing_error"] == pytest.approx(0, abs=1e-9)
+        assert match["duration_error"] == pytest.approx(0, abs=1e-9)
+
+    # One note comes 0.3 s late and is held 0.3 s longer: at the teacher's tempo that is 0.2 s each
+    student[3] = {**student[3], "start": student[3]["start"] + 0.3, "duration": student[3]["duration"] + 0.3}
+    alignment = align_notes(teacher, student)
+    late = alignment.matches[3]
+    assert late["student_index"] == 3
+    assert late["timing_error"] == pytest.approx(0.2)
+    assert late["duration_error"] == pytest.approx(0.2)
+    assert all(abs(m["timing_error"]) < 1e-9 for i, m in enumerate(alignment.matches) if i != 3)
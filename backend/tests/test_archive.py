@@ -0,0 +1,46 @@
+import os
+
+from core import archive
+
+
+def _add(name, nbytes):
+    path = os.path.join(archive.ARCHIVE_CACHE_DIR, name)
+    with open(path, "wb") as f:
+        f.write(b"\0" * nbytes)
+    archive._cache_added(nbytes)
+    return path
+
+
+def test_cache_is_scanned_only_when_over_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(archive, "ARCHIVE_CACHE_MB", 1)
+    monkeypatch.setattr(archive, "_cache_bytes", None)
+    scans = []
+    real_evict = archive.evict_cache
+    monkeypatch.setattr(archive, "evict_cache", lambda *a: scans.append(1) or real_evict(*a))
+
+    oldest = _add("first.f32", 300_000)           # first write in a process: one scan to learn the size
+    for i in range(2):
+        _add(f"next{i}.f32", 300_000)             # running total still under 1 MB: no scan
+    assert len(scans) == 1
+
+    os.utime(oldest, (0, 0))
+    _add("over.f32", 300_000)                     # 1.2 MB > budget: scan and evict the oldest
+    assert len(scans) == 2
+    assert not os.path.exists(oldest)
+    assert archive._cache_bytes == 900_000
+
+
+def test_cache_rescans_periodically_to_see_other_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(archive, "ARCHIVE_CACHE_RESCAN_WRITES", 3)
+    monkeypatch.setattr(archive, "_cache_bytes", None)
+
+    _add("a.f32", 10)
+    with open(tmp_path / "other_process.f32", "wb") as f:
+        f.write(b"\0" * 1000)
+    _add("b.f32", 10)
+    _add("c.f32", 10)
+    assert archive._cache_bytes == 30
+    _add("d.f32", 10)                             # third write since the scan: rescan picks up the other file
+    assert archive._cache_bytes == 1040
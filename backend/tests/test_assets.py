@@ -0,0 +1,83 @@
+import gzip
+import os
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+import main
+from core import archive, assets
+
+SCRIPT = b"console.log('tutor');" * 200
+
+
+def _frontend(tmp_path):
+    dist = tmp_path / "dist"
+    (dist / "assets").mkdir(parents=True)
+    (dist / "index.html").write_bytes(b"<!doctype html><div id=root></div>")
+    (dist / "assets" / "app-1a2b.js").write_bytes(SCRIPT)
+    (dist / "assets" / "app-1a2b.js.gz").write_bytes(gzip.compress(SCRIPT))
+    (dist / "assets" / "app-1a2b.js.br").write_bytes(b"brotli bytes")
+    index = assets.AssetIndex(str(dist))
+
+    app = FastAPI()
+
+    @app.get("/{full_path:path}")
+    def frontend(request: Request, full_path: str):
+        response = index.serve(request, full_path)
+        if response is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return response
+
+    return TestClient(app)
+
+
+def test_assets_negotiate_precompressed_variants(tmp_path):
+    client = _frontend(tmp_path)
+
+    brotli = client.get("/assets/app-1a2b.js", headers={"Accept-Encoding": "gzip, br"})
+    assert brotli.headers["content-encoding"] == "br"
+    assert brotli.headers["vary"] == "Accept-Encoding"
+    assert brotli.headers["cache-control"] == assets.IMMUTABLE_CACHE_CONTROL
+
+    gzipped = client.get("/assets/app-1a2b.js", headers={"Accept-Encoding": "gzip, br;q=0"})
+    assert gzipped.headers["content-encoding"] == "gzip" and gzipped.content == SCRIPT
+    assert gzipped.headers["vary"] == "Accept-Encoding"
+
+    plain = client.get("/assets/app-1a2b.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.content == SCRIPT
+    # Every representation has its own validator
+    assert len({r.headers["etag"] for r in (brotli, gzipped, plain)}) == 3
+
+    revalidated = client.get("/assets/app-1a2b.js", headers={"Accept-Encoding": "br", "If-None-Match": brotli.headers["etag"]})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+    assert revalidated.headers["vary"] == "Accept-Encoding"
+
+
+def test_unknown_assets_404_but_client_routes_get_the_page(tmp_path):
+    client = _frontend(tmp_path)
+
+    assert client.get("/assets/app-old.js").status_code == 404
+    page = client.get("/lessons/3")
+    assert page.status_code == 200 and page.content.startswith(b"<!doctype html>")
+    assert page.headers["cache-control"] == assets.PAGE_CACHE_CONTROL
+    assert client.get("/", headers={"If-None-Match": page.headers["etag"]}).status_code == 304
+
+
+def test_audio_supports_ranges_and_revalidation():
+    os.makedirs(archive.HISTORY_DIR, exist_ok=True)
+    take = bytes(range(256)) * 40
+    with open(os.path.join(archive.HISTORY_DIR, "7_take.wav"), "wb") as f:
+        f.write(take)
+    client = TestClient(main.app)
+
+    full = client.get("/api/audio/7_take.wav")
+    assert full.status_code == 200 and full.content == take
+    assert full.headers["cache-control"] == assets.AUDIO_CACHE_CONTROL
+
+    partial = client.get("/api/audio/7_take.wav", headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206 and partial.content == take[100:200]
+    assert partial.headers["content-range"] == f"bytes 100-199/{len(take)}"
+
+    assert client.get("/api/audio/7_take.wav", headers={"If-None-Match": full.headers["etag"]}).status_code == 304
+    assert client.get("/api/audio/missing.wav").status_code == 404
+    assert client.get("/api/audio/..%2Fmusic_tutor.db").status_code == 404
@@ -0,0 +1,82 @@
+from fastapi.testclient import TestClient
+
+import main
+from core import auth
+from core.ratelimit import SlidingWindowLimiter
+
+
+def test_register_login_and_authenticated_request(db):
+    client = TestClient(main.app)
+    form = {"username": "teacher", "password": "s3cret-pass"}
+
+    assert client.post("/api/register", data=form).status_code == 200
+    assert client.post("/api/register", data=form).status_code == 400
+    assert client.post("/api/token", data={**form, "password": "wrong"}).status_code == 401
+
+    token = client.post("/api/token", data=form).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/me/history", headers=headers).status_code == 200
+    # Second request is served from the user cache
+    assert client.get("/api/me/history", headers=headers).status_code == 200
+    assert client.get("/api/me/history", headers={"Authorization": "Bearer nope"}).status_code == 401
+
+
+def test_login_upgrades_weak_hashes(db, monkeypatch):
+    client = TestClient(main.app)
+    form = {"username": "legacy", "password": "old-password"}
+    weak_context = auth.pwd_context.copy(bcrypt__default_rounds=4, bcrypt__min_rounds=4)
+    monkeypatch.setattr(auth, "pwd_context", weak_context)
+    assert client.post("/api/register", data=form).status_code == 200
+    monkeypatch.setattr(auth, "pwd_context", weak_context.copy(bcrypt__default_rounds=5, bcrypt__min_rounds=5))
+
+    response = client.post("/api/token", data=form)
+    assert response.status_code == 200 and response.json()["access_token"]
+    stored = db.query(main.models.User).filter(main.models.User.username == "legacy").one().hashed_password
+    assert stored.startswith("$2b$05$")
+
+
+def test_recycled_user_ids_never_serve_a_stale_cache_entry(db):
+    client = TestClient(main.app)
+    form = {"username": "first", "password": "pass-one"}
+    client.post("/api/register", data=form)
+    token = client.post("/api/token", data=form).json()["access_token"]
+    assert client.get("/api/me/history", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    user = db.query(main.models.User).filter(main.models.User.username == "first").one()
+    user_id = user.id
+    assert auth._cached_user(user_id).username == "first"
+
+    db.delete(user)
+    db.commit()
+    form = {"username": "second", "password": "pass-two"}
+    assert client.post("/api/register", data=form).status_code == 200
+    assert db.query(main.models.User).filter(main.models.User.username == "second").one().id == user_id
+    assert auth._cached_user(user_id) is None
+
+
+def _fresh_ip_limits(monkeypatch, failures=30, successes=600):
+    monkeypatch.setattr(auth, "ip_failure_limiter", SlidingWindowLimiter(failures, 60))
+    monkeypatch.setattr(auth, "ip_success_limiter", SlidingWindowLimiter(successes, 60))
+
+
+def test_a_classroom_behind_one_ip_can_all_sign_in(db, monkeypatch):
+    _fresh_ip_limits(monkeypatch)
+    client = TestClient(main.app)
+    form = {"username": "pupil", "password": "class-pass"}
+    assert client.post("/api/register", data=form).status_code == 200
+
+    for _ in range(40):
+        assert client.post("/api/token", data=form).status_code == 200
+
+
+def test_failed_attempts_from_one_ip_are_limited(db, monkeypatch):
+    _fresh_ip_limits(monkeypatch, failures=5)
+    client = TestClient(main.app)
+    form = {"username": "pupil", "password": "class-pass"}
+    assert client.post("/api/register", data=form).status_code == 200
+
+    # Different usernames, so only the per-IP budget applies
+    for i in range(5):
+        assert client.post("/api/token", data={"username": f"guess{i}", "password": "x"}).status_code == 401
+    response = client.post("/api/token", data=form)
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) > 0
+    assert client.post("/api/register", data={"username": "new", "password": "x"}).status_code == 429
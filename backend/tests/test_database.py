@@ -0,0 +1,28 @@
+from sqlalchemy import text
+
+import config
+from core import database
+
+
+def _pragma(connection, name):
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_sqlite_connections_get_the_configured_pragmas():
+    with database.engine.connect() as connection:
+        assert _pragma(connection, "journal_mode").upper() == config.SQLITE_JOURNAL_MODE.upper()
+        assert _pragma(connection, "synchronous") == 1   # NORMAL
+        assert _pragma(connection, "busy_timeout") == config.SQLITE_BUSY_TIMEOUT_MS
+        assert _pragma(connection, "cache_size") == -config.SQLITE_CACHE_SIZE_KB
+        assert _pragma(connection, "temp_store") == 2    # MEMORY
+
+
+def test_in_memory_databases_share_one_connection():
+    engine = database.make_engine("sqlite://")
+    with engine.connect() as connection:
+        connection.execute(text("CREATE TABLE probe (x INTEGER)"))
+        connection.commit()
+        # Pragmas apply to the shared connection too
+        assert _pragma(connection, "busy_timeout") == config.SQLITE_BUSY_TIMEOUT_MS
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM probe")).scalar() == 0
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from core import auth, models
+from core.analysis import HOP_LENGTH, TARGET_SR, YinEstimator, get_estimator
+
+
+def _tone(freq, seconds=1.0, sr=TARGET_SR):
+    t = np.arange(int(seconds * sr)) / sr
+    # A few harmonics, like a sung or bowed note
+    return sum(amp * np.sin(2 * np.pi * k * freq * t) for k, amp in enumerate((1.0, 0.5, 0.25), start=1)).astype(np.float32) * 0.3
+
+
+@pytest.mark.parametrize("freq", [82.4, 196.0, 440.0, 880.0])
+def test_yin_tracks_a_steady_tone(freq):
+    y = _tone(freq)
+    f0, voiced, probs = YinEstimator().estimate(y, TARGET_SR, HOP_LENGTH)
+
+    assert len(f0) == len(voiced) == len(probs) == 1 + len(y) // HOP_LENGTH
+    steady = slice(4, -4)   # frames that overlap the padded edges are excluded
+    assert voiced[steady].all()
+    cents = 1200 * np.abs(np.log2(f0[steady] / freq))
+    assert np.median(cents) < 5 and cents.max() < 20
+
+
+def test_yin_is_unvoiced_on_silence_and_independent_of_blocking():
+    y = np.concatenate([np.zeros(TARGET_SR // 2, dtype=np.float32), _tone(330.0)])
+    estimator = YinEstimator()
+    f0, voiced, _ = estimator.estimate(y, TARGET_SR, HOP_LENGTH)
+    assert not voiced[:10].any() and np.isnan(f0[:10]).all()
+
+    blocked = estimator.estimate(y, TARGET_SR, HOP_LENGTH, block_frames=7)
+    np.testing.assert_array_equal(blocked[1], voiced)
+    np.testing.assert_allclose(blocked[0], f0, equal_nan=True)
+
+
+def test_unknown_estimators_are_rejected(db):
+    with pytest.raises(ValueError):
+        get_estimator("crepe")
+
+    user = models.User(username="student", hashed_password="x")
+    db.add(user)
+    db.commit()
+    client = TestClient(main.app)
+    headers = {"Authorization": f"Bearer {auth.create_user_token(user)}"}
+    for path in ("/api/analyze", "/api/jobs"):
+        response = client.post(path, data={"estimator": "crepe"},
+                               files={"file": ("take.wav", b"RIFF", "audio/wav")}, headers=headers)
+        assert response.status_code == 400 and "crepe" in response.json()["detail"]
+    assert db.query(models.AnalysisJob).count() == 0
+    assert db.query(models.History).count() == 0
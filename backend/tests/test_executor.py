@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from core import auth, executor as executor_module, models
+from core.executor import AnalysisExecutor
+
+
+def test_full_queue_is_turned_away_with_retry_after():
+    release = threading.Event()
+    pool = AnalysisExecutor("thread", workers=1, queue_limit=1)
+
+    async def scenario():
+        busy = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as rejected:
+            await pool.run(sum, [1, 2])
+        release.set()
+        await busy
+        # Once the slot frees up, work is accepted again
+        return rejected.value, await pool.run(sum, [1, 2])
+
+    try:
+        rejected, result = asyncio.run(scenario())
+    finally:
+        release.set()
+        pool.shutdown()
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == str(executor_module.ANALYSIS_RETRY_AFTER)
+    assert result == 3 and pool.pending == 0
+
+
+def test_analyze_answers_503_when_the_executor_is_saturated(db, monkeypatch):
+    user = models.User(username="student", hashed_password="x")
+    db.add(user)
+    db.commit()
+    saturated = AnalysisExecutor("thread", workers=1, queue_limit=1)
+    saturated._pending = 1
+    monkeypatch.setattr(main, "executor", saturated)
+
+    response = TestClient(main.app).post(
+        "/api/analyze", files={"file": ("take.wav", b"RIFF0000WAVE", "audio/wav")},
+        headers={"Authorization": f"Bearer {auth.create_user_token(user)}"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(executor_module.ANALYSIS_RETRY_AFTER)
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from core import auth, heatmaps, models
+from core.analysis import AudioAnalysis, HOP_LENGTH, TARGET_SR
+from core.feedback import _bin_stats, generate_graph_data
+
+
+def _loop_bins(values, n_bins, decimals):
+    """One slice per bin, as the graphs were computed before binning was vectorized."""
+    stats = {"mean": [], "min": [], "max": []}
+    edges = np.linspace(0, len(values), n_bins + 1).astype(np.int64)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        chunk = values[lo:hi]
+        chunk = chunk[np.isfinite(chunk)]
+        for key, fn in (("mean", np.mean), ("min", np.min), ("max", np.max)):
+            stats[key].append(round(float(fn(chunk)), decimals) if len(chunk) else None)
+    return stats
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_binned_columns_match_per_bin_statistics(seed):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(50, 500, int(rng.integers(1, 400)))
+    values[rng.random(len(values)) < 0.3] = np.nan          # unvoiced frames
+    values[: int(rng.integers(0, 30))] = np.nan             # a silent lead-in (whole bins empty)
+    n_bins = int(rng.integers(1, len(values) + 1))
+
+    binned = _bin_stats(values, n_bins, 2)
+    expected = _loop_bins(values, n_bins, 2)
+    for key in ("mean", "min", "max"):
+        assert len(binned[key]) == n_bins
+        assert [v is None for v in binned[key]] == [v is None for v in expected[key]]
+        np.testing.assert_allclose([v for v in binned[key] if v is not None],
+                                   [v for v in expected[key] if v is not None], atol=0.011)
+
+
+def _analysis(n_frames, seed):
+    rng = np.random.default_rng(seed)
+    analysis = AudioAnalysis.__new__(AudioAnalysis)
+    analysis.sr, analysis.hop_length = TARGET_SR, HOP_LENGTH
+    analysis.f0 = np.where(rng.random(n_frames) < 0.8, rng.uniform(100, 400, n_frames), np.nan)
+    analysis.rms = rng.uniform(0, 0.2, n_frames)
+    return analysis
+
+
+def test_graph_data_is_columnar_on_the_teachers_timeline():
+    teacher, student = _analysis(1000, 0), _analysis(1300, 1)
+    notes = [{"start": 0.1, "duration": 0.5, "pitch": 60}]
+    data = generate_graph_data(student, notes, notes, teacher)
+
+    seconds = data["seconds"]
+    assert len(seconds) == 100 and np.all(np.diff(seconds) > 0)
+    assert seconds[-1] < 1000 * HOP_LENGTH / TARGET_SR
+    for curve in ("pitch", "rms"):
+        for side in ("teacher", "student"):
+            assert all(len(data[curve][side][key]) == 100 for key in ("mean", "min", "max"))
+    assert data["heatmap"] is None and data["piano_roll"]["teacher"]["pitch"] == [60]
+
+
+def test_heatmap_is_only_served_to_the_attempts_owner(db):
+    owner = models.User(username="owner", hashed_password="x")
+    other = models.User(username="other", hashed_password="x")
+    db.add_all([owner, other])
+    db.commit()
+    attempt = models.History(score=1, feedback_summary="-", audio_filename="gone.wav", user_id=owner.id)
+    db.add(attempt)
+    db.commit()
+    client = TestClient(main.app)
+
+    path = f"/api/me/history/{attempt.id}/heatmap"
+    assert client.get(path, headers={"Authorization": f"Bearer {auth.create_user_token(other)}"}).status_code == 404
+    os.makedirs(heatmaps.HEATMAP_DIR, exist_ok=True)
+    with open(heatmaps.heatmap_cache_path(attempt.id), "wb") as f:
+        f.write(b"\x89PNG cached")
+    try:
+        response = client.get(path, headers={"Authorization": f"Bearer {auth.create_user_token(owner)}"})
+    finally:
+        os.remove(heatmaps.heatmap_cache_path(attempt.id))
+    assert response.status_code == 200 and response.content == b"\x89PNG cached"
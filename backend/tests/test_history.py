@@ -0,0 +1,113 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from core import auth, history, models
+
+
+def _user(db, username="student"):
+    user = models.User(username=username, hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _attempts(db, user, dates):
+    rows = [models.History(score=50, feedback_summary="ok", audio_filename="a.wav", user_id=user.id, date=date)
+            for date in dates]
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in rows]
+
+
+def test_cursor_round_trips_and_rejects_garbage():
+    stamp = datetime(2024, 3, 1, 12, 30, 15, 123456)
+    assert history.decode_cursor(history.encode_cursor(stamp, 42)) == (stamp, 42)
+    for cursor in ("not-a-cursor", "bm9waXBl", history.encode_cursor(stamp, 42)[:-4] + "!!!!"):
+        with pytest.raises(HTTPException) as rejected:
+            history.decode_cursor(cursor)
+        assert rejected.value.status_code == 400
+
+
+def test_pages_cover_every_row_once_even_with_equal_dates(db):
+    user, other = _user(db), _user(db, "other")
+    base = datetime(2024, 1, 1)
+    # Runs of identical timestamps straddle the page boundaries
+    dates = [base] * 3 + [base + timedelta(hours=1)] * 4 + [base + timedelta(hours=2)] + [base - timedelta(days=1)] * 2
+    ids = _attempts(db, user, dates)
+    _attempts(db, other, [base] * 3)
+    expected = [i for _, i in sorted(zip(dates, ids), key=lambda pair: (pair[0], pair[1]), reverse=True)]
+
+    for limit in (1, 2, 3, 4, 20):
+        seen, cursor = [], None
+        while True:
+            page = history.history_page(db, user.id, limit, cursor)
+            assert len(page["items"]) <= limit
+            seen += [item["id"] for item in page["items"]]
+            cursor = page["next_cursor"]
+            if cursor is None: break
+        assert seen == expected
+
+
+def test_history_api_follows_next_cursor(db):
+    user = _user(db)
+    ids = _attempts(db, user, [datetime(2024, 1, 1)] * 5)
+    client = TestClient(main.app)
+    headers = {"Authorization": f"Bearer {auth.create_user_token(user)}"}
+
+    first = client.get("/api/me/history", params={"limit": 3}, headers=headers).json()
+    second = client.get("/api/me/history", params={"limit": 3, "cursor": first["next_cursor"]}, headers=headers).json()
+    assert [item["id"] for item in first["items"] + second["items"]] == sorted(ids, reverse=True)
+    assert second["next_cursor"] is None
+    assert client.get("/api/me/history", params={"cursor": "garbage"}, headers=headers).status_code == 400
+
+
+def _result(score, teacher_notes):
+    return {
+        "status": "success", "mode": "student", "lesson_id": None, "estimator": "pyin",
+        "notes": [{"start": 0.5, "duration": 0.25, "pitch": 64, "name": "E4"}],
+        "musicxml": "<score-partwise/>",
+        "feedback": {"score": score, "comments": [f"Scored {score}"], "detailed_breakdown": [], "graph_data": None},
+        "teacher_data": {"notes": teacher_notes, "musicxml": "<teacher/>"},
+    }
+
+
+def test_saved_attempts_round_trip_and_share_teacher_snapshots(db):
+    user = _user(db)
+    teacher_notes = [{"start": 0.0, "duration": 0.5, "pitch": 60, "name": "C4"}]
+    first, second = _result(70, teacher_notes), _result(90, teacher_notes)
+    other_lesson = _result(55, [{"start": 0.0, "duration": 1.0, "pitch": 67, "name": "G4"}])
+    rows = [history.save_attempt(db, user.id, "take.wav", result, "take.wav") for result in (first, second, other_lesson)]
+
+    for row, result in zip(rows, (first, second, other_lesson)):
+        assert row.analysis_data is None and row.analysis_blob is not None
+        assert history.load_analysis(db, row) == result
+        assert history.load_analysis(db, row, with_teacher=False) == {k: v for k, v in result.items() if k != "teacher_data"}
+    # Identical teacher data is stored once
+    assert rows[0].teacher_snapshot_hash == rows[1].teacher_snapshot_hash != rows[2].teacher_snapshot_hash
+    assert db.query(models.TeacherSnapshot).count() == 2
+
+
+def test_legacy_rows_read_as_before_and_compact_losslessly(db):
+    user = _user(db)
+    legacy = _result(80, [{"start": 0.0, "duration": 0.5, "pitch": 60, "name": "C4"}])
+    row = models.History(score=80, feedback_summary="Scored 80", audio_filename="old.wav", user_id=user.id,
+                         analysis_data=json.dumps(legacy))
+    unreadable = models.History(score=10, feedback_summary="?", audio_filename="bad.wav", user_id=user.id,
+                                analysis_data="{not json")
+    db.add_all([row, unreadable])
+    db.commit()
+
+    # Plain-text rows are served verbatim until compacted
+    assert history.analysis_json(db, row) == row.analysis_data.encode()
+    assert history.load_analysis(db, row) == legacy
+
+    assert history.compact_legacy_rows(db) == 1
+    db.expire_all()
+    assert row.analysis_data is None and row.teacher_snapshot_hash is not None
+    assert history.load_analysis(db, row) == legacy
+    assert unreadable.analysis_data == "{not json"
@@ -0,0 +1,94 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+from core import auth, jobs, models
+from core.ingest import pcm_path_for
+from routers import jobs as jobs_router
+
+
+def _user(db):
+    user = models.User(username="student", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def test_failed_job_removes_its_upload(db):
+    job = jobs.create_job(db, _user(db).id, ".wav")
+    pcm_path = pcm_path_for(job.audio_path)
+    for path in (job.audio_path, pcm_path):
+        with open(path, "wb") as f:
+            f.write(b"not audio")
+
+    jobs.run_job(job.id)
+
+    db.expire_all()
+    assert db.query(models.AnalysisJob).filter(models.AnalysisJob.id == job.id).one().status == "failed"
+    assert not os.path.exists(job.audio_path) and not os.path.exists(pcm_path)
+
+
+def test_event_stream_ends_when_the_job_disappears(db, monkeypatch):
+    user = _user(db)
+    job = jobs.create_job(db, user.id, ".wav")
+    monkeypatch.setattr(jobs_router, "_poll_status", lambda job_id: None)
+
+    client = TestClient(main.app)
+    response = client.get(f"/api/jobs/{job.id}/events",
+                          headers={"Authorization": f"Bearer {auth.create_user_token(user)}"})
+    assert response.status_code == 200
+    assert response.text.startswith("event: gone\n")
+
+
+def test_dispatcher_requeues_stale_jobs_periodically(monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs, "requeue_stale_jobs", lambda: calls.append(1))
+    monkeypatch.setattr(jobs, "JOB_REQUEUE_INTERVAL", 0.01)
+
+    async def run_briefly():
+        dispatcher = asyncio.create_task(jobs.dispatch_jobs(SimpleNamespace(workers=0), poll_interval=0.01))
+        await asyncio.sleep(0.2)
+        dispatcher.cancel()
+
+    asyncio.run(run_briefly())
+    assert len(calls) > 1
+
+
+def test_interrupted_uploads_expire_and_free_their_queue_slot(db, monkeypatch):
+    user_id = _user(db).id
+    stuck = jobs.create_job(db, user_id, ".wav")
+    fresh = jobs.create_job(db, user_id, ".wav")
+    stuck_id, fresh_id, stuck_path = stuck.id, fresh.id, stuck.audio_path
+    with open(stuck_path, "wb") as f:
+        f.write(b"half an upl")
+    db.query(models.AnalysisJob).filter(models.AnalysisJob.id == stuck_id).update(
+        {"updated_at": datetime.utcnow() - timedelta(seconds=jobs.JOB_STALE_SECONDS + 1)})
+    db.commit()
+
+    jobs.requeue_stale_jobs()
+
+    db.expire_all()
+    rows = {job.id: job for job in db.query(models.AnalysisJob).all()}
+    assert (rows[stuck_id].status, rows[stuck_id].error) == ("failed", "Upload was interrupted")
+    assert not os.path.exists(stuck_path)
+    assert (rows[fresh_id].status, rows[fresh_id].stage) == ("queued", "uploading")
+
+    # Only the upload still in flight counts against the limit now
+    monkeypatch.setattr(jobs, "JOB_QUEUE_LIMIT", 2)
+    jobs.create_job(db, user_id, ".wav")
+
+
+def test_submitted_job_is_queued(db):
+    user = _user(db)
+    response = TestClient(main.app).post(
+        "/api/jobs", files={"file": ("take.wav", b"RIFF0000WAVE", "audio/wav")},
+        headers={"Authorization": f"Bearer {auth.create_user_token(user)}"})
+
+    assert response.status_code == 202
+    assert (response.json()["status"], response.json()["stage"]) == ("queued", "queued")
+    job = db.query(models.AnalysisJob).filter(models.AnalysisJob.id == response.json()["id"]).one()
+    assert os.path.getsize(job.audio_path) == len(b"RIFF0000WAVE")
@@ -0,0 +1,71 @@
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from scipy.signal import resample_poly
+
+from core import auth, models
+from core.streaming import StreamResampler
+from routers import websocket
+
+
+def _client(db):
+    user = models.User(username="singer", hashed_password="x")
+    db.add(user)
+    db.commit()
+    app = FastAPI()
+    app.include_router(websocket.router)
+    return TestClient(app), auth.create_user_token(user)
+
+
+def test_rejected_control_frames_keep_the_session_usable(db):
+    client, token = _client(db)
+    with client.websocket_connect(f"/ws/live?token={token}") as ws:
+        for frame in ('{"format": "s24"}', "not json", '{"sample_rate": 0}', '{"sample_rate": "fast"}', "[1]"):
+            ws.send_text(frame)
+            assert ws.receive_json()["type"] == "error"
+        ws.send_bytes(b"\x00\x01\x02")
+        assert ws.receive_json()["type"] == "error"
+
+        # Still configured as f32 at 16 kHz
+        ws.send_bytes(np.zeros(4096, dtype="<f4").tobytes())
+        assert ws.receive_json()["type"] == "pitch"
+        ws.send_text('{"type": "stop"}')
+        assert ws.receive_json()["type"] == "summary"
+
+
+def test_oversized_frames_and_late_reconfiguration_are_rejected(db):
+    client, token = _client(db)
+    with client.websocket_connect(f"/ws/live?token={token}") as ws:
+        ws.send_text('{"sample_rate": 8000, "format": "s16"}')
+        assert ws.receive_json() == {"type": "ready", "sample_rate": 8000, "format": "s16"}
+        too_long = int(8000 * websocket.MAX_FRAME_SECONDS) + 1
+        ws.send_bytes(np.zeros(too_long, dtype="<i2").tobytes())
+        assert ws.receive_json()["type"] == "error"
+
+        ws.send_bytes(np.zeros(2048, dtype="<i2").tobytes())
+        assert ws.receive_json()["type"] == "pitch"
+        # Mid-take the stream keeps its configuration
+        ws.send_text('{"sample_rate": 44100}')
+        assert ws.receive_json()["type"] == "error"
+        ws.send_bytes(np.zeros(2048, dtype="<i2").tobytes())
+        assert ws.receive_json()["type"] == "pitch"
+        ws.send_text('{"type": "stop"}')
+        assert ws.receive_json()["type"] == "summary"
+
+
+def test_stream_resampler_matches_whole_signal_resampling():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal(44100 * 2).astype(np.float32)
+    up, down = 160, 441   # 44.1 kHz -> 16 kHz
+    resampler = StreamResampler(up, down)
+    out, i = [], 0
+    while i < len(x):
+        size = int(rng.integers(1, 5000))
+        out.append(resampler.process(x[i:i + size]))
+        i += size
+    y = np.concatenate(out)
+
+    expected = resample_poly(x, up, down)
+    # Everything but the final half-filter is emitted, with no drift or seams
+    assert len(expected) - len(y) <= resampler._half // down + 1
+    np.testing.assert_allclose(y, expected[:len(y)], atol=1e-5)
@@ -0,0 +1,72 @@
+import datetime
+import random
+import re
+
+import pytest
+
+from core import music_gen
+
+MELODY = [{"name": "C4", "start": 0.0, "duration": 0.5}, {"name": "E4", "start": 0.5, "duration": 0.25}]
+
+
+def _encoding_date(xml):
+    return xml.split("<encoding-date>", 1)[1].split("</encoding-date>", 1)[0]
+
+
+def test_cached_documents_carry_the_current_date(monkeypatch):
+    class Tomorrow(datetime.date):
+        @classmethod
+        def today(cls):
+            return datetime.date(2031, 5, 6)
+
+    for time_signature in ("4/4", "3/4"):  # native writer and music21 fallback
+        music_gen.generate_musicxml(MELODY, time_signature=time_signature)
+        monkeypatch.setattr(music_gen, "date", Tomorrow)
+        assert _encoding_date(music_gen.generate_musicxml(MELODY, time_signature=time_signature)) == "2031-05-06"
+        monkeypatch.undo()
+
+
+# --- Native writer vs music21 makeNotation() ---
+
+def _normalized(xml):
+    """Drops what legitimately differs: music21's software tag, comments and random part ids, and the date."""
+    xml = re.sub(r"\s*<!--.*?-->", "", xml)
+    xml = re.sub(r"\s*<software>[^<]*</software>", "", xml)
+    xml = re.sub(r'id="P[0-9a-f]+"', 'id="P1"', xml)
+    return music_gen._ENCODING_DATE.sub("", xml)
+
+
+PARITY_MELODIES = {
+    "ties_across_barlines": (("C4", 3.0), ("D4", 2.0), ("E4", 5.0), ("F4", 0.75), ("G4", 1.5), ("A4", 4.0)),
+    "accidentals_within_measure": (("C#4", 1.0), ("C4", 1.0), ("C#4", 0.5), ("C#4", 0.5), ("D-4", 1.0), ("D4", 2.0),
+                                   ("C#4", 2.0), ("F#4", 0.25), ("F4", 0.25), ("F#4", 0.5), ("B-3", 3.0)),
+    "accidental_tied_over_barline": (("rest", 3.0), ("G#4", 2.0), ("G#4", 1.0), ("G4", 1.0)),
+    "beams_and_rests": (("E5", 0.25), ("F5", 0.25), ("G5", 0.5), ("rest", 0.25), ("A5", 0.75), ("B5", 0.25),
+                        ("C6", 0.25), ("D6", 0.5), ("rest", 0.5), ("E5", 1.5), ("D5", 0.5)),
+    "bass_clef": (("C2", 1.0), ("E2", 0.5), ("G2", 0.5), ("C3", 2.0), ("rest", 1.0), ("A1", 3.0)),
+    "treble_8va": (("C6", 1.0), ("E6", 0.5), ("G6", 0.5), ("C7", 2.0)),
+    "short_rest_in_last_measure": (("A4", 4.0), ("F#4", 3.0), ("rest", 1.25)),
+}
+_NAMES = ["C4", "C#4", "D4", "E-4", "E4", "F4", "F#4", "G4", "G#4", "A4", "B-4", "B4", "C5", "rest"]
+_rng = random.Random(11)
+for _k in range(20):
+    PARITY_MELODIES[f"random_{_k}"] = tuple(
+        (_rng.choice(_NAMES), _rng.choice([0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0]))
+        for _ in range(_rng.randint(3, 30)))
+
+
+@pytest.mark.parametrize("name", sorted(PARITY_MELODIES))
+def test_native_writer_matches_music21(name):
+    events = PARITY_MELODIES[name]
+    assert music_gen._native_supported(events, "4/4")
+    native = music_gen._write_musicxml(events, 120)
+    reference = music_gen._render_with_music21(events, 120, "4/4")
+    assert _normalized(native) == _normalized(reference)
+
+
+def test_tuplets_go_through_music21():
+    events = (("C4", 1 / 3), ("D4", 1 / 3), ("E4", 1 / 3), ("F4", 3.0))
+    assert not music_gen._native_supported(events, "4/4")
+    xml = music_gen._render_musicxml(events, 120, "4/4")
+    assert "<time-modification>" in xml
+    assert _normalized(xml) == _normalized(music_gen._render_with_music21(events, 120, "4/4"))
@@ -0,0 +1,88 @@
+import json
+import os
+
+import soundfile as sf
+
+from benchmarks.corpus import CorpusCase, synthesize
+from core import models, lessons, pipeline, reference_cache
+from core.analysis import TARGET_SR, PyinEstimator
+
+
+def _write_wav(path, case, expressive):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    y, _ = synthesize(case, expressive=expressive)
+    sf.write(path, y, TARGET_SR, subtype="PCM_16")
+    return path
+
+
+def _user(db):
+    user = models.User(username="teacher", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _count_pyin(monkeypatch):
+    calls = []
+    estimate = PyinEstimator.estimate
+
+    def counting(self, y, sr, hop_length):
+        calls.append(len(y))
+        return estimate(self, y, sr, hop_length)
+
+    monkeypatch.setattr(PyinEstimator, "estimate", counting)
+    return calls
+
+
+def _taught_lesson(db, case):
+    lesson = lessons.create_lesson(db, _user(db), "Arpeggio")
+    teacher_path = _write_wav(lessons.new_reference_path(lesson.id, ".wav"), case, expressive=False)
+    reference = pipeline.run_teach(teacher_path)
+    lessons.set_reference(db, lesson, teacher_path, reference["content_hash"], reference["notes"])
+    return lesson
+
+
+def test_each_recording_is_pitch_tracked_once(db, tmp_path, monkeypatch):
+    case = CorpusCase("single_pass", 6, 110, seed=101)
+    calls = _count_pyin(monkeypatch)
+
+    lesson = _taught_lesson(db, case)
+    assert len(calls) == 1
+
+    student_path = _write_wav(str(tmp_path / "student.wav"), case, expressive=True)
+    result = pipeline.run_analysis(student_path, lesson.id)
+
+    # Transcription, scoring and graphs all read the one student analysis;
+    # the teacher side comes from the reference built at teach time
+    assert len(calls) == 2
+    assert result["notes"] and result["feedback"]["graph_data"]
+
+
+def test_reference_cache_hits_until_the_lesson_moves_on(db, monkeypatch):
+    case = CorpusCase("cached_reference", 6, 100, seed=102)
+    calls = _count_pyin(monkeypatch)
+    lesson = _taught_lesson(db, case)
+    old_hash = lesson.content_hash
+    npz_path, json_path = reference_cache._entry_paths(old_hash)
+    assert len(calls) == 1 and os.path.exists(npz_path) and os.path.exists(json_path)
+
+    # Memory hit, then a disk hit in a "fresh worker": neither re-runs pyin
+    assert reference_cache.build_reference(lesson.audio_path).notes == json.loads(lesson.notes)
+    reference_cache._memory.clear()
+    assert reference_cache.build_reference(lesson.audio_path).content_hash == old_hash
+    assert len(calls) == 1
+
+    # A second lesson sharing the recording keeps the entry alive
+    twin = lessons.create_lesson(db, lesson.owner, "Twin")
+    lessons.set_reference(db, twin, lesson.audio_path, old_hash, json.loads(lesson.notes))
+    retake = CorpusCase("cached_reference_retake", 6, 100, seed=103)
+    new_path = _write_wav(lessons.new_reference_path(lesson.id, ".wav"), retake, expressive=False)
+    reference = pipeline.run_teach(new_path)
+    lessons.set_reference(db, lesson, new_path, reference["content_hash"], reference["notes"])
+    assert os.path.exists(npz_path)
+
+    # Once nothing points at the old recording, its artifacts are dropped
+    lessons.set_reference(db, twin, new_path, reference["content_hash"], reference["notes"])
+    assert not os.path.exists(npz_path) and not os.path.exists(json_path)
+    assert reference_cache._cache_key(old_hash) not in reference_cache._memory
+    assert len(calls) == 2
@@ -0,0 +1,68 @@
+import io
+import os
+import zipfile
+
+from fastapi.testclient import TestClient
+
+import main
+from core import auth, history, models, reports
+from core.executor import AnalysisExecutor
+from core.feedback import empty_graph_data
+
+
+def _user(db, username):
+    user = models.User(username=username, hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def _attempt(db, user, **fields):
+    row = models.History(score=80, feedback_summary="Nice", audio_filename="missing.wav", user_id=user.id, **fields)
+    db.add(row)
+    db.commit()
+    return row.id
+
+
+def _cached_report(history_id, content=b"%PDF-cached"):
+    os.makedirs(reports.REPORT_DIR, exist_ok=True)
+    with open(reports.report_cache_path(history_id), "wb") as f:
+        f.write(content)
+
+
+def test_report_is_served_from_cache_and_only_to_its_owner(db):
+    owner, other = _user(db, "owner"), _user(db, "other")
+    attempt_id = _attempt(db, owner)
+    _cached_report(attempt_id)
+    client = TestClient(main.app)
+
+    for path in (f"/api/report/{attempt_id}", "/api/report"):
+        response = client.get(path, headers={"Authorization": f"Bearer {auth.create_user_token(owner)}"})
+        assert response.status_code == 200 and response.content == b"%PDF-cached"
+    for path in (f"/api/report/{attempt_id}", "/api/report"):
+        response = client.get(path, headers={"Authorization": f"Bearer {auth.create_user_token(other)}"})
+        assert response.status_code == 404
+
+
+def test_export_zips_cached_and_freshly_rendered_reports(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(reports, "REPORT_DIR", str(tmp_path / "reports"))
+    monkeypatch.setattr(reports, "EXPORT_DIR", str(tmp_path / "exports"))
+    monkeypatch.setattr(main, "executor", AnalysisExecutor("thread", workers=2))
+    user = _user(db, "student")
+    result = {"status": "success", "notes": [], "musicxml": "",
+              "feedback": {"score": 75, "comments": ["Good"], "detailed_breakdown": [], "graph_data": empty_graph_data()}}
+    ids = [history.save_attempt(db, user.id, "take.wav", result, f"{i}.wav").id for i in range(3)]
+    _cached_report(ids[0])
+
+    response = TestClient(main.app).get("/api/reports/export", headers={"Authorization": f"Bearer {auth.create_user_token(user)}"})
+    main.executor.shutdown()
+
+    assert response.status_code == 200 and response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        entries = {name.rsplit("_", 1)[1]: archive.read(name) for name in archive.namelist()}
+    assert sorted(entries) == sorted(f"{i}.pdf" for i in ids)
+    assert entries[f"{ids[0]}.pdf"] == b"%PDF-cached"
+    assert all(entries[f"{i}.pdf"].startswith(b"%PDF-") for i in ids[1:])
+    # Rendered reports are cached for next time; the zip itself is not kept
+    assert reports.missing_reports(ids) == []
+    assert os.listdir(reports.EXPORT_DIR) == []
@@ -0,0 +1,66 @@
+import os
+
+import soundfile as sf
+
+from benchmarks.corpus import CorpusCase, synthesize
+from core import models, lessons, history, pipeline, rescore
+from core.analysis import TARGET_SR
+
+MELODY = CorpusCase("rescore", 12, 110, vibrato_cents=20, snr_db=30, seed=7)
+
+
+def _write_wav(path, expressive):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    y, _ = synthesize(MELODY, expressive=expressive)
+    sf.write(path, y, TARGET_SR, subtype="PCM_16")
+    return path
+
+
+def _legacy_attempt(db, user):
+    """A History row as stored before lessons existed: real score, no lesson_id."""
+    filename = f"{user.id}_legacy.wav"
+    _write_wav(os.path.join(history.HISTORY_DIR, filename), expressive=True)
+    row = models.History(score=87, feedback_summary="Great job!", audio_filename=filename,
+                         user_id=user.id, lesson_id=None)
+    db.add(row)
+    db.commit()
+    return row.id
+
+
+def _user(db):
+    user = models.User(username="student", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def test_rescore_resolves_lesson_for_legacy_rows(db, tmp_path):
+    user = _user(db)
+    lesson = lessons.create_lesson(db, user, "Scale")
+    teacher_path = _write_wav(lessons.new_reference_path(lesson.id, ".wav"), expressive=False)
+    reference = pipeline.run_teach(teacher_path)
+    lessons.set_reference(db, lesson, teacher_path, reference["content_hash"], reference["notes"])
+    row_id = _legacy_attempt(db, user)
+
+    updated, failed = rescore.rescore_history(1, checkpoint_path=str(tmp_path / "checkpoint.json"))
+
+    assert (updated, failed) == (1, 0)
+    db.expire_all()
+    row = db.query(models.History).filter(models.History.id == row_id).one()
+    assert row.lesson_id == lesson.id
+    assert row.score > 0
+    assert history.load_analysis(db, row)["feedback"]["comments"] != ["No data."]
+
+
+def test_rescore_without_any_lesson_keeps_stored_result(db, tmp_path):
+    user = _user(db)
+    row_id = _legacy_attempt(db, user)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    updated, failed = rescore.rescore_history(1, checkpoint_path=checkpoint_path)
+
+    assert (updated, failed) == (0, 1)
+    db.expire_all()
+    row = db.query(models.History).filter(models.History.id == row_id).one()
+    assert (row.score, row.feedback_summary, row.lesson_id) == (87, "Great job!", None)
+    assert str(row_id) in rescore.load_checkpoint(checkpoint_path)["failed"]
@@ -0,0 +1,68 @@
+import librosa
+import numpy as np
+import pytest
+
+from core import transcription
+from core.analysis import AudioAnalysis, HOP_LENGTH, TARGET_SR
+from core.transcription import MIN_NOTE_DURATION, make_note, notes_to_dicts
+
+
+def _loop_onsets(analysis):
+    """The per-onset loop the vectorized segmentation replaced."""
+    sr, hop_length, midi_pitch = analysis.sr, analysis.hop_length, analysis.midi_pitch
+    onsets = librosa.onset.onset_detect(onset_envelope=analysis.onset_env, sr=sr, hop_length=hop_length, backtrack=True)
+    onset_times = librosa.frames_to_time(onsets, sr=sr, hop_length=hop_length)
+    segments = []
+    for j in range(len(onset_times) - 1):
+        t_start, t_end = onset_times[j], onset_times[j + 1]
+        idx_start, idx_end = int(t_start * sr / hop_length), int(t_end * sr / hop_length)
+        if idx_end > idx_start and idx_end < len(midi_pitch):
+            voiced = midi_pitch[idx_start:idx_end][midi_pitch[idx_start:idx_end] > 0]
+            if len(voiced) > 0:
+                segments.append(make_note(t_start, t_end - t_start, voiced))
+    return segments
+
+
+def _loop_sustained(analysis):
+    """The per-run loop of the sustained fallback."""
+    midi_pitch = analysis.midi_pitch
+    difs = np.diff(np.hstack(([0], (midi_pitch > 0).astype(int), [0])))
+    starts, ends = np.where(difs == 1)[0], np.where(difs == -1)[0]
+    times = librosa.times_like(analysis.f0, sr=analysis.sr, hop_length=analysis.hop_length)
+    segments = []
+    for s, e in zip(starts, ends):
+        end_idx, start_idx = min(e, len(times) - 1), min(s, len(times) - 1)
+        dur = times[end_idx] - times[start_idx]
+        if dur > MIN_NOTE_DURATION:
+            segments.append(make_note(times[start_idx], dur, midi_pitch[s:e]))
+    return segments
+
+
+def _random_analysis(seed, n_frames=600):
+    rng = np.random.default_rng(seed)
+    # Voiced runs of random length with a wobbling pitch, separated by gaps
+    midi_pitch = np.zeros(n_frames)
+    i = 0
+    while i < n_frames:
+        run, gap = int(rng.integers(1, 40)), int(rng.integers(0, 10))
+        midi_pitch[i:i + run] = rng.uniform(50, 80) + rng.normal(0, 0.4, len(midi_pitch[i:i + run]))
+        i += run + gap
+    onset_env = rng.exponential(1.0, n_frames)
+    onset_env[rng.choice(n_frames, n_frames // 15, replace=False)] += rng.uniform(5, 20, n_frames // 15)
+
+    analysis = AudioAnalysis.__new__(AudioAnalysis)
+    analysis.sr, analysis.hop_length = TARGET_SR, HOP_LENGTH
+    analysis.midi_pitch = midi_pitch
+    analysis.f0 = np.where(midi_pitch > 0, librosa.midi_to_hz(np.maximum(midi_pitch, 1)), 0.0)
+    analysis.onset_env = onset_env
+    return analysis
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_vectorized_segmentation_matches_the_loop(seed):
+    analysis = _random_analysis(seed)
+
+    by_onsets = notes_to_dicts(transcription._segment_by_onsets(analysis))
+    assert by_onsets and by_onsets == _loop_onsets(analysis)
+    sustained = notes_to_dicts(transcription._segment_sustained(analysis))
+    assert sustained and sustained == _loop_sustained(analysis)
@@ -0,0 +1,71 @@
+import os
+
+from fastapi.testclient import TestClient
+
+import main
+from core import auth, lessons, models
+from core.executor import AnalysisExecutor
+
+
+def _client(db):
+    user = models.User(username="student", hashed_password="x")
+    db.add(user)
+    db.commit()
+    client = TestClient(main.app, raise_server_exceptions=False)
+    return client, {"Authorization": f"Bearer {auth.create_user_token(user)}"}
+
+
+def _interrupted_ingest(written):
+    async def ingest(upload, sink_paths, pcm_path=None):
+        # Part of the upload reached disk before the connection dropped
+        for path in [*sink_paths, pcm_path]:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"partial")
+            written.append(path)
+        raise ConnectionResetError("client went away")
+    return ingest
+
+
+def test_interrupted_attempt_upload_leaves_no_files(db, monkeypatch):
+    client, headers = _client(db)
+    written = []
+    monkeypatch.setattr(main, "ingest_upload", _interrupted_ingest(written))
+
+    response = client.post("/api/analyze", files={"file": ("take.wav", b"RIFF", "audio/wav")}, headers=headers)
+
+    assert response.status_code == 500
+    assert len(written) == 2 and not any(os.path.exists(path) for path in written)
+    assert db.query(models.History).count() == 0
+
+
+def _lesson_files():
+    return os.listdir(lessons.LESSON_DIR) if os.path.isdir(lessons.LESSON_DIR) else []
+
+
+def test_rejected_teach_upload_removes_the_new_lesson_and_its_files(db, monkeypatch):
+    client, headers = _client(db)
+    saturated = AnalysisExecutor("thread", workers=1, queue_limit=1)
+    saturated._pending = 1
+    monkeypatch.setattr(main, "executor", saturated)
+    before = _lesson_files()
+
+    response = client.post("/api/teach", files={"file": ("scale.wav", b"RIFF", "audio/wav")}, headers=headers)
+
+    assert response.status_code == 503
+    assert db.query(models.Lesson).count() == 0
+    assert _lesson_files() == before
+
+
+def test_interrupted_reference_upload_keeps_an_existing_lesson(db, monkeypatch):
+    client, headers = _client(db)
+    lesson = lessons.create_lesson(db, db.query(models.User).one(), "Scale")
+    written = []
+    monkeypatch.setattr(main, "ingest_upload", _interrupted_ingest(written))
+
+    response = client.post("/api/teach", data={"lesson_id": lesson.id},
+                           files={"file": ("scale.wav", b"RIFF", "audio/wav")}, headers=headers)
+
+    assert response.status_code == 500
+    assert written and not any(os.path.exists(path) for path in written)
+    assert db.query(models.Lesson).count() == 1
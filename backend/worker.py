@@ -0,0 +1,38 @@
+"""
+Standalone analysis worker.
+
+Run next to the API (with JOB_RUNNER=external on the API side) to process
+/api/jobs submissions in a separate local process:
+
+    python worker.py --workers 4
+"""
+import argparse
+import asyncio
+
+import config
+from core import models, database, jobs
+from core.executor import AnalysisExecutor, ANALYSIS_WORKERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued analysis jobs")
+    parser.add_argument("--workers", type=int, default=ANALYSIS_WORKERS, help="analysis processes to run")
+    parser.add_argument("--poll-interval", type=float, default=jobs.JOB_POLL_INTERVAL, help="seconds between queue checks")
+    args = parser.parse_args()
+
+    if config.DB_MIGRATE_ON_STARTUP:
+        models.sync_schema(database.engine)
+
+    executor = AnalysisExecutor("process", workers=args.workers, queue_limit=args.workers)
+    executor.start()
+    print(f"👷 Worker polling for jobs every {args.poll_interval}s")
+    try:
+        asyncio.run(jobs.dispatch_jobs(executor, poll_interval=args.poll_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+// Writes .br and .gz siblings next to every compressible file in dist/, so the
+// backend can serve them as-is instead of compressing on each request.
+import { readdirSync, readFileSync, statSync, writeFileSync } from 'node:fs';
+import { extname, join } from 'node:path';
+import { brotliCompressSync, gzipSync, constants } from 'node:zlib';
+
+const DIST = new URL('../dist/', import.meta.url).pathname;
+const COMPRESSIBLE = new Set(['.html', '.js', '.mjs', '.css', '.json', '.svg', '.txt', '.xml', '.wasm', '.map']);
+const MIN_SIZE = 1024; // smaller files gain nothing worth an extra request header
+
+const walk = (dir) => readdirSync(dir).flatMap((name) => {
+    const path = join(dir, name);
+    return statSync(path).isDirectory() ? walk(path) : [path];
+});
+
+let written = 0;
+for (const path of walk(DIST)) {
+    if (!COMPRESSIBLE.has(extname(path))) continue;
+    const data = readFileSync(path);
+    if (data.length < MIN_SIZE) continue;
+
+    const variants = {
+        '.br': brotliCompressSync(data, { params: { [constants.BROTLI_PARAM_QUALITY]: 11, [constants.BROTLI_PARAM_SIZE_HINT]: data.length } }),
+        '.gz': gzipSync(data, { level: 9 }),
+    };
+    for (const [suffix, compressed] of Object.entries(variants)) {
+        // Keep a variant only when it actually saves bytes
+        if (compressed.length < data.length) {
+            writeFileSync(path + suffix, compressed);
+            written += 1;
+        }
+    }
+}
+console.log(`precompress: wrote ${written} files`);
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useRef, useMemo } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Canvas } from '@react-three/fiber';
 import { useNavigate } from 'react-router-dom';
@@ -37,6 +37,26 @@ const PianoRollBar = (props) => {
     return <rect x={cx} y={cy - 5} width={Math.max(barWidth, 5)} height={10} fill={baseColor} rx={3} opacity={opacity} />;
 };
 
+// --- GRAPH DATA ---
+// The API sends binned columns; recharts wants one object per point.
+// Attempts saved before that still carry the old row arrays.
+const toChartData = (graph) => {
+    if (!graph) return { pitch: [], rhythm: [], pianoRoll: [] };
+    if (!graph.seconds) return { pitch: graph.pitch_data || [], rhythm: graph.rhythm_data || [], pianoRoll: graph.piano_roll || [] };
+
+    const { seconds, pitch, rms, piano_roll } = graph;
+    return {
+        pitch: seconds.map((t, i) => ({ seconds: t, teacher: pitch.teacher.mean[i], student: pitch.student.mean[i] })),
+        // The envelope shows each bin's peak so short accents stay visible
+        rhythm: seconds.map((t, i) => {
+            const teacher = rms.teacher.max[i] ?? 0, student = rms.student.max[i] ?? 0;
+            return { seconds: t, teacher_top: teacher, teacher_bottom: -teacher, student_top: student, student_bottom: -student };
+        }),
+        pianoRoll: ['teacher', 'student'].flatMap((type) =>
+            piano_roll[type].start.map((x, i) => ({ x, y: piano_roll[type].pitch[i], duration: piano_roll[type].duration[i], type }))),
+    };
+};
+
 // --- AUDIO PLAYER COMPONENT ---
 const AudioPlayerButton = React.forwardRef(({ audioUrl, label, colorClass = "text-white" }, ref) => {
     const [playing, setPlaying] = useState(false);
@@ -103,7 +123,9 @@ const Dashboard = () => {
     // Profile & History State
     const [isProfileOpen, setIsProfileOpen] = useState(false);
     const [history, setHistory] = useState([]);
+    const [historyCursor, setHistoryCursor] = useState(null);
     const [isDownloading, setIsDownloading] = useState(false);
+    const [heatmapURL, setHeatmapURL] = useState(null);
 
     // Refs for Audio Sync
     const teacherAudioRef = useRef(null);
@@ -164,26 +186,35 @@ const Dashboard = () => {
         if (studentAudioRef.current) studentAudioRef.current.pause();
     };
 
-    const fetchHistory = async () => {
+    const fetchHistory = async (cursor = null) => {
         const token = localStorage.getItem('musicTutorToken');
         if (!token) return;
         try {
-            const response = await fetch(getApiUrl('/api/me/history'), {
+            const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+            const response = await fetch(getApiUrl(`/api/me/history${query}`), {
                 headers: { 'Authorization': `Bearer ${token}` }
             });
             if (response.ok) {
                 const data = await response.json();
-                setHistory(data);
+                setHistory(prev => cursor ? [...prev, ...data.items] : data.items);
+                setHistoryCursor(data.next_cursor);
             } else if (response.status === 401) handleLogout();
         } catch (e) { console.error("History fetch error:", e); }
     };
 
     useEffect(() => { fetchHistory(); }, []);
 
-    const loadHistoryItem = (item) => {
+    const loadHistoryItem = async (item) => {
+        const token = localStorage.getItem('musicTutorToken');
         try {
-            const savedData = JSON.parse(item.analysis_data);
-            setStudentData(savedData);
+            // The list only carries summaries; the full analysis is fetched per attempt
+            const response = await fetch(getApiUrl(`/api/me/history/${item.id}`), {
+                headers: { 'Authorization': `Bearer ${token}` }
+            });
+            if (response.status === 401) return handleLogout();
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const savedData = await response.json();
+            setStudentData({ ...savedData, history_id: item.id });
             if (savedData.teacher_data) {
                 setTeacherData(savedData.teacher_data);
             } else {
@@ -198,6 +229,29 @@ const Dashboard = () => {
         }
     };
 
+    const chartData = useMemo(() => toChartData(studentData?.feedback?.graph_data), [studentData]);
+
+    // The heatmap is rendered on demand by the API (older attempts embed it)
+    useEffect(() => {
+        const graph = studentData?.feedback?.graph_data;
+        setHeatmapURL(null);
+        if (graph?.heatmap) return setHeatmapURL(`data:image/png;base64,${graph.heatmap}`);
+        if (!studentData?.history_id) return;
+
+        let objectURL = null, cancelled = false;
+        fetch(getApiUrl(`/api/me/history/${studentData.history_id}/heatmap`), {
+            headers: { 'Authorization': `Bearer ${localStorage.getItem('musicTutorToken')}` }
+        })
+            .then((response) => (response.ok ? response.blob() : null))
+            .then((blob) => {
+                if (!blob || cancelled) return;
+                objectURL = URL.createObjectURL(blob);
+                setHeatmapURL(objectURL);
+            })
+            .catch((e) => console.error("Heatmap fetch error:", e));
+        return () => { cancelled = true; if (objectURL) URL.revokeObjectURL(objectURL); };
+    }, [studentData]);
+
     useEffect(() => {
         if (audioBlob) {
             const url = URL.createObjectURL(audioBlob);
@@ -291,11 +345,11 @@ const Dashboard = () => {
         }
     };
 
-    const handleDownloadReport = async () => {
+    const downloadFile = async (path, fileName) => {
         setIsDownloading(true);
         const token = localStorage.getItem('musicTutorToken');
         try {
-            const response = await fetch(getApiUrl('/api/report'), {
+            const response = await fetch(getApiUrl(path), {
                 headers: token ? { 'Authorization': `Bearer ${token}` } : {}
             });
             if (response.ok) {
@@ -303,7 +357,7 @@ const Dashboard = () => {
                 const url = window.URL.createObjectURL(blob);
                 const a = document.createElement('a');
                 a.href = url;
-                a.download = "MusicTutor_Report.pdf";
+                a.download = fileName;
                 document.body.appendChild(a);
                 a.click();
                 a.remove();
@@ -316,6 +370,9 @@ const Dashboard = () => {
         setIsDownloading(false);
     };
 
+    const handleDownloadReport = () => downloadFile('/api/report', "MusicTutor_Report.pdf");
+    const handleExportReports = () => downloadFile('/api/reports/export', "MusicTutor_Reports.zip");
+
     const handleLogout = () => { localStorage.removeItem('musicTutorToken'); navigate('/'); };
     const resetStudentAttempt = () => { setStudentData(null); setStudentAudioURL(null); setStatus('idle'); };
     const switchMode = (newMode) => { setMode(newMode); setStatus('idle'); };
@@ -429,8 +486,14 @@ const Dashboard = () => {
                                     <div className={`px-2 py-1 rounded-md text-xs font-bold bg-white/5 ${h.score >= 80 ? 'text-neon-green' : h.score >= 50 ? 'text-neon-yellow' : 'text-neon-pink'}`}>{h.score}%</div>
                                 </button>
                             )) : <div className="p-4 text-center text-xs text-slate-500">No recordings yet.</div>}
+                            {historyCursor && (
+                                <button onClick={() => fetchHistory(historyCursor)} className="w-full p-2 text-center text-[10px] font-bold uppercase tracking-widest text-slate-500 hover:text-white transition-colors">Load more</button>
+                            )}
                         </div>
-                        <div className="p-2 border-t border-white/10 bg-black/20">
+                        <div className="p-2 border-t border-white/10 bg-black/20 space-y-1">
+                            {history.length > 0 && (
+                                <button onClick={handleExportReports} disabled={isDownloading} className="w-full flex items-center justify-center gap-2 text-xs font-bold text-slate-300 hover:text-white hover:bg-white/5 py-2 rounded-lg transition-colors"><Download className="w-3 h-3" /> {isDownloading ? 'Preparing...' : 'Export All Reports'}</button>
+                            )}
                             <button onClick={handleLogout} className="w-full flex items-center justify-center gap-2 text-xs font-bold text-red-400 hover:text-red-300 hover:bg-red-500/10 py-2 rounded-lg transition-colors"><LogOut className="w-3 h-3" /> Log Out</button>
                         </div>
                     </motion.div>
@@ -542,10 +605,10 @@ const Dashboard = () => {
                                             </div>
                                         </GlassCard>
                                         <div className="lg:col-span-2 space-y-6">
-                                            {studentData.feedback.graph_data?.heatmap && (
+                                            {heatmapURL && (
                                                 <div className="bg-white/90 backdrop-blur-md rounded-2xl p-4 shadow-xl text-black">
                                                     <h4 className="text-xs font-bold uppercase tracking-widest text-slate-500 mb-2">Tonal Harmony (Heatmap)</h4>
-                                                    <img src={`data:image/png;base64,${studentData.feedback.graph_data.heatmap}`} alt="Heatmap" className="w-full h-32 object-cover rounded-lg" />
+                                                    <img src={heatmapURL} alt="Heatmap" className="w-full h-32 object-cover rounded-lg" />
                                                 </div>
                                             )}
                                             <div className="bg-white/90 backdrop-blur-md rounded-2xl p-4 shadow-xl text-black h-[250px] relative group">
@@ -557,7 +620,7 @@ const Dashboard = () => {
                                                     </button>
                                                 </div>
                                                 <ResponsiveContainer width="100%" height="85%">
-                                                    <LineChart data={studentData.feedback.graph_data?.pitch_data || []} onMouseEnter={handleGraphMouseEnter} onMouseMove={handleGraphMouseMove} onMouseLeave={handleGraphMouseLeave}>
+                                                    <LineChart data={chartData.pitch} onMouseEnter={handleGraphMouseEnter} onMouseMove={handleGraphMouseMove} onMouseLeave={handleGraphMouseLeave}>
                                                         <CartesianGrid strokeDasharray="3 3" stroke="#e0e0e0" />
                                                         <XAxis dataKey="seconds" label={{ value: 'Time (s)', position: 'insideBottom', offset: -5, fontSize: 10 }} fontSize={10} tick={{ fill: '#666' }} />
                                                         <YAxis label={{ value: 'Pitch (Hz)', angle: -90, position: 'insideLeft', fontSize: 10 }} fontSize={10} tick={{ fill: '#666' }} />
@@ -571,7 +634,7 @@ const Dashboard = () => {
                                             <div className="bg-white/90 backdrop-blur-md rounded-2xl p-4 shadow-xl text-black h-[250px] relative">
                                                 <div className="flex justify-between mb-2"><h4 className="text-xs font-bold uppercase tracking-widest text-slate-500">Dynamics (Waveform)</h4><div className={`w-2 h-2 rounded-full ${isScrubbingEnabled ? 'bg-neon-green' : 'bg-slate-300'}`} /></div>
                                                 <ResponsiveContainer width="100%" height="85%">
-                                                    <AreaChart data={studentData.feedback.graph_data?.rhythm_data || []} onMouseEnter={handleGraphMouseEnter} onMouseMove={handleGraphMouseMove} onMouseLeave={handleGraphMouseLeave}>
+                                                    <AreaChart data={chartData.rhythm} onMouseEnter={handleGraphMouseEnter} onMouseMove={handleGraphMouseMove} onMouseLeave={handleGraphMouseLeave}>
                                                         <CartesianGrid strokeDasharray="3 3" vertical={false} stroke="#e0e0e0" />
                                                         <XAxis dataKey="seconds" label={{ value: 'Time (s)', position: 'insideBottom', offset: -5, fontSize: 10 }} fontSize={10} tick={{ fill: '#666' }} />
                                                         <YAxis label={{ value: 'Amplitude', angle: -90, position: 'insideLeft', fontSize: 10 }} fontSize={10} tick={{ fill: '#666' }} />
@@ -593,7 +656,7 @@ const Dashboard = () => {
                                                         <YAxis type="number" dataKey="y" name="Pitch" domain={['auto', 'auto']} label={{ value: 'Pitch (MIDI)', angle: -90, position: 'insideLeft', fontSize: 10 }} fontSize={10} tick={{ fill: '#666' }} />
                                                         <Tooltip cursor={{ strokeDasharray: '3 3' }} contentStyle={{ borderRadius: '8px' }} />
                                                         <Legend content={SmartLegend} />
-                                                        <Scatter name="Timing" data={studentData.feedback.graph_data?.piano_roll || []} shape={<PianoRollBar focusMode={focusMode} />} />
+                                                        <Scatter name="Timing" data={chartData.pianoRoll} shape={<PianoRollBar focusMode={focusMode} />} />
                                                     </ScatterChart>
                                                 </ResponsiveContainer>
                                             </div>